@@ -0,0 +1,68 @@
+"""Measure the CPU needed to convert common microphone formats.
+
+Converts noise in 2048 frame chunks, as PortAudio delivers it, from
+several capture formats to the detector's 16kHz mono 16 bit audio and
+reports the CPU time taken per second of audio.
+
+    python benchmarks/bench_convert.py --seconds 60
+"""
+import argparse
+import time
+
+import numpy as np
+
+from opsdroidaudio.convert import Converter
+
+FORMATS = [
+    # rate, channels, width
+    (16000, 2, 2),
+    (44100, 1, 2),
+    (48000, 1, 2),
+    (48000, 2, 2),
+    (48000, 4, 3),
+    (48000, 6, 4),
+]
+
+
+def noise(rate, channels, width, frames):
+    """Generate a chunk of noise in a capture format."""
+    samples = np.random.uniform(-0.5, 0.5, frames * channels)
+    if width == 4:
+        return samples.astype(np.float32).tobytes()
+    scaled = (samples * 2 ** (8 * width)).astype(np.int32)
+    if width == 3:
+        return scaled.astype("<i4").view(np.uint8).reshape(-1, 4)[
+            :, :3].tobytes()
+    return scaled.astype(np.int16).tobytes()
+
+
+def run(capture_format, seconds, chunk_frames=2048):
+    """Convert `seconds` of audio and return the CPU seconds it took."""
+    rate, channels, width = capture_format
+    converter = Converter(rate, channels, width, 16000)
+    chunk = noise(rate, channels, width, chunk_frames)
+    chunks = int(seconds * rate / chunk_frames)
+    start_time = time.process_time()
+    for _ in range(chunks):
+        converter.convert(chunk)
+    return time.process_time() - start_time
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60,
+                        help="seconds of audio to convert in each format")
+    args = parser.parse_args()
+
+    print("{:>7} {:>8} {:>5} {:>22}".format(
+        "rate", "channels", "bits", "CPU ms per audio second"))
+    for capture_format in FORMATS:
+        elapsed = run(capture_format, args.seconds)
+        rate, channels, width = capture_format
+        print("{:7d} {:8d} {:5d} {:22.3f}".format(
+            rate, channels, width * 8, 1000 * elapsed / args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""Measure end to end latency of opsdroid audio against a fake opsdroid.
+
+Scripted wav utterances, each starting with the hotword, are played into
+the detector in real time while a local stand-in for opsdroid replies to
+everything it is sent. The time taken by each stage of a conversation is
+recorded:
+
+  * wake_to_ding: hotword detected until the ding reaches the sound card.
+  * endpoint_to_transcript: end of speech detected until text is recognized.
+  * transcript_to_send: recognized text until it has been sent to opsdroid.
+  * response_to_first_audio: reply received until its speech starts playing.
+
+Percentiles for each stage, CPU time and peak memory are written as JSON so
+results can be compared between releases. The `bench` recognizer and
+generator simulate cloud services with a fixed latency, use `--recognizer`
+and `--generator` to measure real ones.
+
+    python benchmarks/bench_e2e.py --wav hey_opsdroid.wav --repeat 10
+"""
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+from opsdroidaudio import generators, output, recognizers
+from opsdroidaudio.__main__ import OpsdroidAudio
+from opsdroidaudio.const import __version__
+
+import fake_opsdroid
+
+
+RATE = 16000
+STAGES = collections.OrderedDict([
+    ("wake_to_ding", ("wake", "ding")),
+    ("endpoint_to_transcript", ("endpoint", "transcript")),
+    ("transcript_to_send", ("transcript", "sent")),
+    ("response_to_first_audio", ("response", "first_audio")),
+])
+
+
+class Timeline:
+    """Timestamps of the events in each conversation."""
+
+    def __init__(self):
+        """Initialise the timeline."""
+        self.lock = threading.Lock()
+        self.events = collections.defaultdict(list)
+        self.waiting = set()
+
+    def mark(self, name, then=None):
+        """Record an event, optionally waiting for the next sound played."""
+        with self.lock:
+            self.events[name].append(time.time())
+            if then is not None:
+                self.waiting.add(then)
+
+    def sound_played(self):
+        """Record the sounds which were being waited for."""
+        with self.lock:
+            now = time.time()
+            for name in self.waiting:
+                self.events[name].append(now)
+            self.waiting.clear()
+
+    def stage(self, start, end):
+        """Get the durations in milliseconds between pairs of events."""
+        return [1000 * (finish - begin) for begin, finish
+                in zip(self.events[start], self.events[end])]
+
+
+class TimingSink(output.NullSink):
+    """A sink which plays in real time and tells the timeline."""
+
+    def __init__(self, timeline):
+        """Initialise the sink."""
+        super().__init__(realtime=True)
+        self.timeline = timeline
+
+    def write(self, data, rate, channels, width):
+        """Record when audio is played."""
+        self.timeline.sound_played()
+        super().write(data, rate, channels, width)
+
+
+class BenchEngine(recognizers.Engine):
+    """A recognizer which takes a fixed time to return a fixed text."""
+
+    def recognize(self, data):
+        """Pretend to recognize the audio."""
+        time.sleep(self.config.get("latency", 0.3))
+        return self.config.get("text", "what time is it")
+
+
+def bench_synthesize(config, text, path):
+    """Pretend to synthesize speech, writing a tone as long as the text."""
+    time.sleep(config.get("latency", 0.2))
+    rate = 22050
+    times = np.arange(int(rate * 0.06 * len(text))) / float(rate)
+    wav = wave.open(path, 'wb')
+    wav.setnchannels(1)
+    wav.setsampwidth(2)
+    wav.setframerate(rate)
+    wav.writeframes((3000 * np.sin(2 * np.pi * 220 * times))
+                    .astype(np.int16).tobytes())
+    wav.close()
+    return True
+
+
+def build_script(paths, repeat, gap, path):
+    """Join the utterances into one wav file with silence between them."""
+    silence = b"\x00\x00" * int(RATE * gap)
+    utterances = []
+    for utterance_path in paths:
+        wav = wave.open(utterance_path, 'rb')
+        if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != \
+                (RATE, 1, 2):
+            sys.exit("{} must be 16kHz mono 16 bit".format(utterance_path))
+        utterances.append(wav.readframes(wav.getnframes()))
+        wav.close()
+    script = wave.open(path, 'wb')
+    script.setnchannels(1)
+    script.setsampwidth(2)
+    script.setframerate(RATE)
+    script.writeframes(b"\x00\x00" * (RATE // 2))
+    for _ in range(repeat):
+        for utterance in utterances:
+            script.writeframes(utterance + silence)
+    script.close()
+    return len(utterances) * repeat
+
+
+def instrument(app, timeline):
+    """Record the events of each conversation as they happen."""
+    room = app.rooms[0]
+    detected_callback = room.detected_callback
+    recording_callback = room.recording_callback
+    send_text = room.send_text
+    sent = room.channel.sent
+    on_message = room.channel.on_message
+
+    def detected(data, detector):
+        timeline.mark("wake", then="ding")
+        detected_callback(data, detector)
+
+    def recorded(recording, detector):
+        timeline.mark("endpoint")
+        recording_callback(recording, detector)
+
+    def send(text):
+        timeline.mark("transcript")
+        send_text(text)
+
+    def written(text, queued_time):
+        timeline.mark("sent")
+        sent(text, queued_time)
+
+    def message(text):
+        timeline.mark("response")
+        on_message(text)
+
+    room.detected_callback = detected
+    room.recording_callback = recorded
+    room.send_text = send
+    room.channel.sent = written
+    room.channel.on_message = message
+
+
+def summarize(durations):
+    """Get percentiles of a list of durations in milliseconds."""
+    if not durations:
+        return {"count": 0}
+    return {"count": len(durations),
+            "p50": float(np.percentile(durations, 50)),
+            "p95": float(np.percentile(durations, 95)),
+            "p99": float(np.percentile(durations, 99)),
+            "mean": float(np.mean(durations)),
+            "max": float(np.max(durations))}
+
+
+def run(config, timeline, expected, timeout):
+    """Run opsdroid audio until every utterance has been answered."""
+    class BenchAudio(OpsdroidAudio):
+        """Opsdroid audio with the benchmark config."""
+
+        def load_config_file(self):
+            """Use the benchmark config."""
+            return config
+
+    app = BenchAudio()
+    instrument(app, timeline)
+    thread = threading.Thread(target=app.start)
+    thread.start()
+    deadline = time.time() + timeout
+    room = app.rooms[0]
+    while room.speech_worker is None and time.time() < deadline:
+        time.sleep(0.01)
+    play = room.speech_worker.play
+
+    def play_speech(path):
+        with timeline.lock:
+            waiting = len(timeline.events["response"]) > \
+                len(timeline.events["first_audio"])
+        if waiting:
+            timeline.mark("first_audio")
+        play(path)
+
+    room.speech_worker.play = play_speech
+    while time.time() < deadline:
+        finished = room.detector is not None and \
+            room.detector.source_finished.is_set()
+        answered = len(timeline.events["first_audio"]) >= min(
+            expected, len(timeline.events["wake"]))
+        if finished and answered and room.speech_worker.queue_depth == 0:
+            break
+        time.sleep(0.1)
+    time.sleep(1)
+    app.stop()
+    thread.join()
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wav", nargs="+", required=True,
+                        help="16kHz mono 16 bit wav files of utterances "
+                        "which start with the hotword")
+    parser.add_argument("--hotword", default="opsdroid")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--gap", type=float, default=4,
+                        help="seconds of silence after each utterance")
+    parser.add_argument("--recognizer", default="bench")
+    parser.add_argument("--recognizer-latency", type=float, default=0.3)
+    parser.add_argument("--generator", default="bench")
+    parser.add_argument("--generator-latency", type=float, default=0.2)
+    parser.add_argument("--response-delay", type=float, default=0.05,
+                        help="seconds the fake opsdroid takes to reply")
+    parser.add_argument("--output", help="write the JSON results here")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    recognizers.ENGINES["bench"] = BenchEngine
+    generators.SYNTHESIZERS["bench"] = generators.Synthesizer(
+        bench_synthesize, ".wav")
+    timeline = Timeline()
+    output.SINKS["bench"] = lambda: TimingSink(timeline)
+
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=fake_opsdroid.serve,
+        args=(0, "You said {}.", args.response_delay, ready))
+    server.daemon = True
+    server.start()
+    port = ready.get(timeout=10)
+
+    handle, script = tempfile.mkstemp(suffix=".wav")
+    os.close(handle)
+    expected = build_script(args.wav, args.repeat, args.gap, script)
+    config = {
+        "hotword": args.hotword,
+        "opsdroid": {"host": "localhost", "port": port},
+        "source": {"name": "wav", "path": script, "realtime": True},
+        "output": {"sink": "bench"},
+        "speech": {
+            "recognizer": {"name": args.recognizer,
+                           "latency": args.recognizer_latency},
+            "generator": {"name": args.generator,
+                          "latency": args.generator_latency},
+        },
+    }
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start_time = time.time()
+    try:
+        run(config, timeline, expected,
+            timeout=(args.gap + 30) * expected + 60)
+    finally:
+        os.remove(script)
+        server.terminate()
+    wall_time = time.time() - start_time
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu_time = (usage.ru_utime - usage_before.ru_utime +
+                usage.ru_stime - usage_before.ru_stime)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    results = {
+        "version": __version__,
+        "recognizer": args.recognizer,
+        "generator": args.generator,
+        "utterances": expected,
+        "detected": len(timeline.events["wake"]),
+        "answered": len(timeline.events["first_audio"]),
+        "stages_ms": collections.OrderedDict(
+            (stage, summarize(timeline.stage(start, end)))
+            for stage, (start, end) in STAGES.items()),
+        "wall_seconds": wall_time,
+        "cpu_seconds": cpu_time,
+        "cpu_percent": 100 * cpu_time / wall_time,
+        "max_rss_mb": max_rss / 1024.0 / 1024.0,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Compare detection latency with the detector on a thread or a process.
+
+A wav file of the hotword is played in real time with silence between
+repeats, while `--load-threads` threads keep the main interpreter busy
+with pure Python work, as recognition and JSON handling do. The time from
+the end of each hotword until its detection reaches the app is reported
+for the detector running on a thread and in its own process. Chunks are
+delivered as they start playing, so lags can be negative, the difference
+between the two is what matters.
+
+    python benchmarks/bench_isolation.py --wav hey_opsdroid.wav
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+from opsdroidaudio import audio, isolation, sources
+
+from bench_replay import RATE, model_path
+
+
+def build_script(hotword, repeat, gap, path):
+    """Write the hotword `repeat` times with silence between.
+
+    :return: the seconds into the file at which each hotword ends.
+    """
+    silence = b"\x00\x00" * int(RATE * gap)
+    ends = []
+    script = wave.open(path, 'wb')
+    script.setnchannels(1)
+    script.setsampwidth(2)
+    script.setframerate(RATE)
+    position = 0
+    for _ in range(repeat):
+        script.writeframes(silence + hotword)
+        position += len(silence) + len(hotword)
+        ends.append(position / float(2 * RATE))
+    script.writeframes(silence)
+    script.close()
+    return ends
+
+
+def read_hotword(path):
+    """Read the hotword recording, or make a quiet sound ending in a burst.
+
+    Snowboy detects a hotword as it ends, the burst stands in for that.
+    """
+    if path is None:
+        return np.concatenate([
+            np.random.randint(-2000, 2000, int(RATE * 0.4)),
+            np.random.randint(-30000, 30000, int(RATE * 0.05)),
+        ]).astype(np.int16).tobytes()
+    wav = wave.open(path, 'rb')
+    data = wav.readframes(wav.getnframes())
+    wav.close()
+    return data
+
+
+def busy(stopping):
+    """Hold the GIL with pure Python work until stopped."""
+    document = {"text": "turn the lights on", "values": list(range(200))}
+    while not stopping.is_set():
+        json.loads(json.dumps(document))
+
+
+def measure(detector, ends, load_threads):
+    """Run a detector over the script and get the lag of each detection."""
+    stopping = threading.Event()
+    workers = [threading.Thread(target=busy, args=(stopping,))
+               for _ in range(load_threads)]
+    for worker in workers:
+        worker.start()
+    detections = []
+    start_time = time.time()
+    try:
+        detector.start(
+            detected_callback=lambda *_: detections.append(time.time()),
+            recording_callback=lambda *_: None)
+    finally:
+        stopping.set()
+        for worker in workers:
+            worker.join()
+    return [1000 * (detected - start_time - end)
+            for detected, end in zip(detections, ends)]
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wav", help="16kHz mono 16 bit wav of the hotword")
+    parser.add_argument("--model", default="snowboy")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--gap", type=float, default=2,
+                        help="seconds of silence between hotwords")
+    parser.add_argument("--load-threads", type=int, default=4)
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix=".wav")
+    os.close(handle)
+    ends = build_script(read_hotword(args.wav), args.repeat, args.gap, path)
+    source_config = {"name": "wav", "path": path, "realtime": True}
+    results = {}
+    try:
+        for mode in ("thread", "process"):
+            if mode == "thread":
+                detector = audio.HotwordDetector(
+                    model_path(args.model), sensitivity=0.4,
+                    source=sources.create(source_config, RATE))
+            else:
+                detector = isolation.IsolatedDetector(
+                    decoder_model=model_path(args.model), sensitivity=0.4,
+                    source_config=source_config)
+            lags = measure(detector, ends, args.load_threads)
+            detector.terminate()
+            results[mode] = {
+                "detections": len(lags),
+                "mean_ms": float(np.mean(lags)) if lags else None,
+                "p95_ms": float(np.percentile(lags, 95)) if lags else None,
+                "max_ms": max(lags) if lags else None,
+            }
+    finally:
+        os.remove(path)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compare recognition with and without biasing towards a phrase set.
+
+Recognizes every recorded fixture in a directory or manifest, as used by
+`python -m opsdroidaudio transcribe`, once with the plain recognizer and
+once biased towards the phrases, and reports the mean recognition time and
+word error rate of each. Fixtures need reference transcripts for the word
+error rate.
+
+    python benchmarks/bench_phrases.py fixtures/ --phrases phrases.txt
+"""
+import argparse
+import json
+import time
+
+from opsdroidaudio import recognizers, transcribe
+
+
+def run(config, items, sample_rate=recognizers.SAMPLE_RATE):
+    """Recognize each fixture with a warm engine.
+
+    :return: dict of the mean recognition time and the word error rate.
+    """
+    engine = recognizers.create_engine(config, sample_rate)
+    seconds, errors, words = [], 0, 0
+    for item in items:
+        data = transcribe.read_audio(item["path"], sample_rate)
+        start_time = time.time()
+        text = engine.recognize(data)
+        seconds.append(time.time() - start_time)
+        if item["reference"] is not None:
+            item_errors, item_words = transcribe.word_errors(
+                item["reference"], text)
+            errors += item_errors
+            words += item_words
+    return {"mean_seconds": sum(seconds) / max(1, len(seconds)),
+            "word_error_rate": errors / float(words) if words else None}
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="directory of fixtures or manifest")
+    parser.add_argument("--phrases", required=True,
+                        help="file with one phrase per line")
+    parser.add_argument("--recognizer", default="sphinx")
+    parser.add_argument("--mode", default="grammar",
+                        help="grammar or keywords, for Sphinx")
+    args = parser.parse_args()
+
+    items = transcribe.find_files(args.path)
+    config = {"name": args.recognizer}
+    results = {
+        "plain": run(config, items),
+        "biased": run(dict(config, phrases={"file": args.phrases,
+                                            "mode": args.mode}), items),
+    }
+    results["fixtures"] = len(items)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
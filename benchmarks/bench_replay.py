@@ -0,0 +1,89 @@
+"""Measure hotword detection throughput by replaying a wav file.
+
+The file is pushed through the detector, endpointer and recording path as
+fast as the CPU allows and the throughput is reported as a real time factor,
+how many seconds of audio are processed per second of wall clock time.
+Without a file a mix of silence and noise is generated. Silent audio is
+skipped by the energy gate unless `--no-gate` is given.
+
+    python benchmarks/bench_replay.py --wav recording.wav --model snowboy
+"""
+import argparse
+import os
+import tempfile
+import wave
+
+import numpy as np
+
+from opsdroidaudio import audio, sources
+
+
+RATE = 16000
+
+
+def generate_wav(path, seconds):
+    """Write alternating seconds of silence and noise to a wav file."""
+    samples = np.zeros(int(seconds * RATE), dtype=np.int16)
+    for start in range(RATE, len(samples), 2 * RATE):
+        samples[start:start + RATE] = np.random.randint(
+            -3000, 3000, len(samples[start:start + RATE]))
+    wav = wave.open(path, 'wb')
+    wav.setnchannels(1)
+    wav.setsampwidth(2)
+    wav.setframerate(RATE)
+    wav.writeframes(samples.tobytes())
+    wav.close()
+
+
+def model_path(model):
+    """Find the path of one of the bundled models."""
+    if os.path.exists(model):
+        return model
+    return os.path.join(audio.TOP_DIR, "models", "{}.pmdl".format(model))
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wav", help="16kHz mono 16 bit wav file to replay")
+    parser.add_argument("--seconds", type=float, default=60,
+                        help="seconds of audio to generate without --wav")
+    parser.add_argument("--model", default="snowboy")
+    parser.add_argument("--chunk-frames", type=int, default=2048)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-gate", action="store_true",
+                        help="run the detector on silent audio too")
+    args = parser.parse_args()
+
+    path = args.wav
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix=".wav")
+        os.close(handle)
+        generate_wav(path, args.seconds)
+
+    try:
+        best = None
+        for _ in range(args.repeat):
+            source = sources.WavFileSource(RATE, path=path, realtime=False)
+            detector = audio.HotwordDetector(
+                model_path(args.model), sensitivity=0.4, source=source,
+                detection_config={"enabled": not args.no_gate})
+            stats = detector.replay(recording_callback=lambda *_: None,
+                                    chunk_frames=args.chunk_frames)
+            stats["skipped"] = detector.gate.skipped / float(
+                detector.gate.skipped + detector.gate.analysed)
+            detector.terminate()
+            if best is None or stats["elapsed"] < best["elapsed"]:
+                best = stats
+    finally:
+        if args.wav is None:
+            os.remove(path)
+
+    print("{:.1f}s of audio in {:.3f}s, {:.1f}x real time, {} detections, "
+          "{:.0%} skipped as silent".format(
+              best["audio_seconds"], best["elapsed"],
+              best["realtime_factor"], best["detections"], best["skipped"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Micro-benchmark the PCM ring buffer against the old deque implementation.
+
+Simulates the PortAudio callback writing 2048 frame chunks of 16kHz mono
+audio while the detection loop drains the buffer.
+
+    python benchmarks/bench_ring_buffer.py --seconds 60
+"""
+import argparse
+import collections
+import os
+import timeit
+
+from opsdroidaudio.buffers import RingBuffer
+
+
+class DequeRingBuffer:
+    """The original ring buffer which stored one int per byte in a deque."""
+
+    def __init__(self, size=4096):
+        """Set buffer max size on init."""
+        self._buf = collections.deque(maxlen=size)
+
+    def extend(self, data):
+        """Add data to the end of buffer."""
+        self._buf.extend(data)
+
+    def get(self):
+        """Retrieve data from the beginning of buffer and clears it."""
+        tmp = bytes(bytearray(self._buf))
+        self._buf.clear()
+        return tmp
+
+
+def run(buffer_class, chunk, chunks):
+    """Push `chunks` chunks through a buffer, draining after each one."""
+    buf = buffer_class(16000 * 2 * 5)
+    for _ in range(chunks):
+        buf.extend(chunk)
+        buf.get()
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60,
+                        help="seconds of audio to push through each buffer")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    chunk = os.urandom(2048 * 2)
+    chunks = int(args.seconds * 16000 / 2048)
+    results = {}
+    for buffer_class in (DequeRingBuffer, RingBuffer):
+        best = min(timeit.repeat(
+            lambda: run(buffer_class, chunk, chunks),
+            number=1, repeat=args.repeat))
+        results[buffer_class.__name__] = best
+        print("{:16} {:8.4f}s for {:.0f}s of audio ({:.5f}% of one core)"
+              .format(buffer_class.__name__, best, args.seconds,
+                      100 * best / args.seconds))
+    print("Speed up: {:.1f}x".format(
+        results["DequeRingBuffer"] / results["RingBuffer"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Find how many rooms' audio streams this CPU can keep up with.
+
+Runs 1 to `--max-streams` hotword detectors at once, each replaying the
+same wav file through detection and endpointing as fast as it can. A
+stream can be sustained live if every detector still processes audio at
+least as fast as real time, so the largest such number of streams is
+reported. Detectors run on threads, like multiple rooms do, or on
+processes with `--processes` for comparison.
+
+    python benchmarks/bench_rooms.py --wav recording.wav --max-streams 8
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from opsdroidaudio import audio, sources
+
+from bench_replay import RATE, generate_wav, model_path
+
+
+def detect(path, model, barrier, results):
+    """Replay a wav file through a detector once everyone is ready."""
+    source = sources.WavFileSource(RATE, path=path, realtime=False)
+    detector = audio.HotwordDetector(model, sensitivity=0.4, source=source)
+    barrier.wait()
+    stats = detector.replay(recording_callback=lambda *_: None)
+    detector.terminate()
+    results.put(stats)
+
+
+def run(streams, path, model, processes=False):
+    """Run `streams` detectors at once.
+
+    :return: the stats of each detector and the seconds until all finished.
+    """
+    if processes:
+        barrier = multiprocessing.Barrier(streams + 1)
+        results = multiprocessing.Queue()
+        worker_class = multiprocessing.Process
+    else:
+        barrier = threading.Barrier(streams + 1)
+        results = queue.Queue()
+        worker_class = threading.Thread
+    workers = [worker_class(target=detect,
+                            args=(path, model, barrier, results))
+               for _ in range(streams)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start_time = time.time()
+    stats = [results.get() for _ in workers]
+    elapsed = time.time() - start_time
+    for worker in workers:
+        worker.join()
+    return stats, elapsed
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wav", help="16kHz mono 16 bit wav file to replay")
+    parser.add_argument("--seconds", type=float, default=60,
+                        help="seconds of audio to generate without --wav")
+    parser.add_argument("--model", default="snowboy")
+    parser.add_argument("--max-streams", type=int,
+                        default=multiprocessing.cpu_count() * 2)
+    parser.add_argument("--processes", action="store_true",
+                        help="run each detector in its own process")
+    args = parser.parse_args()
+
+    path = args.wav
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix=".wav")
+        os.close(handle)
+        generate_wav(path, args.seconds)
+
+    sustained = 0
+    print("{:>7} {:>14} {:>18}".format("streams", "total speed",
+                                       "slowest stream"))
+    try:
+        for streams in range(1, args.max_streams + 1):
+            stats, elapsed = run(streams, path, model_path(args.model),
+                                 args.processes)
+            total = sum(stat["audio_seconds"] for stat in stats) / elapsed
+            slowest = min(stat["realtime_factor"] for stat in stats)
+            print("{:7d} {:13.1f}x {:17.1f}x".format(streams, total,
+                                                     slowest))
+            if slowest >= 1:
+                sustained = streams
+    finally:
+        if args.wav is None:
+            os.remove(path)
+
+    print("This CPU can sustain {}{} live streams with {}.".format(
+        "at least " if sustained == args.max_streams else "", sustained,
+        "processes" if args.processes else "threads"))
+
+
+if __name__ == "__main__":
+    main()
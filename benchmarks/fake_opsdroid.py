@@ -0,0 +1,164 @@
+"""A local stand-in for opsdroid's websocket connector.
+
+Implements just enough of `/connector/websocket` for opsdroid audio to
+connect: a POST which hands out a socket id and a websocket which replies to
+every message it receives. Only the standard library is used so it runs
+anywhere the benchmarks do.
+
+    python benchmarks/fake_opsdroid.py --port 8080
+"""
+import argparse
+import base64
+import hashlib
+import json
+import struct
+import time
+import uuid
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def read_frame(stream):
+    """Read one websocket frame, returning (opcode, payload)."""
+    header = stream.read(2)
+    if len(header) < 2:
+        return OPCODE_CLOSE, b""
+    opcode = header[0] & 0x0F
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", stream.read(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", stream.read(8))[0]
+    mask = stream.read(4) if header[1] & 0x80 else None
+    payload = bytearray(stream.read(length))
+    if mask is not None:
+        for i in range(len(payload)):
+            payload[i] ^= mask[i % 4]
+    return opcode, bytes(payload)
+
+
+def write_frame(stream, opcode, payload):
+    """Write one unmasked websocket frame."""
+    header = bytearray([0x80 | opcode])
+    if len(payload) < 126:
+        header.append(len(payload))
+    elif len(payload) < 65536:
+        header.append(126)
+        header += struct.pack("!H", len(payload))
+    else:
+        header.append(127)
+        header += struct.pack("!Q", len(payload))
+    stream.write(bytes(header) + payload)
+    stream.flush()
+
+
+class ConnectorHandler(BaseHTTPRequestHandler):
+    """Handle requests to the fake websocket connector."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """Keep quiet, the benchmark has its own output."""
+        # pylint: disable=redefined-builtin
+
+    def do_POST(self):
+        """Hand out a new socket id."""
+        # pylint: disable=invalid-name
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = json.dumps({"socket": str(uuid.uuid4())}).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Upgrade to a websocket and reply to each message."""
+        # pylint: disable=invalid-name
+        key = self.headers.get("Sec-WebSocket-Key")
+        if key is None:
+            self.send_error(400)
+            return
+        accept = base64.b64encode(hashlib.sha1(
+            (key + WEBSOCKET_GUID).encode("utf8")).digest()).decode("utf8")
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        while True:
+            opcode, payload = read_frame(self.rfile)
+            if opcode == OPCODE_CLOSE:
+                write_frame(self.wfile, OPCODE_CLOSE, b"")
+                break
+            if opcode == OPCODE_PING:
+                write_frame(self.wfile, OPCODE_PONG, payload)
+            elif opcode == OPCODE_TEXT:
+                time.sleep(self.server.delay)
+                write_frame(self.wfile, OPCODE_TEXT,
+                            self.server.response.format(
+                                payload.decode("utf8")).encode("utf8"))
+        self.close_connection = True
+
+
+class FakeOpsdroid(ThreadingMixIn, HTTPServer):
+    """HTTP server standing in for opsdroid.
+
+    :param int port: port to listen on, 0 picks a free one.
+    :param response: format string for replies, `{}` is the message.
+    :param float delay: seconds to wait before replying.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="localhost", port=0, response="You said {}.",
+                 delay=0.0):
+        """Start listening."""
+        HTTPServer.__init__(self, (host, port), ConnectorHandler)
+        self.response = response
+        self.delay = delay
+
+    @property
+    def port(self):
+        """Get the port the server is listening on."""
+        return self.server_address[1]
+
+
+def serve(port, response="You said {}.", delay=0.0, ready=None):
+    """Run a fake opsdroid until the process is killed.
+
+    :param ready: optional queue which is sent the port once listening.
+    """
+    server = FakeOpsdroid(port=port, response=response, delay=delay)
+    if ready is not None:
+        ready.put(server.port)
+    server.serve_forever()
+
+
+def main():
+    """Run the server from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--response", default="You said {}.")
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds to wait before replying")
+    args = parser.parse_args()
+    serve(args.port, args.response, args.delay)
+
+
+if __name__ == "__main__":
+    main()
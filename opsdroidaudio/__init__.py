@@ -1 +1,5 @@
 """Opsdroid audio package."""
+import time
+
+# Taken before anything else is imported, to time how long starting takes
+START_TIME = time.time()
@@ -1,28 +1,27 @@
 """The main class for opsdroid audio."""
+import concurrent.futures
 import os
 import sys
 import signal
 import logging
 import threading
-import time
+import tempfile
 from datetime import datetime
-try:
-    from Queue import Queue
-except ImportError:
-    from queue import Queue
 
 import yaml
-import websocket
-import requests
 
-import opsdroidaudio.audio as audio
-from opsdroidaudio import recognizers, generators
+from opsdroidaudio import (
+    START_TIME, cache, connection, generators, metrics, pool, recognizers,
+    startup, transcribe)
+from opsdroidaudio.room import Room
 
 
 logging.basicConfig()
 _LOGGER = logging.getLogger()
 _LOGGER.setLevel(logging.DEBUG)
 
+CONNECT_TIMEOUT = 30  # Seconds
+
 
 class OpsdroidAudio:
     """The opsdroid audio class."""
@@ -33,47 +32,100 @@ class OpsdroidAudio:
     def __init__(self):
         """Initialize variables and load config."""
         self.threads = []
-        self.interrupted = Queue()
-        self.speak_queue = Queue()
-        self.lock = threading.Lock()
-        self.websocket = None
-        self.websocket_url = None
-        self.detector = None
-        self.websocket_open = False
-        self.config = self.load_config_file()
+        self.interrupted = threading.Event()
+        self.listening = threading.Event()
+        self.recognition_pool = None
+        self.engines = None
+        self.startup = startup.StartupTimer(START_TIME)
+        self.startup.mark("import")
+        self.config = self.startup.time("config", self.load_config_file)
         self.opsdroid_host = self.config.get(
             "opsdroid", {"host": "localhost"}).get("host", "localhost")
         self.opsdroid_port = self.config.get(
             "opsdroid", {"port": "8080"}).get("port", "8080")
-        self.model = self.load_model()
+        self.metrics, self.exporters = self.load_metrics()
+        self.startup.export(self.metrics)
+        self.connection = self.create_connection()
+        self.rooms = self.load_rooms()
+        self.speech_cache = self.load_speech_cache()
 
     def start(self):
-        """Start listening and processing audio."""
-        self.detector = audio.HotwordDetector(self.model, sensitivity=0.4)
-        print('Listening... Press Ctrl+C to exit')
-
-        # main loop
-        self.threads.append(
-            threading.Thread(target=self.detector.start, kwargs={
-                "detected_callback": self.detected_callback,
-                "recording_callback": self.recording_callback,
-                "interrupt_check": self.interrupt_callback,
-                "sleep_time": 0.03}))
-        self.threads.append(threading.Thread(target=self.await_speech))
-        self.threads.append(threading.Thread(target=self.start_socket))
-
+        """Start listening and processing audio until stopped."""
+        for exporter in self.exporters:
+            exporter.start()
+        self.connection.start()
+        threading.Thread(target=self.report_startup, daemon=True).start()
+        self.load()
+        self.recognition_pool = self.create_recognition_pool()
+        for room in self.rooms:
+            room.start()
+        self.startup.mark("listening")
+        self.listening.set()
+
+        if self.speech_cache is not None:
+            self.threads.append(
+                threading.Thread(target=self.prewarm_speech_cache,
+                                 daemon=True))
         for thread in self.threads:
             thread.start()
-        for thread in self.threads:
-            thread.join(60)
+        print('Listening... Press Ctrl+C to exit')
 
-        self.detector.terminate()
+        self.interrupted.wait()
+        self.shutdown()
+
+    def load(self):
+        """Load the recognizers and every room's hotword model in parallel.
+
+        This happens while the connection to opsdroid is being made. The
+        recognizers are loaded as soon as the first room knows the sample
+        rate it records at.
+        """
+        with concurrent.futures.ThreadPoolExecutor(
+                len(self.rooms) + 1) as executor:
+            models = [executor.submit(self.startup.time,
+                                      "model {}".format(room), room.load)
+                      for room in self.rooms]
+            models[0].result()
+            engines = executor.submit(self.startup.time, "engines",
+                                      self.load_engines,
+                                      self.rooms[0].sample_rate)
+            self.engines = engines.result()
+            for model in models:
+                model.result()
+
+    def report_startup(self):
+        """Time connecting to opsdroid and log how long startup took."""
+        if not self.startup.time("connect", self.connection.ready.wait,
+                                 CONNECT_TIMEOUT):
+            _LOGGER.warning("Not connected to opsdroid %d seconds after "
+                            "starting.", CONNECT_TIMEOUT)
+        self.listening.wait()
+        _LOGGER.info(self.startup.report())
+
+    def stop(self):
+        """Ask `start` to shut down, safe to call from any thread."""
+        self.interrupted.set()
+
+    def shutdown(self):
+        """Stop each stage in the order audio flows through them.
+
+        Recordings already made are recognized and their text sent to
+        opsdroid before the connection closes.
+        """
+        _LOGGER.info("Shutting down...")
+        for room in self.rooms:
+            room.stop_listening()
+        self.recognition_pool.stop()
+        self.connection.stop()
+        for room in self.rooms:
+            room.close()
+        for exporter in self.exporters:
+            exporter.stop()
 
     def signal_handler(self, signalcode, frame):
         """Handle SIGINT."""
         _LOGGER.info("User pressed ^C, exiting...")
-        self.websocket.close()
-        self.interrupted.put(True)
+        self.stop()
 
     @staticmethod
     def critical(message, code):
@@ -81,25 +133,33 @@ class OpsdroidAudio:
         _LOGGER.critical(message)
         sys.exit(1)
 
-    def load_model(self):
+    def load_model(self, hotword):
         """Locate the model file to use."""
         try:
-            if os.path.exists(self.config.get("hotword")):
-                return self.config.get("hotword")
+            if os.path.exists(hotword):
+                return hotword
 
             pwd, _ = os.path.split(os.path.realpath(__file__))
-            model = "{}/models/{}.pmdl".format(
-                pwd, self.config.get("hotword"))
+            model = "{}/models/{}.pmdl".format(pwd, hotword)
 
             if not os.path.exists(model):
                 self.critical(
-                    "Unable to find hotword {}".format(
-                        self.config.get("hotword")), 1)
+                    "Unable to find hotword {}".format(hotword), 1)
 
             return model
 
         finally:
-            _LOGGER.info("Loaded model %s", self.config.get("hotword"))
+            _LOGGER.info("Loaded model %s", hotword)
+
+    def load_rooms(self):
+        """Create a room for each entry in `rooms`, or one default room."""
+        rooms = self.config.get("rooms")
+        if not rooms:
+            return [Room(self, None, self.config)]
+        defaults = {key: value for key, value in self.config.items()
+                    if key != "rooms"}
+        return [Room(self, name, dict(defaults, **(overrides or {})))
+                for name, overrides in rooms.items()]
 
     def load_config_file(self):
         """Load a yaml config file from path."""
@@ -127,118 +187,186 @@ class OpsdroidAudio:
         except FileNotFoundError as error:
             self.critical(str(error), 1)
 
-    def get_websocket(self):
-        """Request a new websocket from opsdroid."""
-        response = requests.post("http://{}:{}/connector/websocket".format(
-            self.opsdroid_host, self.opsdroid_port), data={})
-        output = response.json()
-        _LOGGER.debug(output)
-        try:
-            return output["socket"]
-        except TypeError:
-            _LOGGER.error("Websocket returned bad response")
-
-    def start_socket(self):
-        """Connect to opsdroid with a websocket."""
+    def create_connection(self):
+        """Create the connection to opsdroid shared by every room."""
+        config = self.config.get("opsdroid", {})
+        return connection.OpsdroidConnection(
+            self.opsdroid_host, self.opsdroid_port,
+            max_queued=config.get("max_queued", 20),
+            max_backoff=config.get("max_backoff", 60),
+            metrics=self.metrics)
+
+    @property
+    def streaming(self):
+        """Check whether recordings are recognized while they are made."""
+        return self.config.get("recognition", {}).get(
+            "executor", "thread") == "thread"
+
+    @property
+    def recognizer_config(self):
+        """Get the speech recognizer config section."""
         try:
-            self.websocket_url = self.get_websocket()
-        except requests.ConnectionError as error:
-            self.socket_error(None, error)
-            return
-        self.websocket = websocket.WebSocketApp(
-            "ws://{}:{}/connector/websocket/{}".format(
-                self.opsdroid_host, self.opsdroid_port, self.websocket_url),
-            on_message=self.socket_message,
-            on_close=self.socket_close,
-            on_error=self.socket_error)
-        self.websocket_open = True
-        self.websocket.run_forever()
-
-    def socket_message(self, socket, message):
-        """Process a new message form the socket."""
-        _LOGGER.info("Bot says '%s'", message)
-        self.speak_queue.put(message)
-
-    def socket_close(self, socket=None):
-        """Handle the socket closing."""
-        _LOGGER.info("Websocket closed, attempting reconnect in 5 seconds")
-        if self.interrupted.empty():
-            self.websocket_open = False
-            time.sleep(5)
-            self.start_socket()
-        else:
-            return
-
-    def socket_error(self, socket, error):
-        """Handle an error on the socket."""
-        _LOGGER.error("Unable to connect to opsdroid.")
-        if self.websocket_open:
-            self.websocket.close()
-        else:
-            self.socket_close()
-
-    def interrupt_callback(self):
-        """Notify the hotword detector of an interrupt."""
-        return not self.interrupted.empty()
+            return self.config["speech"]["recognizer"]
+        except KeyError:
+            self.critical("No speech recognizer configured!", 1)
 
-    @staticmethod
-    def detected_callback(data, detector):
-        """Hotword has been detected."""
-        audio.play_audio_file(audio.DETECT_DING)
+    def load_engines(self, sample_rate):
+        """Load and warm up the speech recognition engines.
 
-    def recording_callback(self, data, detector):
-        """Handle a recording."""
-        audio.play_audio_file(audio.DETECT_DONG)
+        Engines for the process executor are loaded in the worker processes
+        instead.
 
+        :param int sample_rate: the sample rate the rooms record at.
+        """
+        if not self.streaming:
+            return None
+        config = self.recognizer_config
+        recognition = self.config.get("recognition", {})
+        size = recognition.get("engines", recognition.get("workers", 2) + 1)
+        start_time = datetime.now()
+        engines = recognizers.EnginePool(
+            lambda: recognizers.create_engine(config, sample_rate,
+                                              metrics=self.metrics),
+            size)
+        _LOGGER.info("Loaded %d %s recognizers in %f seconds.", size,
+                     config["name"],
+                     (datetime.now() - start_time).total_seconds())
+        return engines
+
+    def create_recognition_pool(self):
+        """Create the pool of recognition workers."""
+        recognition = dict(self.config.get("recognition", {}))
+        recognition.pop("engines", None)
+        if not self.streaming:
+            recognition["initializer"] = recognizers.init_worker
+            recognition["initargs"] = (self.recognizer_config,
+                                       self.rooms[0].sample_rate)
+        return pool.RecognitionPool(metrics=self.metrics, **recognition)
+
+    def finish_recognition(self, recognizer, engine=None, postprocess=None):
+        """Get the transcript from a streaming recognizer.
+
+        :param postprocess: optional function applied to the recording
+                            before it is recognized. Only recognizers which
+                            buffer the recording can use it.
+        """
         start_time = datetime.now()
-        user_text = self.recognize_text(data, detector.detector.SampleRate())
-        end_time = datetime.now()
-        _LOGGER.info("Speech recognition took %f seconds.",
-                     (end_time - start_time).total_seconds())
-
-        self.websocket.send(user_text)
-        _LOGGER.info("User said '%s'", user_text)
-
-    def await_speech(self):
-        """Thread to play speech when received."""
-        while self.interrupted.empty():
-            if not self.speak_queue.empty():
-                self.generate_speech(self.speak_queue.get())
-
-    def recognize_text(self, data, sample_rate):
-        """Convert raw user audio into text."""
-        _LOGGER.debug("Recognizing speech...")
         try:
-            config = self.config["speech"]["recognizer"]
-            if config["name"] == "google_cloud":
-                return recognizers.google_cloud(config, data, sample_rate)
-
-            if config["name"] == "sphinx":
-                return recognizers.sphinx(config, data, sample_rate)
+            if postprocess is not None:
+                if isinstance(recognizer, recognizers.BatchRecognizer):
+                    recognizer.postprocess = postprocess
+                else:
+                    _LOGGER.debug("Unable to postprocess audio which was "
+                                  "recognized while it was recorded.")
+            return recognizer.finish()
+        finally:
+            end_time = datetime.now()
+            _LOGGER.info("Speech recognition took %f seconds.",
+                         (end_time - start_time).total_seconds())
+            if engine is not None:
+                self.engines.release(engine)
+
+    def cancel_recognition(self, recognizer, engine=None):
+        """Abandon a streaming recognizer whose recording was dropped.
+
+        The utterance is ended before the engine is released, as an engine
+        left in the middle of one can't start the next.
+        """
+        try:
+            recognizer.cancel()
+        finally:
+            if engine is not None:
+                self.engines.release(engine)
 
-            raise KeyError
+    @property
+    def generator_config(self):
+        """Get the speech generator config section."""
+        try:
+            return self.config["speech"]["generator"]
         except KeyError:
-            self.critical("No speech recognizer configured!", 1)
+            self.critical("No speech generator configured!", 1)
 
-    def generate_speech(self, text):
-        """Generate speech audio from bot response text."""
-        _LOGGER.debug("Generating speech...")
+    @property
+    def synthesizer(self):
+        """Get the configured speech synthesizer."""
         try:
-            config = self.config["speech"]["generator"]
-            if config["name"] == "google":
-                return generators.google(config, text)
-            if config["name"] == "apple_say":
-                return generators.apple_say(config, text)
-
-            raise KeyError
+            return generators.SYNTHESIZERS[self.generator_config["name"]]
         except KeyError:
             self.critical("No speech generator configured!", 1)
-        finally:
-            _LOGGER.debug("Done.")
+
+    def load_metrics(self):
+        """Create the metrics registry and exporters if metrics are enabled."""
+        config = self.config.get("metrics")
+        if config is None:
+            return metrics.NULL, []
+        registry = metrics.Metrics()
+        return registry, metrics.create_exporters(config, registry)
+
+    def load_speech_cache(self):
+        """Open the synthesized speech cache if one is configured."""
+        config = self.config.get("speech", {}).get("cache")
+        if config is None:
+            return None
+        return cache.SpeechCache(
+            config.get("directory", "~/.opsdroidaudio/cache"),
+            int(config.get("max_mb", 100) * 1024 * 1024))
+
+    def speech_cache_key(self, text):
+        """Get the speech cache key for some bot response text."""
+        config = self.generator_config
+        return self.speech_cache.key(config["name"], config.get("voice"),
+                                     config.get("language"), text)
+
+    def prewarm_speech_cache(self):
+        """Synthesize the configured phrases into the speech cache."""
+        config = self.generator_config
+        self.speech_cache.prewarm(
+            [generators.normalize_text(phrase) for phrase in
+             self.config["speech"]["cache"].get("prewarm", [])],
+            self.speech_cache_key, self.synthesizer.extension,
+            lambda text, path: self.synthesizer.synthesize(config, text,
+                                                           path))
+
+    def synthesize_speech(self, text):
+        """Synthesize bot response text into an audio file."""
+        _LOGGER.debug("Generating speech...")
+        config = self.generator_config
+        synthesizer = self.synthesizer
+
+        if self.speech_cache is not None:
+            path = self.speech_cache.get_or_synthesize(
+                self.speech_cache_key(text), synthesizer.extension,
+                lambda path: synthesizer.synthesize(config, text, path))
+            _LOGGER.debug("Speech cache %d hits, %d misses.",
+                          self.speech_cache.stats["hits"],
+                          self.speech_cache.stats["misses"])
+            return path
+
+        handle, path = tempfile.mkstemp(suffix=synthesizer.extension)
+        os.close(handle)
+        if synthesizer.synthesize(config, text, path):
+            return path
+        self.remove_speech(path)
+        return None
+
+    def remove_speech(self, path):
+        """Delete a synthesized speech file or release it to the cache."""
+        if self.speech_cache is not None and \
+                self.speech_cache.contains(path):
+            self.speech_cache.release(path)
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 
 def main():
     """Enter the application here."""
+    if sys.argv[1:2] == ["transcribe"]:
+        transcribe.main(sys.argv[2:])
+        return
+
     oaudio = OpsdroidAudio()
 
     # capture SIGINT signal, e.g., Ctrl+C
@@ -1,15 +1,15 @@
 """Audio handling submodule."""
-import collections
 import time
 import os
 import logging
-from array import array
-
-import wave
-import pyaudio
+import threading
 
 from snowboydetect import snowboydetect
 
+from opsdroidaudio import endpointer, sources, vad
+from opsdroidaudio.buffers import Recording, RingBuffer
+from opsdroidaudio.metrics import NULL as NO_METRICS
+
 logging.basicConfig()
 _LOGGER = logging.getLogger("snowboy")
 _LOGGER.setLevel(logging.INFO)
@@ -19,56 +19,8 @@ RESOURCE_FILE = os.path.join(TOP_DIR, "resources/common.res")
 DETECT_DING = os.path.join(TOP_DIR, "resources/ding.wav")
 DETECT_DONG = os.path.join(TOP_DIR, "resources/dong.wav")
 BUFFER_LENGTH = 5  # Seconds
-
-RECORDING_SILENCE_START = 3
-RECORDING_SILENCE = 4
-RECORDING_THRESHOLD = 3000
-
-
-class RingBuffer:
-    """Ring buffer to hold audio from PortAudio."""
-
-    def __init__(self, size=4096):
-        """Set buffer max size on init."""
-        self._buf = collections.deque(maxlen=size)
-
-    def extend(self, data):
-        """Add data to the end of buffer."""
-        self._buf.extend(data)
-
-    def get(self):
-        """Retrieve data from the beginning of buffer and clears it."""
-        tmp = bytes(bytearray(self._buf))
-        self._buf.clear()
-        return tmp
-
-    @property
-    def length(self):
-        """Get the length of the buffer."""
-        return len(self._buf)
-
-
-def play_audio_file(fname=DETECT_DING):
-    """Play a wave file.
-
-    By default it plays a Ding sound.
-
-    :param str fname: wave file name
-    :return: None
-    """
-    ding_wav = wave.open(fname, 'rb')
-    ding_data = ding_wav.readframes(ding_wav.getnframes())
-    audio = pyaudio.PyAudio()
-    stream_out = audio.open(
-        format=audio.get_format_from_width(ding_wav.getsampwidth()),
-        channels=ding_wav.getnchannels(),
-        rate=ding_wav.getframerate(), input=False, output=True)
-    stream_out.start_stream()
-    stream_out.write(ding_data)
-    time.sleep(0.2)
-    stream_out.stop_stream()
-    stream_out.close()
-    audio.terminate()
+RECORDING_MEMORY_KB = 512
+RECORDING_MAX_SECONDS = 30
 
 
 class HotwordDetector:
@@ -82,6 +34,25 @@ class HotwordDetector:
                               decoder. If an empty list is provided, then the
                               default sensitivity in the model will be used.
     :param audio_gain: multiply input volume by this factor.
+    :param endpointer_config: config used to create the endpointer which
+                              decides when a recording has finished.
+    :param source: the AudioSource to listen to. If None one is created from
+                   `source_config`, which defaults to the microphone.
+    :param source_config: config used to create the audio source.
+    :param metrics: optional Metrics to record detection statistics in.
+    :param echo_gate: optional function which returns True while the
+                      microphone can hear our own audio output. That audio
+                      is left out of recordings.
+    :param bool gate_detection: also ignore hotwords while `echo_gate`
+                                returns True, so the output can't trigger
+                                the detector but can't be interrupted.
+    :param detection_config: config used to create the energy gate which
+                             splits audio into blocks for the detector and
+                             skips blocks which are silent.
+    :param recording_config: dict which can set `memory_kb`, the audio held
+                             in memory before a recording is moved to a temp
+                             file in `spill_dir`, and `max_seconds`, after
+                             which a recording is always finished.
     """
 
     # pylint: disable=too-many-instance-attributes
@@ -90,18 +61,25 @@ class HotwordDetector:
     def __init__(self, decoder_model,
                  resource=RESOURCE_FILE,
                  sensitivity=None,
-                 audio_gain=1):
+                 audio_gain=1,
+                 endpointer_config=None,
+                 source=None,
+                 source_config=None,
+                 metrics=None,
+                 echo_gate=None,
+                 gate_detection=False,
+                 detection_config=None,
+                 recording_config=None):
         """Initialise the HotwordDetector object."""
-        def audio_callback(in_data, frame_count, time_info, status):
-            """Extend buffer with data from pyaudio."""
-            self.ring_buffer.extend(in_data)
-            play_data = chr(0) * len(in_data)
-            return play_data, pyaudio.paContinue
-
+        # pylint: disable=too-many-arguments
         self.recording = False
-        self.recording_silence = 0
-        self.recording_time = 0
-        self.last_chunk_silent = False
+        self.stop_event = threading.Event()
+        self.source_finished = threading.Event()
+        self.detected_callback = []
+        self.recording_callback = None
+        self.stream_callback = None
+        self.echo_gate = echo_gate
+        self.gate_detection = gate_detection
 
         if not isinstance(decoder_model, list):
             decoder_model = [decoder_model]
@@ -128,48 +106,154 @@ class HotwordDetector:
         if sensitivity:
             self.detector.SetSensitivity(sensitivity_str.encode())
 
+        frame_size = int(self.detector.NumChannels() *
+                         self.detector.BitsPerSample() / 8)
         self.ring_buffer = RingBuffer(
-            self.detector.NumChannels() *
-            self.detector.SampleRate() * BUFFER_LENGTH)
-        self.record_buffer = RingBuffer(None)
-        self.audio = pyaudio.PyAudio()
-        self.stream_in = self.audio.open(
-            input=True, output=False,
-            format=self.audio.get_format_from_width(
-                self.detector.BitsPerSample() / 8),
-            channels=self.detector.NumChannels(),
-            rate=self.detector.SampleRate(),
-            frames_per_buffer=2048,
-            stream_callback=audio_callback)
-
-    def start(self, detected_callback=play_audio_file,
+            frame_size * self.detector.SampleRate() * BUFFER_LENGTH,
+            frame_size=frame_size)
+        recording_config = recording_config or {}
+        self.recording_memory = recording_config.get(
+            "memory_kb", RECORDING_MEMORY_KB) * 1024
+        self.recording_max = int(recording_config.get(
+            "max_seconds", RECORDING_MAX_SECONDS) *
+            self.detector.SampleRate()) * frame_size
+        self.spill_dir = recording_config.get("spill_dir")
+        self.record_buffer = self.new_recording()
+        self.peak_memory = 0
+        self.spills = 0
+        self.truncations = 0
+        self.gate = vad.create(
+            detection_config, self.detector.SampleRate(),
+            int(self.detector.BitsPerSample() / 8),
+            self.detector.NumChannels())
+        self.pending = bytearray()
+        self.endpointer = endpointer.create(
+            endpointer_config, self.detector.SampleRate(),
+            int(self.detector.BitsPerSample() / 8),
+            self.detector.NumChannels())
+        if source is None:
+            source = sources.create(
+                source_config, self.detector.SampleRate(),
+                self.detector.NumChannels(),
+                int(self.detector.BitsPerSample() / 8))
+        self.source = source
+        self.bytes_per_second = frame_size * self.detector.SampleRate()
+
+        metrics = metrics or NO_METRICS
+        self.frames_processed = metrics.counter(
+            "frames_processed_total", "Audio frames run through the detector.")
+        self.detections = metrics.counter(
+            "hotwords_detected_total", "Hotwords detected.")
+        self.detection_time = metrics.histogram(
+            "detection_seconds", "Time taken by RunDetection per chunk.")
+        self.backlog = metrics.histogram(
+            "detector_backlog_seconds",
+            "Audio waiting in the ring buffer when the detector woke up.")
+        self.recordings = metrics.histogram(
+            "recording_seconds", "Length of recorded utterances.",
+            buckets=(0.5, 1, 2, 3, 5, 8, 13, 20))
+        self.gated_frames = metrics.counter(
+            "echo_gated_frames_total",
+            "Audio frames ignored because our own output was playing.")
+        metrics.counter("detection_frames_analysed_total",
+                        "Audio frames the hotword detector was run on.",
+                        lambda: self.gate.analysed)
+        metrics.counter("detection_frames_skipped_total",
+                        "Silent audio frames the hotword detector skipped.",
+                        lambda: self.gate.skipped)
+        metrics.gauge("recording_peak_memory_bytes",
+                      "Most memory held by one recording.",
+                      lambda: max(self.peak_memory,
+                                  self.record_buffer.peak_memory))
+        metrics.counter("recordings_spilled_total",
+                        "Recordings moved to a temp file on disk.",
+                        lambda: self.spills)
+        metrics.counter("recordings_truncated_total",
+                        "Recordings stopped at the maximum length.",
+                        lambda: self.truncations)
+        metrics.counter("ring_buffer_overruns_total",
+                        "Times the ring buffer overflowed.",
+                        lambda: self.ring_buffer.overruns)
+        metrics.counter("ring_buffer_dropped_bytes_total",
+                        "Bytes of audio discarded by ring buffer overruns.",
+                        lambda: self.ring_buffer.bytes_dropped)
+
+    def new_recording(self):
+        """Create an empty recording."""
+        return Recording(self.recording_memory, self.recording_max,
+                         self.ring_buffer.frame_size, self.spill_dir)
+
+    def start(self, detected_callback=None,
               recording_callback=None,
-              interrupt_check=lambda: False,
-              sleep_time=0.03):
+              interrupt_check=None,
+              sleep_time=0.03,
+              stream_callback=None):
         """
         Start the voice detector.
 
-        For every `sleep_time` second it checks the
-        audio buffer for triggering keywords. If detected, then call
-        corresponding function in `detected_callback`, which can be a single
-        function (single model) or a list of callback functions (multiple
-        models). Every loop it also calls `interrupt_check` -- if it returns
-        True, then breaks from the loop and return.
+        Blocks until audio arrives from the audio source and checks it for
+        triggering keywords. If detected, then call corresponding function in
+        `detected_callback`, which can be a single function (single model) or
+        a list of callback functions (multiple models). The loop runs until
+        `stop` is called or a finite source, such as a wav file, ends, and
+        can be started again afterwards.
 
         :param detected_callback: a function or list of functions. The number
                                   of items must match the number of models in
-                                  `decoder_model`.
-        :param interrupt_check: a function that returns True if the main loop
-                                needs to stop.
-        :param float sleep_time: how much time in second every loop waits.
+                                  `decoder_model`. Cues should be played
+                                  without blocking, for example with an
+                                  OutputEngine.
+        :param recording_callback: a function called with the finished
+                                   Recording once the endpointer decides it
+                                   has ended. Its `buffer` and `open`
+                                   methods read the audio without copying.
+        :param interrupt_check: an optional function that returns True if the
+                                main loop needs to stop. Prefer `stop`, which
+                                does not need polling.
+        :param float sleep_time: how often in seconds `interrupt_check` is
+                                 polled while waiting for audio.
+        :param stream_callback: a function called with each chunk of audio as
+                                it is recorded, starting with the chunk which
+                                contained the hotword. The chunk may be a
+                                view of the ring buffer which is only valid
+                                until the callback returns.
         :return: None
         """
-        # pylint: disable=too-many-branches
-        # Needs refactoring as port of opsdroid/opsdroid-audio#12
+        self.stop_event.clear()
+        if interrupt_check is None:
+            interrupt_check = self.stop_event.is_set
+            sleep_time = None
         if interrupt_check():
             _LOGGER.debug("detect voice return")
             return
 
+        self.set_callbacks(detected_callback, recording_callback,
+                           stream_callback)
+        _LOGGER.debug("detecting...")
+
+        self.source_finished.clear()
+        self.source.start(self.ring_buffer.extend, self.finish_source)
+        while True:
+            if interrupt_check() or self.stop_event.is_set():
+                _LOGGER.debug("detect voice break")
+                break
+            if self.source_finished.is_set() and \
+                    self.ring_buffer.length < self.ring_buffer.frame_size:
+                _LOGGER.debug("audio source finished")
+                self.finish_recording()
+                break
+            if not self.ring_buffer.wait(sleep_time):
+                continue
+            data = self.ring_buffer.read()
+            self.backlog.observe(len(data) / float(self.bytes_per_second))
+            self.process(data)
+        self.source.stop()
+
+        _LOGGER.debug("finished.")
+
+    def set_callbacks(self, detected_callback, recording_callback,
+                      stream_callback):
+        """Set the functions called by `process`."""
         if not isinstance(detected_callback, list):
             detected_callback = [detected_callback]
         if len(detected_callback) == 1 and self.num_hotwords > 1:
@@ -179,54 +263,154 @@ class HotwordDetector:
             "Error: hotwords in your models (%d) do not match the number " \
             "of callbacks (%d)" % (self.num_hotwords, len(detected_callback))
 
-        _LOGGER.debug("detecting...")
+        self.detected_callback = detected_callback
+        self.recording_callback = recording_callback
+        self.stream_callback = stream_callback
 
-        while True:
-            if interrupt_check():
-                _LOGGER.debug("detect voice break")
-                break
-            data = self.ring_buffer.get()
-            if not data:
-                time.sleep(sleep_time)
-                continue
+    def process(self, data):
+        """Run one chunk of audio through detection and recording.
 
-            data_as_ints = array('h', data)
-
-            if self.recording:
-                self.record_buffer.extend(data)
-                self.recording_time += 1
-                if self.recording_time > RECORDING_SILENCE_START and \
-                        max(data_as_ints) < RECORDING_THRESHOLD and \
-                        self.last_chunk_silent:
-                    self.recording_silence += 1
-                else:
-                    self.recording_silence = 0
-                if self.recording_silence >= RECORDING_SILENCE:
-                    _LOGGER.info("Stopping recording")
-                    if recording_callback is not None:
-                        recording_callback(self.record_buffer.get(), self)
-                    self.recording = False
-                    self.recording_silence = 0
-                    self.recording_time = 0
-
-                if max(data_as_ints) > RECORDING_THRESHOLD:
-                    self.last_chunk_silent = False
-                else:
-                    self.last_chunk_silent = True
-            else:
-                ans = self.detector.RunDetection(data)
-                if ans == -1:
-                    _LOGGER.warning(
-                        "Error initializing streams or reading audio data")
-                elif ans > 0:
-                    _LOGGER.info("Keyword detected, starting recording")
-                    self.recording = True
-                    self.record_buffer.extend(data)
-                    callback = detected_callback[ans-1]
-                    if callback is not None:
-                        callback(data, self)
+        While listening for the hotword the audio is split into fixed size
+        blocks, keeping any remainder for the next chunk, and each block the
+        energy gate lets through is run through the detector. The energy the
+        gate measures also keeps the endpointer's noise floor up to date.
+        Once a hotword is detected the rest of the audio goes straight to the
+        recording.
 
-        _LOGGER.debug("finished.")
+        :param data: raw PCM in the detector's format. It is only read during
+                     the call, anything kept is copied.
+        :return: True if a hotword was detected in this chunk.
+        """
+        self.frames_processed.inc(len(data) // self.ring_buffer.frame_size)
+        if self.echo_gate is not None and \
+                (self.recording or self.gate_detection) and self.echo_gate():
+            self.gated_frames.inc(len(data) // self.ring_buffer.frame_size)
+            return False
+        if self.recording:
+            self.record(data)
+            return False
+
+        self.pending.extend(data)
+        detected = False
+        while not self.recording and len(self.pending) >= self.gate.block_size:
+            block = bytes(self.pending[:self.gate.block_size])
+            del self.pending[:self.gate.block_size]
+            blocks = self.gate.filter(block)
+            self.endpointer.observe_energy(self.gate.frame_rms)
+            for analysed in blocks:
+                if self.recording:
+                    self.record(analysed)
+                elif self.detect(analysed):
+                    detected = True
+        if self.recording and self.pending:
+            data, self.pending = bytes(self.pending), bytearray()
+            self.record(data)
+        return detected
+
+    def record(self, data):
+        """Add audio to the recording, finishing it at the endpoint."""
+        self.record_buffer.extend(data)
+        if self.stream_callback is not None:
+            self.stream_callback(data, self)
+        if self.record_buffer.full:
+            _LOGGER.warning("Stopping recording at the maximum length of "
+                            "%.1f seconds", self.recording_max /
+                            float(self.bytes_per_second))
+            self.truncations += 1
+            self.finish_recording()
+        elif self.endpointer.process(data):
+            _LOGGER.info("Stopping recording after %dms (%s)",
+                         self.endpointer.duration_ms,
+                         self.endpointer.reason)
+            self.finish_recording()
+
+    def detect(self, data):
+        """Run a block of audio through the hotword detector.
+
+        :return: True if a hotword was detected.
+        """
+        start_time = time.time()
+        ans = self.detector.RunDetection(data)
+        self.detection_time.observe(time.time() - start_time)
+        if ans == -1:
+            _LOGGER.warning(
+                "Error initializing streams or reading audio data")
+        elif ans > 0:
+            _LOGGER.info("Keyword detected, starting recording")
+            self.detections.inc()
+            self.gate.reset()
+            self.recording = True
+            self.endpointer.reset()
+            self.record_buffer.extend(data)
+            callback = self.detected_callback[ans-1]
+            if callback is not None:
+                callback(data, self)
+            if self.stream_callback is not None:
+                self.stream_callback(data, self)
+            return True
+        return False
+
+    def finish_recording(self):
+        """Hand over the current recording, if there is one."""
+        if not self.recording:
+            return
+        self.recording = False
+        recording, self.record_buffer = \
+            self.record_buffer, self.new_recording()
+        self.recordings.observe(recording.length /
+                                float(self.bytes_per_second))
+        self.peak_memory = max(self.peak_memory, recording.peak_memory)
+        self.spills += recording.spilled
+        if self.recording_callback is not None:
+            self.recording_callback(recording, self)
+
+    def finish_source(self):
+        """Wake the detection loop once a finite source has ended."""
+        self.source_finished.set()
+        self.ring_buffer.interrupt()
+
+    def replay(self, source=None, detected_callback=None,
+               recording_callback=None, stream_callback=None,
+               chunk_frames=2048):
+        """Push audio through the detector as fast as it can be processed.
+
+        Chunks are read from the source and processed on the calling thread,
+        skipping the ring buffer, until the source ends or `stop` is called.
+        A recording still in progress when the audio ends is finished as if
+        the endpointer had stopped it.
+
+        :param source: the AudioSource to replay, defaults to the detector's
+                       own source.
+        :param int chunk_frames: number of frames to process at a time.
+        :return: dict of the seconds of audio processed, the seconds it took,
+                 the real time factor (how many times faster than real time
+                 the audio was processed) and the number of detections.
+        """
+        # pylint: disable=too-many-arguments
+        source = source or self.source
+        self.set_callbacks(detected_callback, recording_callback,
+                           stream_callback)
+        stats = {"audio_seconds": 0.0, "elapsed": 0.0,
+                 "realtime_factor": 0.0, "detections": 0}
+        start_time = time.time()
+        while not self.stop_event.is_set():
+            data = source.read(chunk_frames)
+            if not data:
+                break
+            stats["audio_seconds"] += source.seconds(data)
+            if self.process(data):
+                stats["detections"] += 1
+        self.finish_recording()
+        stats["elapsed"] = time.time() - start_time
+        if stats["elapsed"] > 0:
+            stats["realtime_factor"] = \
+                stats["audio_seconds"] / stats["elapsed"]
+        return stats
+
+    def stop(self):
+        """Stop the detection loop started with `start`."""
+        self.stop_event.set()
+        self.ring_buffer.interrupt()
 
     def terminate(self):
         """
@@ -234,6 +418,4 @@ class HotwordDetector:
 
         :return: None
         """
-        self.stream_in.stop_stream()
-        self.stream_in.close()
-        self.audio.terminate()
+        self.source.close()
@@ -0,0 +1,368 @@
+"""Audio buffers shared between the capture and detection threads."""
+import io
+import logging
+import mmap
+import tempfile
+import threading
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """Fixed capacity circular buffer to hold PCM audio from PortAudio.
+
+    The buffer is backed by a single preallocated ``bytearray`` with a read
+    and a write index, so audio is never expanded into Python objects. It is
+    designed for one producer (the PortAudio callback) and one consumer (the
+    detection loop), which can block in ``wait`` until audio arrives. When
+    the producer writes faster than the consumer reads the oldest audio is
+    discarded and counted in ``overruns`` and ``bytes_dropped``.
+
+    :param size: capacity in bytes, or ``None`` for a buffer which grows as
+                 needed and never drops audio.
+    :param frame_size: size of one audio frame in bytes. Capacity and reads
+                       are rounded to whole frames.
+    """
+
+    def __init__(self, size=4096, frame_size=2):
+        """Allocate the buffer storage."""
+        self.frame_size = frame_size
+        self.growable = size is None
+        if self.growable:
+            size = 4096
+        size = max(frame_size, size - size % frame_size)
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._scratch = bytearray(size)
+        self._read = 0
+        self._write = 0
+        self._length = 0
+        self._lock = threading.Lock()
+        self._readable = threading.Condition(self._lock)
+        self._interrupted = False
+        self.overruns = 0
+        self.bytes_dropped = 0
+
+    @property
+    def capacity(self):
+        """Get the number of bytes the buffer can hold."""
+        return len(self._buf)
+
+    @property
+    def length(self):
+        """Get the length of the buffer."""
+        return self._length
+
+    def _grow(self, needed):
+        """Reallocate the storage so it can hold `needed` bytes."""
+        size = self.capacity
+        while size < needed:
+            size *= 2
+        data = bytes(self._peek(self._length))
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._scratch = bytearray(size)
+        self._buf[:len(data)] = data
+        self._read = 0
+        self._write = len(data) % size
+
+    def _peek(self, size, copy=False):
+        """Return a view of `size` bytes from the read index.
+
+        :param copy: copy the data into the scratch area even when it is
+                     contiguous, so the producer can't overwrite it.
+        """
+        end = self._read + size
+        if end <= self.capacity and not copy:
+            return self._view[self._read:end]
+        first = min(size, self.capacity - self._read)
+        scratch = memoryview(self._scratch)
+        scratch[:first] = self._view[self._read:self._read + first]
+        scratch[first:size] = self._view[:size - first]
+        return scratch[:size]
+
+    def extend(self, data):
+        """Add data to the end of buffer."""
+        data = memoryview(data).cast('B')
+        size = len(data)
+        if not size:
+            return
+        with self._lock:
+            if self.growable and self._length + size > self.capacity:
+                self._grow(self._length + size)
+            capacity = self.capacity
+            if size > capacity:
+                dropped = self._length + size - capacity
+                data = data[size - capacity:]
+                size = capacity
+                self._read = self._write
+                self._length = 0
+            else:
+                dropped = max(0, self._length + size - capacity)
+                if dropped:
+                    self._read = (self._read + dropped) % capacity
+                    self._length -= dropped
+            if dropped:
+                self.overruns += 1
+                self.bytes_dropped += dropped
+
+            first = min(size, capacity - self._write)
+            self._view[self._write:self._write + first] = data[:first]
+            if first < size:
+                self._view[:size - first] = data[first:]
+            self._write = (self._write + size) % capacity
+            self._length += size
+            if self._length >= self.frame_size:
+                self._readable.notify()
+
+    def wait(self, timeout=None):
+        """Block until there is a whole frame to read.
+
+        :param timeout: maximum seconds to wait, or ``None`` to wait forever.
+        :return: True if there is data to read, False if the wait timed out
+                 or was cut short by `interrupt`.
+        """
+        with self._readable:
+            self._readable.wait_for(
+                lambda: self._interrupted or self._length >= self.frame_size,
+                timeout)
+            self._interrupted = False
+            return self._length >= self.frame_size
+
+    def interrupt(self):
+        """Wake up a consumer blocked in `wait`."""
+        with self._readable:
+            self._interrupted = True
+            self._readable.notify_all()
+
+    def read(self, size=None):
+        """Retrieve whole frames from the beginning of the buffer.
+
+        The data is copied into a preallocated scratch area while the lock
+        is held, as the space it occupied is handed back to the producer
+        straight away. The returned ``memoryview`` is only valid until the
+        next call to ``read`` or ``get`` and should be copied with
+        ``bytes()`` if it needs to be kept.
+
+        :param size: maximum number of bytes to read, defaults to everything.
+        :return: memoryview of the data, empty if there is nothing to read.
+        """
+        with self._lock:
+            available = self._length - self._length % self.frame_size
+            if size is not None:
+                available = min(available, size - size % self.frame_size)
+            view = self._peek(available, copy=True)
+            self._read = (self._read + available) % self.capacity
+            self._length -= available
+            return view
+
+    def get(self):
+        """Retrieve data from the beginning of buffer and clears it."""
+        return bytes(self.read())
+
+    def clear(self):
+        """Discard everything in the buffer."""
+        with self._lock:
+            self._read = self._write
+            self._length = 0
+
+
+class SharedRingBuffer:
+    """Ring buffer in shared memory for passing audio between processes.
+
+    One process writes and another reads. The capacity and the total bytes
+    written, read and dropped are kept as counters at the start of the
+    shared memory, and each side only advances its own counter, so no lock
+    is needed. A chunk which doesn't fit is dropped whole rather than
+    overwriting audio the reader hasn't had yet. Readers are told how much
+    to read by a separate control channel.
+
+    :param int size: capacity in bytes when creating the buffer.
+    :param str name: name of an existing buffer to attach to instead.
+    """
+
+    HEADER = 32  # capacity, written, read, dropped as unsigned 64 bit ints
+
+    def __init__(self, size=None, name=None):
+        """Create or attach to the shared memory."""
+        from multiprocessing import shared_memory
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=self.owner,
+            size=self.HEADER + size if self.owner else 0)
+        self.counters = self.shm.buf[:self.HEADER].cast('Q')
+        if self.owner:
+            self.counters[0] = size
+            self.counters[1] = self.counters[2] = self.counters[3] = 0
+        self.data = self.shm.buf[self.HEADER:self.HEADER + self.capacity]
+        self.closed_dropped = None
+
+    @property
+    def name(self):
+        """Get the name other processes attach with."""
+        return self.shm.name
+
+    @property
+    def capacity(self):
+        """Get the number of bytes the buffer can hold."""
+        return self.counters[0]
+
+    @property
+    def length(self):
+        """Get the number of bytes waiting to be read."""
+        return self.counters[1] - self.counters[2]
+
+    @property
+    def bytes_dropped(self):
+        """Get the number of bytes dropped because the buffer was full."""
+        if self.closed_dropped is not None:
+            return self.closed_dropped
+        return self.counters[3]
+
+    def write(self, data):
+        """Add a chunk to the buffer.
+
+        :return: False if there wasn't room and the chunk was dropped.
+        """
+        data = memoryview(data).cast('B')
+        size = len(data)
+        written = self.counters[1]
+        if size > self.capacity - (written - self.counters[2]):
+            self.counters[3] += size
+            return False
+        start = written % self.capacity
+        first = min(size, self.capacity - start)
+        self.data[start:start + first] = data[:first]
+        self.data[:size - first] = data[first:]
+        self.counters[1] = written + size
+        return True
+
+    def read(self, size):
+        """Copy `size` bytes out of the buffer."""
+        position = self.counters[2]
+        size = min(size, self.counters[1] - position)
+        start = position % self.capacity
+        first = min(size, self.capacity - start)
+        data = bytes(self.data[start:start + first]) + \
+            bytes(self.data[:size - first])
+        self.counters[2] = position + size
+        return data
+
+    def close(self):
+        """Detach from the shared memory, removing it if we created it."""
+        self.closed_dropped = self.counters[3]
+        self.counters.release()
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class Recording:
+    """Hold one recorded utterance without letting it grow without limit.
+
+    Audio is appended to a ``bytearray`` until it reaches `memory_limit`,
+    then everything is moved to an anonymous temp file and later audio is
+    written there. Once `max_size` is reached further audio is dropped and
+    ``full`` is set so the recording can be finished. The finished audio can
+    be read with ``buffer``, which memory-maps the temp file instead of
+    reading it back, or with ``open`` as a file. ``close`` deletes the temp
+    file once nothing needs the audio.
+
+    :param int memory_limit: bytes held in memory before spilling to disk.
+    :param max_size: bytes after which the recording is full, or ``None``.
+    :param int frame_size: size of one audio frame in bytes. Audio is only
+                           dropped in whole frames.
+    :param spill_dir: directory for the temp file, defaults to the system
+                      temp directory.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, memory_limit=512 * 1024, max_size=None, frame_size=2,
+                 spill_dir=None):
+        """Initialise an empty recording."""
+        self.memory_limit = memory_limit
+        self.max_size = None if max_size is None else \
+            max_size - max_size % frame_size
+        self.frame_size = frame_size
+        self.spill_dir = spill_dir
+        self.memory = bytearray()
+        self.file = None
+        self.length = 0
+        self.full = False
+        self.peak_memory = 0
+        self.bytes_dropped = 0
+
+    @property
+    def spilled(self):
+        """Check whether the recording has been moved to disk."""
+        return self.file is not None
+
+    def extend(self, data):
+        """Add audio to the end of the recording, dropping any overflow."""
+        data = memoryview(data).cast('B')
+        size = len(data)
+        if self.max_size is not None and self.length + size > self.max_size:
+            size = self.max_size - self.length
+            self.bytes_dropped += len(data) - size
+            data = data[:size]
+        if self.max_size is not None and self.length + size >= self.max_size:
+            self.full = True
+        if not self.spilled and len(self.memory) + size > self.memory_limit:
+            self.spill()
+        if self.spilled:
+            self.file.write(data)
+        else:
+            self.memory.extend(data)
+            self.peak_memory = max(self.peak_memory, len(self.memory))
+        self.length += size
+
+    def spill(self):
+        """Move the recording into a temp file."""
+        _LOGGER.debug("Recording is longer than %d bytes, moving it to disk.",
+                      self.memory_limit)
+        # pylint: disable=consider-using-with
+        self.file = tempfile.TemporaryFile(dir=self.spill_dir)
+        self.file.write(self.memory)
+        self.memory = bytearray()
+
+    def buffer(self):
+        """Get the recording without copying it.
+
+        The ``bytearray`` must not be extended while the returned view is in
+        use, so this should only be called once the recording is finished.
+
+        :return: memoryview of the memory or of the memory-mapped temp file.
+        """
+        if not self.spilled:
+            return memoryview(self.memory)
+        self.file.flush()
+        if not self.length:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(self.file.fileno(), self.length,
+                                    access=mmap.ACCESS_READ))
+
+    def open(self):
+        """Get a file positioned at the start of the finished recording.
+
+        A spilled recording returns its temp file, otherwise the audio is
+        wrapped in a ``BytesIO``.
+        """
+        if not self.spilled:
+            return io.BytesIO(self.memory)
+        self.file.flush()
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        """Delete the temp file and free the audio held in memory.
+
+        Views already returned by ``buffer`` stay readable.
+        """
+        if self.spilled:
+            self.file.close()
+            self.file = None
+        self.memory = bytearray()
+        self.length = 0
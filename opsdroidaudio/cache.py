@@ -0,0 +1,175 @@
+"""On disk cache of synthesized speech."""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+_LOGGER = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+
+
+def normalize(text):
+    """Normalize text so trivially different responses share audio."""
+    return " ".join(text.split())
+
+
+class SpeechCache:
+    """Content addressed cache of synthesized speech files.
+
+    Files are named after a hash of the engine, voice, language and
+    normalized text which produced them. An index records the size and last
+    use of every file, and the least recently used files are removed once
+    the cache grows beyond `max_bytes`. Files are written to a temporary
+    name and renamed into place, so readers never see partial audio, and
+    files handed out by `get` are not evicted until they are released.
+
+    :param directory: where to store the audio and the index.
+    :param int max_bytes: maximum total size of the cached audio.
+    """
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024):
+        """Open the cache, creating the directory if needed."""
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.in_use = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.index = self.load_index()
+
+    @property
+    def size(self):
+        """Get the total size of the cached audio in bytes."""
+        return sum(entry["size"] for entry in self.index.values())
+
+    @staticmethod
+    def key(engine, voice, language, text):
+        """Get the cache key for some synthesized text."""
+        parts = json.dumps([engine, voice, language, normalize(text)])
+        return hashlib.sha256(parts.encode("utf8")).hexdigest()
+
+    def path(self, key, extension=""):
+        """Get the path of the file for a key."""
+        return os.path.join(self.directory, key + extension)
+
+    def load_index(self):
+        """Read the index, dropping entries whose files have gone."""
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE)) as stream:
+                index = json.load(stream)
+        except (IOError, OSError, ValueError):
+            return {}
+        return {key: entry for key, entry in index.items()
+                if os.path.exists(self.path(key, entry["extension"]))}
+
+    def save_index(self):
+        """Atomically write the index."""
+        handle, path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as stream:
+            json.dump(self.index, stream)
+        os.rename(path, os.path.join(self.directory, INDEX_FILE))
+
+    def get(self, key):
+        """Get the path of a cached file and mark it in use, or None.
+
+        Paths returned by `get` must be passed to `release` when finished.
+        """
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            entry["last_used"] = time.time()
+            self.in_use[key] = self.in_use.get(key, 0) + 1
+            return self.path(key, entry["extension"])
+
+    def release(self, path):
+        """Mark a file returned by `get` as no longer in use."""
+        key = os.path.splitext(os.path.basename(path))[0]
+        with self.lock:
+            if self.in_use.get(key, 0) > 1:
+                self.in_use[key] -= 1
+            else:
+                self.in_use.pop(key, None)
+            self.evict()
+            self.save_index()
+
+    def contains(self, path):
+        """Check whether a path belongs to this cache."""
+        return os.path.dirname(os.path.abspath(path)) == \
+            os.path.abspath(self.directory)
+
+    def get_or_synthesize(self, key, extension, synthesize):
+        """Get cached audio, synthesizing and storing it on a miss.
+
+        :param key: the cache key, see `key`.
+        :param extension: file extension of the synthesized audio.
+        :param synthesize: function taking a path to write the audio to and
+                           returning True if it succeeded.
+        :return: path to the audio which must be released, or None.
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        handle, temp_path = tempfile.mkstemp(dir=self.directory,
+                                             suffix=".tmp" + extension)
+        os.close(handle)
+        try:
+            if not synthesize(temp_path):
+                return None
+            path = self.path(key, extension)
+            os.rename(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self.lock:
+            self.index[key] = {"extension": extension,
+                               "size": os.path.getsize(path),
+                               "last_used": time.time()}
+            self.in_use[key] = self.in_use.get(key, 0) + 1
+            self.evict()
+            self.save_index()
+        return path
+
+    def evict(self):
+        """Remove least recently used files until the cache is small enough.
+
+        Must be called with the lock held.
+        """
+        size = self.size
+        for key, entry in sorted(self.index.items(),
+                                 key=lambda item: item[1]["last_used"]):
+            if size <= self.max_bytes:
+                break
+            if key in self.in_use:
+                continue
+            try:
+                os.remove(self.path(key, entry["extension"]))
+            except OSError:
+                pass
+            del self.index[key]
+            size -= entry["size"]
+            self.stats["evictions"] += 1
+
+    def prewarm(self, phrases, key, extension, synthesize):
+        """Synthesize a list of phrases so they are cached before use.
+
+        :param key: function taking a phrase and returning its cache key.
+        :param synthesize: function taking a phrase and a path to write to.
+        """
+        for phrase in phrases:
+            path = self.get_or_synthesize(
+                key(phrase), extension,
+                lambda path, phrase=phrase: synthesize(phrase, path))
+            if path is not None:
+                self.release(path)
+        _LOGGER.info("Speech cache warmed with %d phrases.", len(phrases))
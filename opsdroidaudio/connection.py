@@ -0,0 +1,285 @@
+"""Connection to opsdroid's websocket connector."""
+import asyncio
+import collections
+import logging
+import random
+import threading
+import time
+
+import aiohttp
+
+from opsdroidaudio.metrics import NULL as NO_METRICS
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Channel:
+    """One websocket to opsdroid with its own queue of outbound messages.
+
+    Opsdroid replies on the websocket a message arrived on, so giving each
+    room its own channel routes responses back to the room which spoke.
+
+    :param connection: the OpsdroidConnection the channel belongs to.
+    :param name: name used in log messages.
+    :param on_message: function called on the event loop thread with each
+                       message from opsdroid.
+    """
+
+    def __init__(self, connection, name, on_message):
+        """Initialise the channel."""
+        self.connection = connection
+        self.name = name
+        self.on_message = on_message
+        self.outbound = collections.deque()
+        self.attempts = 0
+        self.connected = False
+        self.has_outbound = None
+
+    def __str__(self):
+        """Describe the channel in log messages."""
+        return "opsdroid" if self.name is None else \
+            "opsdroid ({})".format(self.name)
+
+    def send(self, text):
+        """Queue a message to send to opsdroid, from any thread."""
+        self.connection.call(self.enqueue, text, time.time())
+
+    def enqueue(self, text, queued_time):
+        """Add a message to the outbound queue on the event loop thread."""
+        if len(self.outbound) >= self.connection.max_queued:
+            self.outbound.popleft()
+            self.connection.dropped.inc()
+            _LOGGER.warning("Outbound queue to %s full, dropping oldest "
+                            "message.", self)
+        self.outbound.append((text, queued_time))
+        if self.has_outbound is not None:
+            self.has_outbound.set()
+
+    def sent(self, text, queued_time):
+        """Record that a message has been sent."""
+        self.connection.send_delay.observe(time.time() - queued_time)
+        _LOGGER.debug("Sent '%s' to %s.", text, self)
+
+    def backoff(self):
+        """Get how long to wait before the next connection attempt."""
+        limit = min(self.connection.max_backoff,
+                    self.connection.min_backoff * 2 ** self.attempts)
+        self.attempts += 1
+        return random.uniform(limit / 2, limit)
+
+    async def run(self, session, stopping):
+        """Connect to opsdroid, reconnecting until stopped."""
+        self.has_outbound = asyncio.Event()
+        if self.outbound:
+            self.has_outbound.set()
+        while not stopping.is_set():
+            try:
+                await self.connect(session, stopping)
+            except (aiohttp.ClientError, OSError,
+                    asyncio.TimeoutError) as error:
+                self.connection.errors.inc()
+                _LOGGER.error("Unable to connect to %s: %s", self, error)
+            except (KeyError, TypeError, ValueError):
+                self.connection.errors.inc()
+                _LOGGER.error("%s returned a bad response.", self)
+            if stopping.is_set():
+                break
+            delay = self.backoff()
+            _LOGGER.info("Reconnecting to %s in %.1f seconds, %d messages "
+                         "queued.", self, delay, len(self.outbound))
+            try:
+                await asyncio.wait_for(stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                self.connection.reconnects.inc()
+
+    async def connect(self, session, stopping):
+        """Open a websocket and use it until it closes or we stop."""
+        async with session.post(self.connection.url, data={}) as response:
+            socket_id = (await response.json(content_type=None))["socket"]
+        url = "{}/{}".format(self.connection.websocket_url, socket_id)
+        async with session.ws_connect(url, heartbeat=30) as websocket:
+            _LOGGER.info("Connected to %s.", self)
+            self.attempts = 0
+            self.connected = True
+            self.connection.channel_connected()
+            tasks = [asyncio.ensure_future(self.read(websocket)),
+                     asyncio.ensure_future(self.write(websocket)),
+                     asyncio.ensure_future(stopping.wait())]
+            try:
+                done, _ = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.connected = False
+                for task in tasks:
+                    task.cancel()
+                await asyncio.wait(tasks)
+            for task in done:
+                task.result()
+        if not stopping.is_set():
+            _LOGGER.info("Websocket to %s closed.", self)
+
+    async def read(self, websocket):
+        """Pass messages from opsdroid on until the websocket closes."""
+        async for message in websocket:
+            if message.type == aiohttp.WSMsgType.TEXT:
+                try:
+                    self.on_message(message.data)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Unable to handle '%s'", message.data)
+            elif message.type == aiohttp.WSMsgType.ERROR:
+                self.connection.errors.inc()
+                _LOGGER.error("Websocket error: %s", websocket.exception())
+                break
+
+    async def write(self, websocket):
+        """Send queued messages in order as they arrive."""
+        while True:
+            while not self.outbound:
+                self.has_outbound.clear()
+                await self.has_outbound.wait()
+            text, queued_time = self.outbound.popleft()
+            try:
+                await websocket.send_str(text)
+            except BaseException:
+                self.outbound.appendleft((text, queued_time))
+                raise
+            self.sent(text, queued_time)
+
+
+class OpsdroidConnection:
+    """Keep websockets to opsdroid open from an asyncio event loop.
+
+    The event loop runs on its own thread with one HTTP session which is
+    shared by every channel and reused for every connection. If a
+    connection drops it is retried with jittered exponential backoff.
+    Messages sent while disconnected wait in a bounded outbound queue,
+    dropping the oldest when full, and are sent in order once the
+    connection is back. `ready` is set once every channel has connected
+    for the first time.
+
+    :param host: opsdroid host.
+    :param port: opsdroid port.
+    :param on_message: if given a default channel is created which passes
+                       messages to this function, see `channel`.
+    :param int max_queued: maximum messages waiting to be sent per channel.
+    :param float min_backoff: seconds to wait before the first retry.
+    :param float max_backoff: maximum seconds to wait between retries.
+    :param metrics: optional Metrics to record connection statistics in.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, host="localhost", port=8080, on_message=None,
+                 max_queued=20, min_backoff=0.5, max_backoff=60,
+                 metrics=None):
+        """Initialise the connection."""
+        self.url = "http://{}:{}/connector/websocket".format(host, port)
+        self.websocket_url = "ws://{}:{}/connector/websocket".format(
+            host, port)
+        self.max_queued = max_queued
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.channels = []
+        self.ready = threading.Event()
+        self.loop = None
+        self.thread = None
+        self.stopping = None
+
+        metrics = metrics or NO_METRICS
+        self.reconnects = metrics.counter(
+            "websocket_reconnects_total", "Attempts to reconnect to opsdroid.")
+        self.errors = metrics.counter(
+            "websocket_errors_total", "Errors connecting to opsdroid.")
+        self.dropped = metrics.counter(
+            "outbound_dropped_total",
+            "Messages dropped because the outbound queue was full.")
+        self.send_delay = metrics.histogram(
+            "outbound_delay_seconds",
+            "Time messages waited in the outbound queue.")
+        metrics.gauge("outbound_queue_depth", "Messages waiting to be sent.",
+                      lambda: sum(len(channel.outbound)
+                                  for channel in self.channels))
+
+        self.default = None
+        if on_message is not None:
+            self.default = self.channel(None, on_message)
+
+    def channel(self, name, on_message):
+        """Add a channel, which must be done before `start`."""
+        channel = Channel(self, name, on_message)
+        self.channels.append(channel)
+        return channel
+
+    def channel_connected(self):
+        """Set `ready` once every channel has connected."""
+        if all(channel.connected for channel in self.channels):
+            self.ready.set()
+
+    @property
+    def connected(self):
+        """Check whether the default channel is connected."""
+        return self.default.connected
+
+    @property
+    def outbound(self):
+        """Get the messages waiting on the default channel."""
+        return self.default.outbound
+
+    def send(self, text):
+        """Queue a message on the default channel, from any thread."""
+        self.default.send(text)
+
+    def backoff(self):
+        """Get the next retry delay of the default channel."""
+        return self.default.backoff()
+
+    def call(self, function, *args):
+        """Call a function on the event loop thread."""
+        if self.thread is None:
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def start(self):
+        """Start the event loop thread and connect."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run_loop(self):
+        """Run the event loop until the connection is stopped."""
+        asyncio.set_event_loop(self.loop)
+        self.stopping = asyncio.Event()
+        try:
+            self.loop.run_until_complete(self.run())
+        finally:
+            self.loop.close()
+
+    def stop(self, timeout=5):
+        """Disconnect once queued messages are sent or `timeout` passes."""
+        if self.thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(timeout), self.loop)
+        self.thread.join(timeout + 5)
+        self.thread = None
+
+    async def run(self):
+        """Run every channel with a shared session until stopped."""
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*[channel.run(session, self.stopping)
+                                   for channel in self.channels])
+
+    async def shutdown(self, timeout):
+        """Stop once the outbound queues are empty or `timeout` has passed."""
+        deadline = self.loop.time() + timeout
+        while self.loop.time() < deadline and any(
+                channel.outbound and channel.connected
+                for channel in self.channels):
+            await asyncio.sleep(0.05)
+        for channel in self.channels:
+            if channel.outbound:
+                _LOGGER.warning("Discarding %d unsent messages to %s.",
+                                len(channel.outbound), channel)
+        self.stopping.set()
@@ -0,0 +1,165 @@
+"""Convert captured audio into the format the detector expects."""
+import logging
+from math import gcd
+
+import numpy as np
+
+
+_LOGGER = logging.getLogger(__name__)
+
+SCALES = {1: 256.0, 2: 1.0, 3: 1 / 256.0, 4: 32768.0}
+
+
+def decode(data, width):
+    """Decode PCM into samples on the 16 bit scale.
+
+    Widths follow PortAudio: 1 is unsigned 8 bit, 2 is 16 bit, 3 is packed
+    24 bit and 4 is 32 bit float.
+    """
+    if width == 1:
+        return np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128
+    if width == 2:
+        return np.frombuffer(data, dtype=np.int16)
+    if width == 3:
+        packed = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        samples = packed[:, 0].astype(np.int32) | \
+            packed[:, 1].astype(np.int32) << 8 | \
+            packed[:, 2].astype(np.int32) << 16
+        return (samples << 8) >> 8
+    if width == 4:
+        return np.frombuffer(data, dtype=np.float32)
+    raise ValueError("Unsupported sample width {}".format(width))
+
+
+def lowpass_bank(up, down, zero_crossings=8, cutoff=0.9):
+    """Design the polyphase filters for resampling by `up` / `down`.
+
+    A Kaiser windowed sinc low pass filter at the upsampled rate, cutting
+    off below the lower of the two Nyquist frequencies, is split into one
+    filter per phase. Each is reversed so it can be applied to a window of
+    input with a dot product.
+
+    :return: array of `up` filters, one per row.
+    """
+    taps = int(np.ceil(2 * zero_crossings * max(1.0, down / float(up))))
+    length = taps * up
+    frequency = 0.5 * cutoff / max(up, down)
+    times = np.arange(length) - (length - 1) / 2.0
+    window = np.kaiser(length, 8.0)
+    impulse = up * 2 * frequency * np.sinc(2 * frequency * times) * window
+    return impulse.reshape(taps, up).T[:, ::-1].astype(np.float32).copy()
+
+
+class Converter:
+    """Down-mix and resample audio into 16 bit mono at the detector's rate.
+
+    Channels are combined with a weight each, which averages them by
+    default. `channel` picks a single one instead, and `weights` can be
+    used for a fixed beam from a microphone array. Resampling uses a
+    polyphase windowed sinc filter evaluated for a whole chunk at a time
+    with NumPy. Filter history is carried between chunks so they join up
+    seamlessly, and the working buffer is reused while chunks stay the same
+    size.
+
+    :param int in_rate: sample rate the audio is captured at.
+    :param int in_channels: number of interleaved captured channels.
+    :param int in_width: bytes per captured sample, see `decode`.
+    :param int out_rate: sample rate the detector expects.
+    :param channel: "mix" to average the channels, or the index of one.
+    :param weights: optional gain for each channel, overriding `channel`.
+    :param int zero_crossings: length of the resampling filter either side
+                               of its centre. Longer filters are sharper
+                               but slower.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, in_rate, in_channels=1, in_width=2, out_rate=16000,
+                 channel="mix", weights=None, zero_crossings=8):
+        """Design the filters."""
+        self.in_rate = in_rate
+        self.in_channels = in_channels
+        self.in_width = in_width
+        self.out_rate = out_rate
+        if weights is None:
+            weights = np.zeros(in_channels)
+            if channel == "mix":
+                weights[:] = 1.0 / in_channels
+            else:
+                weights[int(channel)] = 1.0
+        elif len(weights) != in_channels:
+            raise ValueError("Expected {} channel weights, got {}".format(
+                in_channels, len(weights)))
+        self.weights = np.asarray(weights, dtype=np.float32) * \
+            SCALES[in_width]
+        divisor = gcd(in_rate, out_rate)
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.bank = lowpass_bank(self.up, self.down, zero_crossings)
+        self.history = self.bank.shape[1] - 1
+        self.buffer = np.zeros(self.history + 4096, dtype=np.float32)
+        self.filled = self.history
+        self.position = 0
+        _LOGGER.debug("Converting %dHz %d channel audio to %dHz mono.",
+                      in_rate, in_channels, out_rate)
+
+    @property
+    def resampling(self):
+        """Check whether the sample rate is being changed."""
+        return self.up != self.down
+
+    def mix(self, data, out):
+        """Decode a chunk and combine its channels into `out`."""
+        samples = decode(data, self.in_width).reshape(-1, self.in_channels)
+        np.matmul(samples, self.weights, out=out, casting="unsafe")
+
+    def reserve(self, frames):
+        """Make room for `frames` new samples after the filter history."""
+        self.buffer[:self.history] = \
+            self.buffer[self.filled - self.history:self.filled]
+        needed = self.history + frames
+        if len(self.buffer) < needed:
+            buffer = np.zeros(needed, dtype=np.float32)
+            buffer[:self.history] = self.buffer[:self.history]
+            self.buffer = buffer
+        self.filled = needed
+
+    def convert(self, data):
+        """Convert a chunk of whole captured frames.
+
+        :return: 16 bit mono PCM at `out_rate`.
+        """
+        frames = len(data) // (self.in_width * self.in_channels)
+        self.reserve(frames)
+        self.mix(data, self.buffer[self.history:self.filled])
+        if self.resampling:
+            output = self.resample(frames)
+        else:
+            output = self.buffer[self.history:self.filled]
+        return np.clip(np.round(output), -32768, 32767).astype(
+            np.int16).tobytes()
+
+    def resample(self, frames):
+        """Filter the new samples in the buffer down to the output rate."""
+        positions = np.arange(self.position, frames * self.up, self.down)
+        self.position += len(positions) * self.down - frames * self.up
+        stride = self.buffer.strides[0]
+        windows = np.lib.stride_tricks.as_strided(
+            self.buffer, (frames, self.history + 1), (stride, stride),
+            writeable=False)
+        return np.einsum("ij,ij->i", windows[positions // self.up],
+                         self.bank[positions % self.up])
+
+
+def create(capture, rate, channels=1, width=2):
+    """Create a converter from a source's `capture` config section.
+
+    :param capture: dict with the captured `rate`, `channels` and `width`,
+                    and the optional `channel`, `weights` and
+                    `zero_crossings`.
+    """
+    if channels != 1 or width != 2:
+        raise ValueError("Audio can only be converted to 16 bit mono")
+    capture = dict(capture)
+    return Converter(capture.pop("rate", rate), capture.pop("channels", 1),
+                     capture.pop("width", 2), rate, **capture)
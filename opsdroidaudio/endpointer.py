@@ -0,0 +1,215 @@
+"""Endpointers decide when the user has finished speaking."""
+import logging
+import wave
+
+import numpy as np
+
+
+_LOGGER = logging.getLogger(__name__)
+
+THRESHOLD = 3000  # Peak amplitude a frame must reach to count as speech
+SILENCE_MS = 700
+LEADING_MS = 500
+MAX_UTTERANCE_MS = 15000
+
+
+class Endpointer:
+    """Base class for endpointers.
+
+    An endpointer is fed the audio recorded after the hotword and decides
+    when the utterance has ended. All timings are derived from the number of
+    samples processed, so results do not depend on how the audio is chunked
+    or how quickly the detection loop runs.
+
+    :param int sample_rate: sample rate of the audio in Hz.
+    :param int sample_width: bytes per sample, only 16 bit audio is supported.
+    :param int channels: number of interleaved channels.
+    """
+
+    def __init__(self, sample_rate, sample_width=2, channels=1):
+        """Initialise the endpointer."""
+        if sample_width != 2:
+            raise ValueError("Only 16 bit audio is supported")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.samples = 0
+        self.reason = None
+
+    @property
+    def duration_ms(self):
+        """Get the duration of the current utterance in milliseconds."""
+        return 1000.0 * self.samples / self.sample_rate
+
+    def samples_to_ms(self, samples):
+        """Convert a number of samples into milliseconds."""
+        return 1000.0 * samples / self.sample_rate
+
+    def ms_to_samples(self, millis):
+        """Convert milliseconds into a number of samples."""
+        return int(self.sample_rate * millis / 1000)
+
+    def to_samples(self, data):
+        """Convert raw PCM bytes into a mono array of samples."""
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.channels > 1:
+            samples = samples[:len(samples) - len(samples) % self.channels]
+            samples = samples.reshape(-1, self.channels).mean(
+                axis=1, dtype=np.float32)
+        return samples
+
+    def reset(self):
+        """Start a new utterance."""
+        self.samples = 0
+        self.reason = None
+
+    def observe_energy(self, rms):
+        """Look at the RMS of frames heard while not recording."""
+
+    def process(self, data):
+        """Process recorded audio, return True when the utterance has ended."""
+        raise NotImplementedError
+
+
+class EnergyEndpointer(Endpointer):
+    """End utterances after a period of low energy audio.
+
+    Audio is split into frames and the RMS and peak energy of every frame is
+    calculated with NumPy. A frame counts as speech when its peak reaches
+    `threshold` and its RMS is `margin` times above the noise floor. The
+    noise floor follows the quietest frames, falling quickly and rising
+    slowly, so a constant background noise such as a fan or a TV stops
+    holding recordings open.
+
+    :param int frame_ms: length of an analysis frame.
+    :param int threshold: minimum peak amplitude of a speech frame.
+    :param float margin: how far above the noise floor speech must be.
+    :param int silence_ms: silence required before the utterance ends.
+    :param int leading_ms: time after the hotword before ending is allowed.
+    :param int max_utterance_ms: utterances are always ended at this length.
+    :param float floor_rise: rate the noise floor rises per frame.
+    :param float floor_fall: rate the noise floor falls per frame.
+    :param float min_floor: lowest RMS the noise floor can fall to.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, sample_rate, sample_width=2, channels=1,
+                 frame_ms=10, threshold=THRESHOLD, margin=3.0,
+                 silence_ms=SILENCE_MS, leading_ms=LEADING_MS,
+                 max_utterance_ms=MAX_UTTERANCE_MS,
+                 floor_rise=0.002, floor_fall=0.3, min_floor=50.0):
+        """Initialise the endpointer."""
+        super().__init__(sample_rate, sample_width, channels)
+        self.frame_length = max(1, self.ms_to_samples(frame_ms))
+        self.threshold = threshold
+        self.margin = margin
+        self.silence_samples_needed = self.ms_to_samples(silence_ms)
+        self.leading_samples = self.ms_to_samples(leading_ms)
+        self.max_samples = self.ms_to_samples(max_utterance_ms)
+        self.floor_rise = floor_rise
+        self.floor_fall = floor_fall
+        self.min_floor = min_floor
+        self.noise_floor = None
+        self.silence_samples = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def reset(self):
+        """Start a new utterance."""
+        super().reset()
+        self.silence_samples = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def frame_energy(self, data):
+        """Split audio into whole frames and return their RMS and peak."""
+        samples = np.concatenate((self._pending, self.to_samples(data)))
+        count = len(samples) // self.frame_length
+        self._pending = samples[count * self.frame_length:]
+        frames = samples[:count * self.frame_length].reshape(
+            count, self.frame_length).astype(np.float32)
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        peak = np.max(np.abs(frames), axis=1) if count else rms
+        return rms, peak
+
+    def update_noise_floor(self, rms):
+        """Track the noise floor using the quietest frame."""
+        if not len(rms):  # pylint: disable=len-as-condition
+            return
+        quietest = max(float(np.min(rms)), self.min_floor)
+        if self.noise_floor is None:
+            self.noise_floor = self.min_floor
+        rate = self.floor_fall if quietest < self.noise_floor \
+            else self.floor_rise
+        rate = 1 - (1 - rate) ** len(rms)
+        self.noise_floor += rate * (quietest - self.noise_floor)
+
+    def is_speech(self, rms, peak):
+        """Return a boolean array of which frames contain speech."""
+        floor = self.noise_floor or self.min_floor
+        return (peak >= self.threshold) & (rms >= floor * self.margin)
+
+    def observe_energy(self, rms):
+        """Keep the noise floor up to date while not recording.
+
+        :param rms: RMS of each frame, as measured by the energy gate.
+        """
+        self.update_noise_floor(rms)
+
+    def process(self, data):
+        """Process recorded audio, return True when the utterance has ended."""
+        rms, peak = self.frame_energy(data)
+        speech = self.is_speech(rms, peak)
+        self.update_noise_floor(rms)
+        self.samples += len(rms) * self.frame_length
+
+        if speech.any():
+            trailing = len(speech) - 1 - int(np.flatnonzero(speech)[-1])
+            self.silence_samples = trailing * self.frame_length
+        else:
+            self.silence_samples += len(speech) * self.frame_length
+
+        if self.samples >= self.max_samples:
+            self.reason = "max_length"
+        elif self.samples >= self.leading_samples and \
+                self.silence_samples >= self.silence_samples_needed:
+            self.reason = "silence"
+        return self.reason is not None
+
+
+ENDPOINTERS = {
+    "energy": EnergyEndpointer,
+}
+
+
+def create(config, sample_rate, sample_width=2, channels=1):
+    """Create an endpointer from the `endpointer` config section."""
+    config = dict(config or {})
+    name = config.pop("name", "energy")
+    try:
+        endpointer_class = ENDPOINTERS[name]
+    except KeyError:
+        raise ValueError("Unknown endpointer {}".format(name))
+    return endpointer_class(sample_rate, sample_width, channels, **config)
+
+
+def endpoint_wav(path, config=None, chunk_frames=2048):
+    """Run an endpointer over a wav file as if it had just been recorded.
+
+    :param path: path to a 16 bit PCM wav file.
+    :param config: endpointer config, see `create`.
+    :param chunk_frames: frames to feed the endpointer at a time.
+    :return: tuple of the time in ms the utterance ended and the reason, or
+             ``(None, None)`` if the file ended first.
+    """
+    wav = wave.open(path, 'rb')
+    try:
+        endpointer = create(config, wav.getframerate(), wav.getsampwidth(),
+                            wav.getnchannels())
+        endpointer.reset()
+        while True:
+            data = wav.readframes(chunk_frames)
+            if not data:
+                return None, None
+            if endpointer.process(data):
+                return endpointer.duration_ms, endpointer.reason
+    finally:
+        wav.close()
@@ -1,45 +1,159 @@
-"""Text to speech generator functions."""
+"""Text to speech generator functions.
+
+Speech libraries are imported when a generator is first used rather than
+when this module is, so only the configured generator is loaded.
+"""
 import logging
-import tempfile
+import multiprocessing
+from collections import namedtuple
 from subprocess import call
 import re
 
-from playsound import playsound
-from gtts import gTTS  # pylint: disable=import-error
-
 _LOGGER = logging.getLogger(__name__)
 
+Synthesizer = namedtuple("Synthesizer", ["synthesize", "extension"])
+
+
+URL_PATTERN = re.compile(
+    r'https?:\/\/(?:www\.)?([\w-]+(?:\.[\w-]+)*)\S*?(?=[.,;:!?)]*(?:\s|$))')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+|\s*\n\s*\n\s*')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
 
 def prepare_url(text):
-    """Transform url found in text for better voice understanding."""
-    text = text.replace("/www.", "/")
-    url = re.search(r'(https?:\/\/(\w+.\w+).*)', text)
-    text = text.replace(url.group(1), "a link to {}".format(url.group(2)))
+    """Transform urls found in text for better voice understanding."""
+    return URL_PATTERN.sub(
+        lambda url: "a link to {}".format(url.group(1)), text)
+
+
+def normalize_text(text):
+    """Prepare bot response text to be spoken."""
+    return WHITESPACE_PATTERN.sub(" ", prepare_url(text)).strip()
+
+
+def split_sentences(text, min_length=20):
+    """Split text into chunks of whole sentences which can be spoken alone.
+
+    Sentences shorter than `min_length` characters are joined onto the next
+    one so short fragments don't each pay the cost of synthesis.
+    """
+    chunks = []
+    fragment = ""
+    for sentence in SENTENCE_PATTERN.split(prepare_url(text)):
+        sentence = WHITESPACE_PATTERN.sub(" ", sentence).strip()
+        if not sentence:
+            continue
+        fragment = "{} {}".format(fragment, sentence).strip()
+        if len(fragment) >= min_length:
+            chunks.append(fragment)
+            fragment = ""
+    if fragment:
+        chunks.append(fragment)
+    return chunks
+
+
+def play_files(connection):
+    """Play each path sent over a connection until None is sent."""
+    from playsound import playsound
+    for path in iter(connection.recv, None):
+        try:
+            playsound(path)
+        except Exception as error:  # pylint: disable=broad-except
+            connection.send(str(error))
+        else:
+            connection.send(None)
+
 
-    return text
+class FilePlayer:
+    """Play audio files, such as mp3 speech, in a child process.
 
+    playsound can't be stopped part way through a file, so it runs in a
+    child process which is terminated if playback is cancelled. The same
+    process plays every file until then, rather than one being started
+    for each sentence.
 
-def google(config, text):
-    """Generate speech with Google."""
+    :param cancelled: function which returns True to stop playing.
+    :param float poll: how often in seconds to call `cancelled`.
+    """
+
+    def __init__(self, cancelled, poll=0.02):
+        """Initialise the player, the process is started when needed."""
+        self.cancelled = cancelled
+        self.poll = poll
+        self.process = None
+        self.connection = None
+
+    def start(self):
+        """Start the player process."""
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=play_files,
+                                               args=(child,))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def play(self, path):
+        """Play a file and block until it has finished or is cancelled."""
+        if self.process is None:
+            self.start()
+        self.connection.send(path)
+        while not self.connection.poll(self.poll):
+            if self.cancelled():
+                self.terminate()
+                return
+        try:
+            error = self.connection.recv()
+        except EOFError:
+            self.terminate()
+            raise RuntimeError("Player process exited")
+        if error is not None:
+            raise RuntimeError("Unable to play {}: {}".format(path, error))
+
+    def terminate(self):
+        """Stop the player process immediately."""
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.connection.close()
+            self.process, self.connection = None, None
+
+    def close(self):
+        """Let the player process exit once it is idle."""
+        if self.process is not None:
+            self.connection.send(None)
+            self.process.join(1)
+            self.terminate()
+
+
+def google_synthesize(config, text, path):
+    """Synthesize speech with Google into an mp3 file.
+
+    :return: True if the file was written.
+    """
     # pylint: disable=broad-except
     # gTTS is a poorly written library and only throws broad Exceptions which
     # we need to catch.
+    from gtts import gTTS  # pylint: disable=import-error
     try:
-        speech = gTTS(text=prepare_url(text), lang='en')
+        gTTS(text=text, lang='en').save(path)
     except Exception:
-        speech = None
-    with tempfile.NamedTemporaryFile() as temp:
-        try:
-            speech.write_to_fp(temp)
-            playsound(temp.name)
-        except AttributeError:
-            _LOGGER.error("No sound to play")
+        _LOGGER.error("No sound to play")
+        return False
+    return True
 
 
-def apple_say(config, text):
-    """Generate speech for the `say` command on MacOS."""
-    text = prepare_url(text)
-    try:
-        call(["say", "-v", config["voice"], text])
-    except KeyError:
-        call(["say", text])
+def apple_say_synthesize(config, text, path):
+    """Synthesize speech with the `say` command on MacOS into a wav file.
+
+    :return: True if the file was written.
+    """
+    command = ["say", "-o", path, "--data-format=LEI16@22050"]
+    if "voice" in config:
+        command += ["-v", config["voice"]]
+    return call(command + [text]) == 0
+
+
+SYNTHESIZERS = {
+    "google": Synthesizer(google_synthesize, ".mp3"),
+    "apple_say": Synthesizer(apple_say_synthesize, ".wav"),
+}
@@ -0,0 +1,345 @@
+"""Run the hotword detector in its own process.
+
+Capture and detection share the interpreter, and so the GIL, with
+recognition, speech synthesis and the connection to opsdroid. Busy work in
+any of them delays detection and can make PortAudio drop audio. Running the
+detector in a separate process keeps its latency flat whatever the rest of
+the app is doing.
+
+The process sends the audio of each recording through a shared memory ring
+buffer. Detections, recorded chunks and the end of each recording are
+announced over a pipe with the number of bytes to read from the buffer,
+and the app sends start, stop and terminate commands back.
+"""
+import functools
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+
+from opsdroidaudio import audio, vad
+from opsdroidaudio.buffers import Recording, SharedRingBuffer
+from opsdroidaudio.metrics import NULL as NO_METRICS
+
+
+_LOGGER = logging.getLogger(__name__)
+
+READY_TIMEOUT = 60  # Seconds to wait for the model to load
+ECHO_POLL = 0.01  # Seconds between checks of the echo gate
+
+
+class DetectorFormat:
+    """The audio format of a detector in another process.
+
+    Mirrors the parts of the snowboy detector the rest of the app reads.
+    """
+
+    def __init__(self, rate, channels, bits, hotwords):
+        """Initialise the format."""
+        self.rate = rate
+        self.channels = channels
+        self.bits = bits
+        self.hotwords = hotwords
+
+    def SampleRate(self):  # pylint: disable=invalid-name
+        """Get the sample rate in Hz."""
+        return self.rate
+
+    def NumChannels(self):  # pylint: disable=invalid-name
+        """Get the number of channels."""
+        return self.channels
+
+    def BitsPerSample(self):  # pylint: disable=invalid-name
+        """Get the bits per sample."""
+        return self.bits
+
+    def NumHotwords(self):  # pylint: disable=invalid-name
+        """Get the number of hotwords."""
+        return self.hotwords
+
+
+class DetectorProcess:
+    """Relay a HotwordDetector's events to the app, in the detector process.
+
+    Recorded chunks are written to the ring buffer and announced over the
+    connection, while a thread handles the app's commands. Commands are
+    handled in order, so a stop sent just after a start is never lost.
+
+    :param connection: the detector process's end of the pipe.
+    :param ring: the SharedRingBuffer recorded audio is sent through.
+    :param detector: the HotwordDetector to run.
+    """
+
+    def __init__(self, connection, ring, detector):
+        """Initialise the relay."""
+        self.connection = connection
+        self.ring = ring
+        self.detector = detector
+        self.detected = []
+        self.started = threading.Event()
+        self.stopping = threading.Event()
+        self.terminating = threading.Event()
+
+    def send(self, kind, data, *extra):
+        """Put a chunk in the ring buffer and announce it."""
+        size = len(data)
+        if not self.ring.write(data):
+            _LOGGER.warning("Shared ring buffer full, dropping %d bytes of "
+                            "audio.", size)
+            size = 0
+        self.connection.send((kind, size, time.time()) + extra)
+
+    def detected_callback(self, index, *_):
+        """Send the hotword with the chunk the detector streams next."""
+        self.detected.append(index)
+
+    def stream_callback(self, data, _):
+        """Send the hotword chunk or a recorded chunk."""
+        if self.detected:
+            self.send("detected", data, self.detected.pop())
+        else:
+            self.send("audio", data)
+
+    def recording_callback(self, *_):
+        """Announce the end of a recording."""
+        self.connection.send(("end",))
+
+    def listen(self):
+        """Handle commands from the app."""
+        while True:
+            try:
+                command = self.connection.recv()
+            except (EOFError, OSError):
+                command = "terminate"
+            if command == "start":
+                self.stopping.clear()
+                self.started.set()
+            else:
+                self.stopping.set()
+                self.detector.stop()
+            if command == "terminate":
+                self.terminating.set()
+                self.started.set()
+                return
+
+    def run(self):
+        """Run the detector each time the app starts it until terminated."""
+        threading.Thread(target=self.listen, daemon=True).start()
+        detected_callback = [
+            functools.partial(self.detected_callback, index)
+            for index in range(self.detector.detector.NumHotwords())]
+        while self.started.wait() and not self.terminating.is_set():
+            self.started.clear()
+            self.detector.start(detected_callback=detected_callback,
+                                recording_callback=self.recording_callback,
+                                stream_callback=self.stream_callback,
+                                interrupt_check=self.stopping.is_set,
+                                sleep_time=None)
+            self.connection.send(("finished",))
+
+
+def run_detector(connection, ring_name, kwargs, echo_event=None):
+    """Capture audio and detect hotwords, run in the detector process."""
+    ring = SharedRingBuffer(name=ring_name)
+    if echo_event is not None:
+        kwargs["echo_gate"] = echo_event.is_set
+    try:
+        detector = audio.HotwordDetector(**kwargs)
+    except Exception as error:  # pylint: disable=broad-except
+        connection.send(("error", str(error)))
+        ring.close()
+        return
+    snowboy = detector.detector
+    connection.send(("ready", snowboy.SampleRate(), snowboy.NumChannels(),
+                     snowboy.BitsPerSample(), snowboy.NumHotwords()))
+    try:
+        DetectorProcess(connection, ring, detector).run()
+    except (EOFError, OSError):
+        pass  # The app has gone away
+    finally:
+        detector.terminate()
+        ring.close()
+
+
+class IsolatedDetector:
+    """Drive a HotwordDetector running in another process.
+
+    Has the same `start`, `stop` and `terminate` methods and calls the same
+    callbacks as a HotwordDetector, so a room can use either. The callbacks
+    run on the thread which called `start`. The detector's own metrics stay
+    in its process, but detections, recording lengths, the delay before
+    each event is handled and audio dropped by the ring buffer are recorded.
+
+    :param int ring_kb: size of the shared memory ring buffer. It must hold
+                        at least the chunk a hotword is sent in, which is a
+                        detection block and the energy gate's pre-roll.
+    :param echo_gate: optional function which returns True while the
+                      microphone can hear our own output. It is checked
+                      every `ECHO_POLL` seconds and shared with the
+                      detector process.
+    :param metrics: optional Metrics to record statistics in.
+    :param context: multiprocessing context to start the process with,
+                    defaults to spawning a fresh interpreter.
+    :param kwargs: arguments for the HotwordDetector, which must be
+                   picklable.
+    :raises RuntimeError: before Python 3.8, which has no shared memory.
+    :raises ValueError: if `ring_kb` is too small.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, ring_kb=512, echo_gate=None, metrics=None,
+                 context=None, **kwargs):
+        """Start the detector process and wait for its model to load."""
+        # pylint: disable=too-many-arguments
+        if sys.version_info < (3, 8):
+            raise RuntimeError("detector_process needs Python 3.8 or later, "
+                               "this is {}.{}".format(*sys.version_info))
+        context = context or multiprocessing.get_context("spawn")
+        self.ring = SharedRingBuffer(ring_kb * 1024)
+        self.connection, child = context.Pipe()
+        self.echo_gate = echo_gate
+        self.echo_event = context.Event() if echo_gate is not None else None
+        self.recording_memory = (kwargs.get("recording_config") or {}).get(
+            "memory_kb", 512) * 1024
+        self.process = context.Process(
+            target=run_detector, daemon=True,
+            args=(child, self.ring.name, kwargs, self.echo_event))
+        self.process.start()
+        child.close()
+        self.send_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.recording = None
+        self.detector = self.wait_until_ready()
+        self.check_ring_size(kwargs.get("detection_config"))
+        self.bytes_per_second = self.detector.SampleRate() * \
+            self.detector.NumChannels() * self.detector.BitsPerSample() // 8
+
+        metrics = metrics or NO_METRICS
+        self.detections = metrics.counter(
+            "hotwords_detected_total", "Hotwords detected.")
+        self.recordings = metrics.histogram(
+            "recording_seconds", "Length of recorded utterances.",
+            buckets=(0.5, 1, 2, 3, 5, 8, 13, 20))
+        self.delay = metrics.histogram(
+            "detector_process_delay_seconds",
+            "Time from the detector process sending an event until it is "
+            "handled.", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+        metrics.counter("detector_process_dropped_bytes_total",
+                        "Recorded audio dropped because the shared ring "
+                        "buffer was full.", lambda: self.ring.bytes_dropped)
+
+    def wait_until_ready(self):
+        """Wait for the detector process to load its model."""
+        if not self.connection.poll(READY_TIMEOUT):
+            self.terminate()
+            raise RuntimeError("Detector process did not start")
+        message = self.connection.recv()
+        if message[0] == "error":
+            self.terminate()
+            raise RuntimeError("Detector process failed to start: {}".format(
+                message[1]))
+        return DetectorFormat(*message[1:])
+
+    def check_ring_size(self, detection_config):
+        """Make sure the ring buffer can hold the chunk with a hotword."""
+        gate = vad.create(detection_config, self.detector.SampleRate(),
+                          self.detector.BitsPerSample() // 8,
+                          self.detector.NumChannels())
+        needed = gate.block_size * (gate.preroll.maxlen + 1)
+        if self.ring.capacity < needed:
+            self.terminate()
+            raise ValueError("ring_kb must be at least {} to hold a "
+                             "detection block and its pre-roll".format(
+                                 -(-needed // 1024)))
+
+    def start(self, detected_callback=None, recording_callback=None,
+              stream_callback=None, **_):
+        """Start detecting and call the callbacks until stopped.
+
+        :param detected_callback: a function or list of functions, one per
+                                  hotword.
+        :param recording_callback: function called with the finished
+                                   Recording.
+        :param stream_callback: function called with each recorded chunk.
+        """
+        if not isinstance(detected_callback, list):
+            detected_callback = [detected_callback] * \
+                self.detector.NumHotwords()
+        self.stopping.clear()
+        echo_thread = None
+        if self.echo_gate is not None:
+            echo_thread = threading.Thread(target=self.share_echo_gate,
+                                           daemon=True)
+            echo_thread.start()
+        self.send("start")
+        try:
+            while True:
+                message = self.connection.recv()
+                if message[0] == "finished":
+                    break
+                self.handle(message, detected_callback, recording_callback,
+                            stream_callback)
+        except (EOFError, OSError):
+            _LOGGER.error("Detector process exited unexpectedly.")
+        self.stopping.set()
+        if echo_thread is not None:
+            echo_thread.join()
+
+    def handle(self, message, detected_callback, recording_callback,
+               stream_callback):
+        """Handle one event from the detector process."""
+        kind = message[0]
+        if kind == "end":
+            recording, self.recording = self.recording, None
+            if recording is None:
+                return
+            self.recordings.observe(recording.length /
+                                    float(self.bytes_per_second))
+            if recording_callback is not None:
+                recording_callback(recording, self)
+            return
+        _, size, sent_time = message[:3]
+        self.delay.observe(time.time() - sent_time)
+        data = self.ring.read(size)
+        if kind == "detected":
+            self.detections.inc()
+            self.recording = Recording(self.recording_memory)
+            callback = detected_callback[message[3]]
+            if callback is not None:
+                callback(data, self)
+        if self.recording is not None:
+            self.recording.extend(data)
+        if stream_callback is not None:
+            stream_callback(data, self)
+
+    def share_echo_gate(self):
+        """Copy the echo gate into the detector process until stopped."""
+        while not self.stopping.wait(ECHO_POLL):
+            if self.echo_gate():
+                self.echo_event.set()
+            else:
+                self.echo_event.clear()
+
+    def send(self, command):
+        """Send a command to the detector process, if it is still running."""
+        with self.send_lock:
+            try:
+                self.connection.send(command)
+            except (EOFError, OSError):
+                pass
+
+    def stop(self):
+        """Stop the detection loop started with `start`."""
+        self.stopping.set()
+        self.send("stop")
+
+    def terminate(self):
+        """Stop the detector process and release the shared memory."""
+        self.send("terminate")
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+        self.ring.close()
@@ -0,0 +1,325 @@
+"""Counters and histograms for the audio pipeline."""
+import bisect
+import collections
+import json
+import logging
+import os
+import tempfile
+import threading
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+_LOGGER = logging.getLogger(__name__)
+
+PREFIX = "opsdroidaudio_"
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """A value which only goes up.
+
+    :param function: optional function returning the current value, for
+                     counts which are already kept elsewhere.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, description, function=None, labels=""):
+        """Initialise the counter."""
+        self.name = name
+        self.description = description
+        self.function = function
+        self.labels = labels
+        self._value = 0
+
+    @property
+    def value(self):
+        """Get the current value."""
+        if self.function is not None:
+            return self.function()
+        return self._value
+
+    def inc(self, amount=1):
+        """Increase the counter."""
+        self._value += amount
+
+    def samples(self):
+        """Get the (suffix, labels, value) samples to export."""
+        return [("", self.labels, self.value)]
+
+    def snapshot(self):
+        """Get the value to dump as JSON."""
+        return self.value
+
+
+class Gauge(Counter):
+    """A value which can go up and down, such as a queue depth."""
+
+    kind = "gauge"
+
+    def set(self, value):
+        """Set the gauge."""
+        self._value = value
+
+
+class Histogram:
+    """Count observations, such as durations, into buckets.
+
+    :param buckets: upper bounds of the buckets in increasing order.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets=TIME_BUCKETS, labels=""):
+        """Initialise the histogram."""
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Record an observation."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Get the cumulative bucket, sum and count samples to export."""
+        samples = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            samples.append(("_bucket", "{{{}le=\"{}\"}}".format(
+                self.labels[1:-1] + "," if self.labels else "", bound), total))
+        samples.append(("_sum", self.labels, self.sum))
+        samples.append(("_count", self.labels, self.count))
+        return samples
+
+    def snapshot(self):
+        """Get the count, sum and mean to dump as JSON."""
+        return {"count": self.count, "sum": self.sum,
+                "mean": self.sum / self.count if self.count else 0.0}
+
+
+class NullMetric:
+    """A metric which ignores everything, used when metrics are disabled."""
+
+    value = 0
+
+    def inc(self, amount=1):
+        """Do nothing."""
+
+    def set(self, value):
+        """Do nothing."""
+
+    def observe(self, value):
+        """Do nothing."""
+
+
+NULL_METRIC = NullMetric()
+
+
+class Metrics:
+    """A registry of metrics.
+
+    Components take a `Metrics` and register the metrics they keep when
+    they are created. Updates are not locked, as with the other stats kept
+    in this package a lost update under contention is acceptable.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        """Initialise the registry."""
+        self.metrics = collections.OrderedDict()
+
+    def add(self, metric):
+        """Register a metric, or get the one already using its name."""
+        return self.metrics.setdefault(metric.name + metric.labels, metric)
+
+    def counter(self, name, description, function=None, labels=""):
+        """Get a Counter."""
+        return self.add(Counter(PREFIX + name, description, function,
+                                labels))
+
+    def gauge(self, name, description, function=None, labels=""):
+        """Get a Gauge."""
+        return self.add(Gauge(PREFIX + name, description, function, labels))
+
+    def histogram(self, name, description, buckets=TIME_BUCKETS, labels=""):
+        """Get a Histogram."""
+        return self.add(Histogram(PREFIX + name, description, buckets,
+                                  labels))
+
+    def labelled(self, **labels):
+        """Get a view of the registry which labels the metrics added to it.
+
+        Components which are created more than once, such as a detector per
+        room, register their metrics through a view so each has its own.
+        """
+        return LabelledMetrics(self, "{{{}}}".format(",".join(
+            "{}=\"{}\"".format(name, value)
+            for name, value in sorted(labels.items()))))
+
+    def render(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        families = collections.OrderedDict()
+        for metric in self.metrics.values():
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, family in families.items():
+            lines.append("# HELP {} {}".format(name, family[0].description))
+            lines.append("# TYPE {} {}".format(name, family[0].kind))
+            for metric in family:
+                for suffix, labels, value in metric.samples():
+                    lines.append("{}{}{} {}".format(name, suffix, labels,
+                                                    value))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Get the metrics as a dict which can be dumped as JSON."""
+        return {name[len(PREFIX):]: metric.snapshot()
+                for name, metric in self.metrics.items()}
+
+
+class LabelledMetrics(Metrics):
+    """A view of a registry which adds labels to every metric."""
+
+    def __init__(self, parent, labels):
+        """Initialise the view."""
+        super().__init__()
+        self.parent = parent
+        self.labels = labels
+        self.enabled = parent.enabled
+        self.metrics = parent.metrics
+
+    def add(self, metric):
+        """Label the metric and register it with the parent."""
+        metric.labels = self.labels
+        return self.parent.add(metric)
+
+
+class NullMetrics(Metrics):
+    """A registry which hands out metrics that do nothing."""
+
+    enabled = False
+
+    def add(self, metric):
+        """Discard the metric."""
+        return NULL_METRIC
+
+    def labelled(self, **labels):
+        """Get the same registry, labels are discarded too."""
+        return self
+
+
+NULL = NullMetrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve the metrics in the Prometheus text format."""
+
+    def do_GET(self):
+        """Render the metrics."""
+        # pylint: disable=invalid-name
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Log requests at debug level."""
+        # pylint: disable=redefined-builtin
+        _LOGGER.debug(format, *args)
+
+
+class MetricsServer:
+    """Serve `/metrics` over HTTP from a background thread.
+
+    :param metrics: the Metrics to serve.
+    :param int port: port to listen on.
+    """
+
+    def __init__(self, metrics, host="localhost", port=9100):
+        """Start listening."""
+        self.server = HTTPServer((host, port), MetricsHandler)
+        self.server.metrics = metrics
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        """Start serving."""
+        self.thread.start()
+        _LOGGER.info("Serving metrics on http://%s:%d/metrics",
+                     *self.server.server_address[:2])
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JsonDumper:
+    """Periodically write the metrics to a JSON file.
+
+    :param metrics: the Metrics to dump.
+    :param path: file to write, replaced atomically each time.
+    :param float interval: seconds between dumps.
+    """
+
+    def __init__(self, metrics, path, interval=60):
+        """Initialise the dumper."""
+        self.metrics = metrics
+        self.path = os.path.expanduser(path)
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.dump_loop)
+        self.thread.daemon = True
+
+    def start(self):
+        """Start dumping."""
+        self.thread.start()
+
+    def stop(self):
+        """Stop dumping, writing the metrics one last time."""
+        self.stopping.set()
+        self.thread.join(5)
+
+    def dump(self):
+        """Write the metrics."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as stream:
+            json.dump(self.metrics.snapshot(), stream, indent=2,
+                      sort_keys=True)
+        os.rename(path, self.path)
+
+    def dump_loop(self):
+        """Dump the metrics every `interval` seconds until stopped."""
+        while not self.stopping.wait(self.interval):
+            self.dump()
+        self.dump()
+
+
+def create_exporters(config, metrics):
+    """Create the exporters configured in the `metrics` config section."""
+    exporters = []
+    if config.get("port") is not None:
+        exporters.append(MetricsServer(
+            metrics, config.get("host", "localhost"), config["port"]))
+    if config.get("json_file") is not None:
+        exporters.append(JsonDumper(metrics, config["json_file"],
+                                    config.get("interval", 60)))
+    return exporters
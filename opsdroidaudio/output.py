@@ -0,0 +1,353 @@
+"""Audio output engine."""
+import collections
+import logging
+import threading
+import time
+import wave
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+import numpy as np
+
+from opsdroidaudio import convert, sources
+
+
+_LOGGER = logging.getLogger(__name__)
+
+STOP = object()
+CUE = object()
+
+Sound = collections.namedtuple("Sound", ["data", "rate", "channels", "width"])
+
+
+def load_wav(path):
+    """Decode a wav file into a Sound held in memory."""
+    wav = wave.open(path, 'rb')
+    try:
+        return Sound(wav.readframes(wav.getnframes()), wav.getframerate(),
+                     wav.getnchannels(), wav.getsampwidth())
+    finally:
+        wav.close()
+
+
+class Sink:
+    """Base class for somewhere to send audio."""
+
+    def write(self, data, rate, channels, width):
+        """Play raw PCM data, blocking until it has been accepted."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the sink."""
+
+
+class PyAudioSink(Sink):
+    """Play audio on the sound card through one long lived PyAudio stream.
+
+    The stream is opened once, as 16 bit mono at a fixed rate. Sounds in
+    any other format are converted as they are written, so switching
+    between cues and speech never reopens the stream.
+
+    :param int device: index of the output device, defaults to the system
+                       default.
+    :param int rate: sample rate of the stream, defaults to the device's
+                     own rate.
+    """
+
+    def __init__(self, device=None, rate=None):
+        """Initialise PyAudio and open the output stream."""
+        import pyaudio
+        with sources.PORTAUDIO_LOCK:
+            self.audio = pyaudio.PyAudio()
+            if rate is None:
+                info = self.audio.get_default_output_device_info() \
+                    if device is None else \
+                    self.audio.get_device_info_by_index(device)
+                rate = int(info["defaultSampleRate"])
+            self.stream = self.audio.open(
+                format=pyaudio.paInt16, channels=1, rate=rate, input=False,
+                output=True, output_device_index=device)
+        self.rate = rate
+        self.converters = {}
+
+    def convert(self, data, rate, channels, width):
+        """Convert PCM data into the stream's format."""
+        if (rate, channels, width) == (self.rate, 1, 2):
+            return bytes(data)
+        key = (rate, channels, width)
+        if key not in self.converters:
+            self.converters[key] = convert.Converter(
+                rate, channels, width, self.rate)
+        return self.converters[key].convert(data)
+
+    def write(self, data, rate, channels, width):
+        """Play raw PCM data on the output stream."""
+        self.stream.write(self.convert(data, rate, channels, width))
+
+    def close(self):
+        """Close the output stream and PyAudio."""
+        self.stream.stop_stream()
+        self.stream.close()
+        with sources.PORTAUDIO_LOCK:
+            self.audio.terminate()
+
+
+class NullSink(Sink):
+    """Discard audio, optionally taking as long as it would to play it.
+
+    :param bool realtime: sleep for the duration of the audio written.
+    """
+
+    def __init__(self, realtime=False):
+        """Initialise the sink."""
+        self.realtime = realtime
+        self.bytes_written = 0
+        self.seconds_written = 0.0
+
+    def write(self, data, rate, channels, width):
+        """Count the audio and throw it away."""
+        seconds = len(data) / float(rate * channels * width)
+        self.bytes_written += len(data)
+        self.seconds_written += seconds
+        if self.realtime:
+            time.sleep(seconds)
+
+
+class FileSink(Sink):
+    """Write everything played into a wav file.
+
+    :param path: wav file to create.
+    :param bool realtime: take as long to write audio as it would take to
+                          play, like a sound card.
+    """
+
+    def __init__(self, path, realtime=False):
+        """Initialise the sink."""
+        self.path = path
+        self.realtime = realtime
+        self.wav = None
+        self.format = None
+
+    def write(self, data, rate, channels, width):
+        """Append raw PCM data to the wav file."""
+        if self.wav is None:
+            self.wav = wave.open(self.path, 'wb')
+            self.wav.setframerate(rate)
+            self.wav.setnchannels(channels)
+            self.wav.setsampwidth(width)
+            self.format = (rate, channels, width)
+        elif self.format != (rate, channels, width):
+            raise ValueError("Can't write {} to a {} wav file".format(
+                (rate, channels, width), self.format))
+        self.wav.writeframes(bytes(data))
+        if self.realtime:
+            time.sleep(len(data) / float(rate * channels * width))
+
+    def close(self):
+        """Finish writing the wav file."""
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
+
+
+SINKS = {
+    "pyaudio": PyAudioSink,
+    "null": NullSink,
+    "file": FileSink,
+}
+
+
+def create_sink(config):
+    """Create a sink from the `output` config section."""
+    config = dict(config or {})
+    name = config.pop("sink", "pyaudio")
+    try:
+        sink_class = SINKS[name]
+    except KeyError:
+        raise ValueError("Unknown output sink {}".format(name))
+    return sink_class(**config)
+
+
+class OutputEngine:
+    """Play cues and speech through a single long lived sink.
+
+    Everything is played by one worker thread so callers never block on the
+    sound card. Cue sounds are decoded once when the engine is created. A cue
+    requested while something else is playing is mixed into it if the
+    formats match, otherwise it is played straight afterwards.
+
+    Everything except cues can be cancelled with `cancel`. Sounds are
+    written `chunk_ms` at a time, so the one playing stops within a chunk.
+
+    :param sink: the Sink to play audio on.
+    :param cues: paths of wav files to preload.
+    :param fallback: function used to play files which aren't wav files,
+                     such as mp3 speech. It can call `cancelled` to find out
+                     whether to stop early.
+    :param int chunk_ms: how much audio is written to the sink at a time.
+    """
+
+    def __init__(self, sink, cues=None, fallback=None, chunk_ms=50):
+        """Initialise the engine and preload the cues."""
+        self.sink = sink
+        self.fallback = fallback
+        self.chunk_ms = chunk_ms
+        self.cues = {}
+        for path in cues or []:
+            self.cues[path] = load_wav(path)
+        self.queue = Queue()
+        self.pending_cues = collections.deque()
+        self.thread = None
+        self.generation = 0
+        self.playing = None
+        self.playing_cue = False
+        self.finished_time = 0.0
+
+    def start(self):
+        """Start the playback thread."""
+        self.thread = threading.Thread(target=self.playback_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the playback thread and close the sink."""
+        self.queue.put((STOP, None, self.generation))
+        if self.thread is not None:
+            self.thread.join(5)
+        self.sink.close()
+
+    def get_cue(self, path):
+        """Get a decoded cue, loading it if it wasn't preloaded."""
+        if path not in self.cues:
+            self.cues[path] = load_wav(path)
+        return self.cues[path]
+
+    def play_cue(self, path):
+        """Play a short cue sound without blocking."""
+        self.pending_cues.append(self.get_cue(path))
+        self.queue.put((CUE, None, self.generation))
+
+    def play(self, sound, block=False):
+        """Play a Sound.
+
+        :param block: wait until the sound has finished playing.
+        :return: an Event which is set when the sound has finished.
+        """
+        done = threading.Event()
+        self.queue.put((sound, done, self.generation))
+        if block:
+            done.wait()
+        return done
+
+    def play_file(self, path, block=True):
+        """Play an audio file, decoding wav files directly."""
+        if path.endswith(".wav"):
+            return self.play(load_wav(path), block)
+        if self.fallback is None:
+            raise ValueError("Unable to play {}".format(path))
+        done = threading.Event()
+        self.queue.put((lambda: self.fallback(path), done, self.generation))
+        if block:
+            done.wait()
+        return done
+
+    def cancel(self):
+        """Stop what is playing and discard everything waiting except cues.
+
+        Can be called from any thread.
+        """
+        self.generation += 1
+
+    def cancelled(self):
+        """Check whether the sound being played has been cancelled."""
+        return self.playing is not None and self.playing != self.generation
+
+    def active(self, tail=0.0):
+        """Check whether audio is playing or stopped within `tail` seconds.
+
+        Cues played on their own don't count, so the user can start talking
+        over the ding.
+        """
+        return (self.playing is not None and not self.playing_cue) or \
+            time.time() - self.finished_time < tail
+
+    def playback_loop(self):
+        """Play queued sounds until stopped."""
+        while True:
+            item, done, generation = self.queue.get()
+            if item is STOP:
+                break
+            self.playing = self.generation if item is CUE else generation
+            self.playing_cue = item is CUE
+            try:
+                if item is CUE:
+                    while self.pending_cues:
+                        self.write(self.pending_cues.popleft(),
+                                   cancellable=False)
+                elif self.cancelled():
+                    _LOGGER.debug("Discarding cancelled audio.")
+                elif isinstance(item, Sound):
+                    self.write(item)
+                else:
+                    item()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Unable to play audio")
+            finally:
+                self.playing = None
+                if item is not CUE:
+                    self.finished_time = time.time()
+                if done is not None:
+                    done.set()
+
+    def write(self, sound, cancellable=True):
+        """Write a sound to the sink in chunks, mixing in any new cues.
+
+        If the sound is cancelled it stops at the end of the current chunk,
+        but cues being mixed into it are still finished.
+        """
+        frame_size = sound.channels * sound.width
+        chunk_size = frame_size * int(sound.rate * self.chunk_ms / 1000)
+        mixing = []
+        data = memoryview(sound.data)
+        for offset in range(0, len(data), chunk_size):
+            if cancellable and self.cancelled():
+                _LOGGER.debug("Playback cancelled.")
+                break
+            chunk = data[offset:offset + chunk_size]
+            mixing.extend(self.take_mixable_cues(sound))
+            if mixing:
+                chunk, mixing = self.mix(chunk, mixing)
+            self.sink.write(chunk, sound.rate, sound.channels, sound.width)
+        for cue, offset in mixing:
+            self.sink.write(memoryview(cue.data)[offset:],
+                            cue.rate, cue.channels, cue.width)
+
+    def take_mixable_cues(self, sound):
+        """Take the pending cues which are in the same format as `sound`."""
+        mixable = []
+        if sound.width != 2:
+            return mixable
+        for _ in range(len(self.pending_cues)):
+            cue = self.pending_cues.popleft()
+            if cue[1:] == sound[1:]:
+                mixable.append((cue, 0))
+            else:
+                self.pending_cues.append(cue)
+        return mixable
+
+    @staticmethod
+    def mix(chunk, mixing):
+        """Add cue audio into a chunk, returning the mixed chunk and cues."""
+        mixed = np.frombuffer(chunk, dtype=np.int16).astype(np.int32)
+        remaining = []
+        for cue, offset in mixing:
+            samples = np.frombuffer(cue.data, dtype=np.int16)[
+                offset // 2:offset // 2 + len(mixed)]
+            mixed[:len(samples)] += samples
+            offset += len(samples) * 2
+            if offset < len(cue.data):
+                remaining.append((cue, offset))
+        mixed = np.clip(mixed, -32768, 32767).astype(np.int16)
+        return mixed.tobytes(), remaining
@@ -0,0 +1,259 @@
+"""Bias speech recognition towards the phrases the bot understands.
+
+Recognizers search an open vocabulary by default, although opsdroid only
+acts on a few hundred command phrases. A phrase set is loaded from the
+recognizer's `phrases` config, a file and optionally a URL, such as an
+opsdroid skill which lists its phrases. It is compiled into a Sphinx
+grammar or keyword list and a list of hints for cloud recognizers.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_DIRECTORY = "~/.opsdroidaudio/phrases"
+FETCH_TIMEOUT = 5  # Seconds
+MAX_HINTS = 500  # Google Cloud Speech's limit on phrases per request
+
+
+def normalize(phrase):
+    """Lower case a phrase and remove punctuation other than apostrophes."""
+    return " ".join(re.sub(r"[^\w\s']", " ", phrase.lower()).split())
+
+
+class PhraseSet:
+    """A normalized, sorted and deduplicated set of phrases.
+
+    :param phrases: the phrases, in any case and order.
+    """
+
+    def __init__(self, phrases):
+        """Normalize the phrases."""
+        self.phrases = sorted({normalize(phrase) for phrase in phrases} -
+                              {""})
+
+    def __len__(self):
+        """Get the number of phrases."""
+        return len(self.phrases)
+
+    @property
+    def digest(self):
+        """Get a hash which changes whenever the phrases do."""
+        return hashlib.sha256("\n".join(self.phrases).encode(
+            "utf8")).hexdigest()[:16]
+
+    @property
+    def words(self):
+        """Get every word used in the phrases."""
+        return {word for phrase in self.phrases for word in phrase.split()}
+
+    def restrict(self, vocabulary):
+        """Get the phrases whose words are all in a recognizer's dictionary.
+
+        Sphinx can't load a grammar containing words it can't pronounce.
+        """
+        known = PhraseSet([])
+        known.phrases = [phrase for phrase in self.phrases
+                         if all(word in vocabulary for word in phrase.split())]
+        if len(known) < len(self):
+            _LOGGER.warning("Ignoring %d phrases with words missing from the "
+                            "dictionary: %s", len(self) - len(known),
+                            ", ".join(sorted(self.words - vocabulary)))
+        return known
+
+    def grammar(self):
+        """Get a JSGF grammar which matches exactly one of the phrases."""
+        return "#JSGF V1.0;\ngrammar phrases;\npublic <phrase> = {};\n".format(
+            " |\n    ".join(self.phrases))
+
+    def keywords(self, threshold=1e-20):
+        """Get a Sphinx keyword list which spots any of the phrases."""
+        return "".join("{} /{}/\n".format(phrase, threshold)
+                       for phrase in self.phrases)
+
+    def hints(self):
+        """Get the phrases to send to a cloud recognizer as hints."""
+        if len(self) > MAX_HINTS:
+            _LOGGER.warning("Only sending the first %d of %d phrases as "
+                            "hints.", MAX_HINTS, len(self))
+        return self.phrases[:MAX_HINTS]
+
+
+def read_file(path):
+    """Read one phrase per line, ignoring blank lines and # comments."""
+    with open(os.path.expanduser(path)) as phrase_file:
+        return [line for line in (line.strip() for line in phrase_file)
+                if line and not line.startswith("#")]
+
+
+def fetch(url, cache_directory, timeout=FETCH_TIMEOUT):
+    """Fetch phrases from a URL, falling back to the last ones fetched.
+
+    The response can be a JSON list or one phrase per line.
+    """
+    from urllib.request import urlopen
+    if not os.path.isdir(cache_directory):
+        os.makedirs(cache_directory)
+    path = os.path.join(cache_directory, "fetched-{}.json".format(
+        hashlib.sha256(url.encode("utf8")).hexdigest()[:16]))
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            body = response.read().decode("utf8")
+    except (IOError, OSError) as error:
+        if not os.path.exists(path):
+            _LOGGER.warning("Unable to fetch phrases from %s: %s", url, error)
+            return []
+        _LOGGER.warning("Unable to fetch phrases from %s, using the copy "
+                        "from the last time: %s", url, error)
+        with open(path) as cached:
+            return json.load(cached)
+    try:
+        phrases = json.loads(body)
+    except ValueError:
+        phrases = [line.strip() for line in body.splitlines()]
+    write(path, json.dumps(phrases))
+    return phrases
+
+
+def write(path, contents):
+    """Write a file atomically so readers never see part of it."""
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, "w") as temp_file:
+        temp_file.write(contents)
+    os.replace(temp_path, path)
+
+
+def read_dictionary(path):
+    """Read the words a Sphinx pronunciation dictionary knows."""
+    with open(path) as dictionary:
+        return {line.split()[0].split("(")[0] for line in dictionary
+                if line.strip()}
+
+
+class CompiledPhrases:
+    """A phrase set compiled for each kind of recognizer.
+
+    Compiled files are named after the phrase set's digest, so they are
+    only written the first time a phrase set is seen and a changed set is
+    compiled again.
+
+    :param phrase_set: the PhraseSet to compile.
+    :param directory: where to keep the compiled files.
+    :param dictionary: optional Sphinx dictionary used to drop phrases
+                       Sphinx can't recognize from its grammar.
+    :param str mode: "grammar" to only recognize the phrases, or
+                     "keywords" to spot them in other speech.
+    :param float threshold: detection threshold for keyword spotting.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, phrase_set, directory=CACHE_DIRECTORY,
+                 dictionary=None, mode="grammar", threshold=1e-20):
+        """Initialise the compiled phrases."""
+        if mode not in ("grammar", "keywords"):
+            raise ValueError("Unknown phrase mode {}".format(mode))
+        self.phrase_set = phrase_set
+        self.directory = os.path.expanduser(directory)
+        self.mode = mode
+        self.threshold = threshold
+        self.dictionary = dictionary
+
+    @property
+    def hints(self):
+        """Get the phrase hints for cloud recognizers."""
+        return self.phrase_set.hints()
+
+    def keyword_entries(self):
+        """Get the keyword entries for speech_recognition's Sphinx.
+
+        speech_recognition turns a sensitivity `s` into the threshold
+        ``1e(100s - 110)``, so the sensitivity is worked back from
+        `threshold` to spot keywords the same way as the decoder does.
+        """
+        sensitivity = (math.log10(self.threshold) + 110) / 100.0
+        sensitivity = min(1.0, max(0.0, sensitivity))
+        return [(phrase, sensitivity) for phrase in self.phrase_set.phrases]
+
+    def sphinx_file(self):
+        """Get the path of the compiled Sphinx grammar or keyword list.
+
+        Phrase sets which haven't been seen before are compiled first.
+
+        :return: the path, or None if Sphinx can't say any of the phrases.
+        """
+        phrase_set = self.phrase_set
+        if self.dictionary is not None:
+            phrase_set = phrase_set.restrict(
+                read_dictionary(self.dictionary))
+        if not len(phrase_set):  # pylint: disable=len-as-condition
+            _LOGGER.warning("Sphinx can't say any of the phrases, "
+                            "recognition won't be biased.")
+            return None
+        if self.mode == "grammar":
+            name, contents = phrase_set.digest + ".gram", phrase_set.grammar()
+        else:
+            name = "{}-{}.kws".format(phrase_set.digest, self.threshold)
+            contents = phrase_set.keywords(self.threshold)
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            _LOGGER.info("Compiling %d phrases into %s.", len(phrase_set),
+                         path)
+            write(path, contents)
+        return path
+
+
+LOADED = {}
+LOADED_LOCK = threading.Lock()
+
+
+def load(config, dictionary=None):
+    """Load the recognizer's `phrases` config section.
+
+    Each section is only loaded once per process, or again if its file
+    changes, so phrases aren't read or fetched for every utterance.
+
+    :param config: a list of phrases, or a dict which can have a `list` of
+                   phrases, a `file` with one phrase per line, a `url` to
+                   fetch phrases from, the Sphinx `mode` and `threshold`
+                   and the `cache` directory.
+    :param dictionary: optional Sphinx pronunciation dictionary.
+    :return: CompiledPhrases, or None if there are no phrases.
+    """
+    if not config:
+        return None
+    if isinstance(config, list):
+        config = {"list": config}
+    modified = os.path.getmtime(os.path.expanduser(config["file"])) \
+        if "file" in config else None
+    key = json.dumps([config, dictionary, modified], sort_keys=True)
+    with LOADED_LOCK:
+        if key not in LOADED:
+            LOADED[key] = compile_config(config, dictionary)
+        return LOADED[key]
+
+
+def compile_config(config, dictionary=None):
+    """Read the phrases in a `phrases` config section."""
+    directory = os.path.expanduser(config.get("cache", CACHE_DIRECTORY))
+    phrases = list(config.get("list", []))
+    if "file" in config:
+        phrases += read_file(config["file"])
+    if "url" in config:
+        phrases += fetch(config["url"], directory)
+    phrase_set = PhraseSet(phrases)
+    if not len(phrase_set):  # pylint: disable=len-as-condition
+        _LOGGER.warning("No phrases found, recognition won't be biased.")
+        return None
+    _LOGGER.info("Biasing recognition towards %d phrases.", len(phrase_set))
+    return CompiledPhrases(phrase_set, directory, dictionary,
+                           config.get("mode", "grammar"),
+                           config.get("threshold", 1e-20))
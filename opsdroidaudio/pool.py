@@ -0,0 +1,173 @@
+"""Recognition worker pool."""
+import collections
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import (
+    CancelledError, ThreadPoolExecutor, ProcessPoolExecutor)
+
+from opsdroidaudio.metrics import NULL as NO_METRICS
+
+
+_LOGGER = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+# Executors only take an initializer from Python 3.7
+INITIALIZER_SUPPORTED = sys.version_info >= (3, 7)
+
+
+class RecognitionPool:
+    """Run speech recognition off the detector thread.
+
+    Jobs are run on a pool of worker threads or processes and their results
+    are delivered one at a time, in the order the jobs were submitted, by a
+    separate delivery thread.
+
+    When `max_pending` jobs are already waiting the `overflow` policy
+    decides what happens to a new one. ``drop_oldest`` cancels the oldest
+    job which hasn't started yet, ``drop_newest`` rejects the new job and
+    ``block`` makes `submit` wait for space.
+
+    :param deliver: function called with the result of each job, unless
+                    the job was submitted with its own.
+    :param int workers: number of jobs to run at once.
+    :param int max_pending: maximum jobs submitted but not yet delivered.
+    :param str overflow: the overflow policy.
+    :param str executor: ``thread`` or ``process``. Jobs run in a process
+                         pool must be picklable.
+    :param initializer: function each worker runs when it starts, used to
+                        load a warm recognizer engine per worker. Before
+                        Python 3.7 it is submitted once per worker instead,
+                        which can't guarantee every worker runs it, so jobs
+                        must not rely on it having run.
+    :param initargs: arguments for `initializer`.
+    :param metrics: optional Metrics to record recognition statistics in.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, deliver=None, workers=2, max_pending=4,
+                 overflow="drop_oldest", executor="thread",
+                 initializer=None, initargs=(), metrics=None):
+        """Initialise the pool."""
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy {}".format(overflow))
+        executors = {"thread": ThreadPoolExecutor,
+                     "process": ProcessPoolExecutor}
+        warm = {}
+        if initializer is not None and INITIALIZER_SUPPORTED:
+            warm = {"initializer": initializer, "initargs": initargs}
+        try:
+            self.executor = executors[executor](max_workers=workers, **warm)
+        except KeyError:
+            raise ValueError("Unknown executor {}".format(executor))
+        if initializer is not None and not warm:
+            for _ in range(workers):
+                self.executor.submit(initializer, *initargs)
+        self.deliver = deliver
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.dropped = 0
+        metrics = metrics or NO_METRICS
+        self.recognition_time = metrics.histogram(
+            "recognition_seconds",
+            "Time from submitting a recording until its text is ready.")
+        self.failures = metrics.counter(
+            "recognition_failures_total", "Recordings which failed to be "
+            "recognized.")
+        metrics.counter("recognition_dropped_total",
+                        "Recordings dropped because the queue was full.",
+                        lambda: self.dropped)
+        metrics.gauge("recognition_queue_depth",
+                      "Recordings waiting to be recognized.",
+                      lambda: self.queue_depth)
+        self.thread = threading.Thread(target=self.delivery_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, function, *args, on_drop=None, deliver=None):
+        """Queue a job, returning False if it was dropped.
+
+        :param on_drop: optional function called if the job is dropped by the
+                        overflow policy, to release anything it holds.
+        :param deliver: optional function to deliver this job's result to
+                        instead of the pool's `deliver`.
+        """
+        with self.condition:
+            while len(self.pending) >= self.max_pending:
+                if self.overflow == "block" and not self.stopping:
+                    self.condition.wait()
+                elif self.overflow == "drop_oldest" and self.cancel_oldest():
+                    break
+                else:
+                    self.dropped += 1
+                    _LOGGER.warning("Recognition queue full, dropping "
+                                    "utterance.")
+                    if on_drop is not None:
+                        on_drop()
+                    return False
+            future = self.executor.submit(function, *args)
+            future.submitted = time.time()
+            future.deliver = deliver or self.deliver
+            if on_drop is not None:
+                future.add_done_callback(
+                    lambda future: future.cancelled() and on_drop())
+            self.pending.append(future)
+            self.condition.notify_all()
+            return True
+
+    def cancel_oldest(self):
+        """Cancel the oldest job which hasn't started running."""
+        for future in self.pending:
+            if future.cancel():
+                self.pending.remove(future)
+                self.dropped += 1
+                _LOGGER.warning("Recognition queue full, dropping oldest "
+                                "utterance.")
+                return True
+        return False
+
+    def delivery_loop(self):
+        """Deliver results in the order the jobs were submitted."""
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                future = self.pending[0]
+            try:
+                result = future.result()
+            except CancelledError:
+                pass
+            except Exception:  # pylint: disable=broad-except
+                self.failures.inc()
+                _LOGGER.exception("Recognition failed")
+            else:
+                self.recognition_time.observe(time.time() - future.submitted)
+                try:
+                    future.deliver(result)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Unable to deliver recognition result")
+            with self.condition:
+                if self.pending and self.pending[0] is future:
+                    self.pending.popleft()
+                self.condition.notify_all()
+
+    @property
+    def queue_depth(self):
+        """Get the number of jobs submitted but not yet delivered."""
+        return len(self.pending)
+
+    def stop(self, wait=True):
+        """Stop the pool once the pending jobs have been delivered."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if wait:
+            self.thread.join()
+        self.executor.shutdown(wait=wait)
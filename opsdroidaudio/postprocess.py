@@ -0,0 +1,132 @@
+"""Clean up recorded utterances before they are recognized."""
+import logging
+
+import numpy as np
+
+from opsdroidaudio.endpointer import THRESHOLD
+from opsdroidaudio.metrics import NULL as NO_METRICS
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Postprocessor:
+    """Trim silence from an utterance and normalize its volume.
+
+    Recordings start with the hotword and end with the silence the
+    endpointer waited for, neither of which the recognizer needs. Frames
+    before the first and after the last one whose peak reaches `threshold`
+    are removed, keeping `padding_ms` either side so words are not clipped.
+    The chunk of audio which contained the hotword can also be removed.
+    The volume is then scaled so the loudest sample reaches `peak`.
+
+    Everything is calculated over whole frames with NumPy, so it takes a
+    few milliseconds even for long utterances.
+
+    :param int sample_rate: sample rate of the audio in Hz.
+    :param int sample_width: bytes per sample, only 16 bit audio is supported.
+    :param int channels: number of interleaved channels.
+    :param bool trim: remove leading and trailing silence.
+    :param bool strip_hotword: remove the chunk which contained the hotword.
+    :param int threshold: minimum peak amplitude of a frame which isn't
+                          silence.
+    :param int frame_ms: length of an analysis frame.
+    :param int padding_ms: silence kept either side of the speech.
+    :param bool normalize: scale the volume up or down to `peak`.
+    :param float peak: loudest sample after normalizing, from 0 to 1.
+    :param float max_gain: the most quiet audio will be amplified by.
+    :param metrics: optional Metrics to record the audio saved in.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, sample_rate, sample_width=2, channels=1, *,
+                 trim=True, strip_hotword=False, threshold=THRESHOLD,
+                 frame_ms=10, padding_ms=200, normalize=True, peak=0.7,
+                 max_gain=8.0, metrics=None):
+        """Initialise the postprocessor."""
+        if sample_width != 2:
+            raise ValueError("Only 16 bit audio is supported")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_size = sample_width * channels
+        self.trim = trim
+        self.strip_hotword = strip_hotword
+        self.threshold = threshold
+        self.frame_length = max(1, int(sample_rate * frame_ms / 1000))
+        self.padding = int(sample_rate * padding_ms / 1000)
+        self.normalize = normalize
+        self.peak = peak
+        self.max_gain = max_gain
+
+        metrics = metrics or NO_METRICS
+        self.saved_bytes = metrics.counter(
+            "postprocess_saved_bytes_total",
+            "Bytes of audio trimmed from utterances.")
+        self.saved_seconds = metrics.histogram(
+            "postprocess_saved_seconds",
+            "Seconds of audio trimmed from each utterance.",
+            buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5))
+
+    def seconds(self, size):
+        """Get the duration of `size` bytes of audio in seconds."""
+        return size / float(self.sample_rate * self.frame_size)
+
+    def speech_bounds(self, samples):
+        """Get the first and last sample of the speech in a recording."""
+        mono = np.abs(samples.reshape(-1, self.channels).astype(
+            np.int32)).max(axis=1)
+        count = len(mono) // self.frame_length
+        frames = mono[:count * self.frame_length].reshape(
+            count, self.frame_length)
+        loud = np.flatnonzero(frames.max(axis=1) >= self.threshold) \
+            if count else np.zeros(0, dtype=int)
+        if not len(loud):  # pylint: disable=len-as-condition
+            return 0, len(mono)
+        start = max(0, int(loud[0]) * self.frame_length - self.padding)
+        end = min(len(mono),
+                  (int(loud[-1]) + 1) * self.frame_length + self.padding)
+        return start, end
+
+    def process(self, data, hotword_bytes=0):
+        """Clean up a recorded utterance.
+
+        :param data: raw PCM of the whole recording.
+        :param int hotword_bytes: length of the chunk at the start of the
+                                  recording which contained the hotword.
+        :return: the processed PCM.
+        """
+        original = len(data)
+        # pylint: disable=len-as-condition
+        if self.strip_hotword:
+            data = data[hotword_bytes - hotword_bytes % self.frame_size:]
+        data = data[:len(data) - len(data) % self.frame_size]
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.trim and len(samples):
+            start, end = self.speech_bounds(samples)
+            samples = samples[start * self.channels:end * self.channels]
+        if self.normalize and len(samples):
+            loudest = int(np.max(np.abs(samples.astype(np.int32))))
+            if loudest:
+                gain = min(self.peak * 32767 / loudest, self.max_gain)
+                samples = np.clip(samples * gain, -32768, 32767).astype(
+                    np.int16)
+        processed = samples.tobytes()
+
+        saved = original - len(processed)
+        self.saved_bytes.inc(saved)
+        self.saved_seconds.observe(self.seconds(saved))
+        _LOGGER.debug("Trimmed %.2f of %.2f seconds from the utterance.",
+                      self.seconds(saved), self.seconds(original))
+        return processed
+
+
+def create(config, sample_rate, sample_width=2, channels=1, metrics=None):
+    """Create a postprocessor from the `postprocess` config section.
+
+    :return: a Postprocessor, or None if the section is missing.
+    """
+    if config is None:
+        return None
+    return Postprocessor(sample_rate, sample_width=sample_width,
+                         channels=channels, metrics=metrics, **config)
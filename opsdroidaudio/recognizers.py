@@ -1,21 +1,36 @@
-"""Speech to text recognizer functions."""
+"""Speech to text recognizer functions.
+
+Recognition libraries are imported when a recognizer is first used rather
+than when this module is, so only the configured recognizer is loaded.
+"""
+import base64
+import concurrent.futures
 import logging
+import os
+import time
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
 
-from speech_recognition import Recognizer, AudioData, UnknownValueError
+from opsdroidaudio import phrases
+from opsdroidaudio.metrics import NULL as NO_METRICS
 
 
 _LOGGER = logging.getLogger(__name__)
 
+SAMPLE_RATE = 16000
+
 
 def google_cloud(config, data, sample_rate):
     """Perform speech recognition using Google Cloud."""
+    from speech_recognition import AudioData, Recognizer, UnknownValueError
     audio_data = AudioData(data, sample_rate, 2)
+    bias = phrases.load(config.get("phrases"))
     try:
-        text = Recognizer().recognize_google_cloud(audio_data,
-                                                   credentials_json=None,
-                                                   language="en-GB",
-                                                   preferred_phrases=None,
-                                                   show_all=False)
+        text = Recognizer().recognize_google_cloud(
+            audio_data, credentials_json=None, language="en-GB",
+            preferred_phrases=bias.hints if bias else None, show_all=False)
     except UnknownValueError:
         text = ""
         _LOGGER.warning("No speech found in audio.")
@@ -24,13 +39,511 @@ def google_cloud(config, data, sample_rate):
 
 def sphinx(config, data, sample_rate):
     """Perform speech recognition using sphinx."""
+    from speech_recognition import AudioData, Recognizer, UnknownValueError
     audio_data = AudioData(data, sample_rate, 2)
+    bias = phrases.load(config.get("phrases"))
     try:
-        text = Recognizer().recognize_sphinx(audio_data,
-                                             language="en-US",
-                                             keyword_entries=None,
-                                             show_all=False)
+        text = Recognizer().recognize_sphinx(
+            audio_data, language="en-US",
+            keyword_entries=bias.keyword_entries() if bias else None,
+            show_all=False)
     except UnknownValueError:
         text = ""
         _LOGGER.warning("No speech found in audio.")
     return text
+
+
+RECOGNIZERS = {
+    "google_cloud": google_cloud,
+    "sphinx": sphinx,
+}
+
+
+def load_sphinx_decoder(config, sample_rate):
+    """Load a PocketSphinx decoder with the speech_recognition models.
+
+    If the config has `phrases` the language model is replaced by a grammar
+    or keyword list compiled from them, unless none of them can be said
+    with the dictionary.
+    """
+    # pylint: disable=import-error
+    import speech_recognition
+    from pocketsphinx import pocketsphinx
+    language_directory = os.path.join(
+        os.path.dirname(os.path.realpath(speech_recognition.__file__)),
+        "pocketsphinx-data", config.get("language", "en-US"))
+    decoder_config = pocketsphinx.Decoder.default_config()
+    decoder_config.set_string("-hmm", os.path.join(
+        language_directory, "acoustic-model"))
+    dictionary = os.path.join(language_directory,
+                              "pronounciation-dictionary.dict")
+    bias = phrases.load(config.get("phrases"), dictionary)
+    sphinx_file = bias.sphinx_file() if bias is not None else None
+    if sphinx_file is None:
+        decoder_config.set_string("-lm", os.path.join(
+            language_directory, "language-model.lm.bin"))
+    elif bias.mode == "grammar":
+        decoder_config.set_string("-jsgf", sphinx_file)
+    else:
+        decoder_config.set_string("-kws", sphinx_file)
+    decoder_config.set_string("-dict", dictionary)
+    decoder_config.set_float("-samprate", sample_rate)
+    decoder_config.set_string("-logfn", os.devnull)
+    return pocketsphinx.Decoder(decoder_config)
+
+
+class StreamingRecognizer:
+    """Base class for recognizers which are fed audio as it is recorded.
+
+    Call `start` when an utterance begins, `feed` with each chunk of audio as
+    it arrives and `finish` to get the transcript once it has ended.
+    `partial` returns the best guess so far.
+
+    :param config: the recognizer config section.
+    :param int sample_rate: sample rate of the 16 bit mono audio.
+    """
+
+    def __init__(self, config, sample_rate):
+        """Initialise the recognizer."""
+        self.config = config
+        self.sample_rate = sample_rate
+
+    def start(self):
+        """Begin a new utterance."""
+        raise NotImplementedError
+
+    def feed(self, data):
+        """Add a chunk of audio to the utterance."""
+        raise NotImplementedError
+
+    def partial(self):
+        """Get the transcript of the utterance so far."""
+        return ""
+
+    def finish(self):
+        """End the utterance and return the final transcript."""
+        raise NotImplementedError
+
+    def cancel(self):
+        """End the utterance without recognizing it."""
+
+
+class BatchRecognizer(StreamingRecognizer):
+    """Adapt one of the batch recognizer functions to the streaming interface.
+
+    Audio is buffered until the utterance finishes and then recognized in
+    one go.
+
+    :param function: batch recognizer function such as `sphinx`.
+    :param postprocess: optional function applied to the whole utterance
+                        before it is recognized.
+    """
+
+    def __init__(self, function, config, sample_rate, postprocess=None):
+        """Initialise the recognizer."""
+        super().__init__(config, sample_rate)
+        self.function = function
+        self.postprocess = postprocess
+        self.buffer = bytearray()
+
+    def start(self):
+        """Begin a new utterance."""
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add a chunk of audio to the utterance."""
+        self.buffer.extend(data)
+
+    def finish(self):
+        """Recognize the buffered utterance."""
+        data, self.buffer = bytes(self.buffer), bytearray()
+        if self.postprocess is not None:
+            data = self.postprocess(data)
+        return self.function(self.config, data, self.sample_rate)
+
+    def cancel(self):
+        """Throw away the buffered utterance."""
+        self.buffer = bytearray()
+
+
+class SphinxStreamingRecognizer(StreamingRecognizer):
+    """Decode audio with PocketSphinx while the user is still talking.
+
+    The decoder and its models are loaded the first time an utterance is
+    started and reused afterwards, unless an already loaded decoder is
+    passed in.
+    """
+
+    def __init__(self, config, sample_rate, decoder=None):
+        """Initialise the recognizer."""
+        super().__init__(config, sample_rate)
+        self.decoder = decoder
+
+    def load_decoder(self):
+        """Load the PocketSphinx decoder with the speech_recognition models."""
+        return load_sphinx_decoder(self.config, self.sample_rate)
+
+    def start(self):
+        """Begin a new utterance."""
+        if self.decoder is None:
+            self.decoder = self.load_decoder()
+        self.decoder.start_utt()
+
+    def feed(self, data):
+        """Decode a chunk of audio."""
+        self.decoder.process_raw(bytes(data), False, False)
+
+    def partial(self):
+        """Get the transcript of the utterance so far."""
+        hypothesis = self.decoder.hyp()
+        return hypothesis.hypstr if hypothesis is not None else ""
+
+    def finish(self):
+        """End the utterance and return the final transcript."""
+        self.decoder.end_utt()
+        text = self.partial()
+        if not text:
+            _LOGGER.warning("No speech found in audio.")
+        return text
+
+    def cancel(self):
+        """End the utterance so the decoder can start the next one."""
+        self.decoder.end_utt()
+
+
+class Engine:
+    """A speech recognition engine which is loaded once and reused.
+
+    Engines keep their models and clients in memory between utterances.
+    They are not thread safe, use an `EnginePool` to share them between
+    workers.
+
+    :param config: the recognizer config section.
+    :param int sample_rate: sample rate of the 16 bit mono audio.
+    :param metrics: optional Metrics to record recognition statistics in.
+    """
+
+    def __init__(self, config, sample_rate=SAMPLE_RATE, metrics=None):
+        """Initialise the engine."""
+        self.config = config
+        self.sample_rate = sample_rate
+        self.metrics = metrics or NO_METRICS
+
+    def load(self):
+        """Load models and create clients."""
+
+    def warm_up(self, seconds=0.5):
+        """Recognize a buffer of silence so the first utterance is fast."""
+        start_time = time.time()
+        self.recognize(b"\x00\x00" * int(self.sample_rate * seconds))
+        _LOGGER.debug("Warmed up %s recognizer in %f seconds.",
+                      self.config["name"], time.time() - start_time)
+
+    def recognize(self, data):
+        """Recognize a whole utterance."""
+        raise NotImplementedError
+
+    def stream(self):
+        """Get a StreamingRecognizer which uses this engine."""
+        return BatchRecognizer(lambda config, data, sample_rate:
+                               self.recognize(data),
+                               self.config, self.sample_rate)
+
+
+class SphinxEngine(Engine):
+    """PocketSphinx with its decoder loaded once."""
+
+    def __init__(self, config, sample_rate=SAMPLE_RATE, metrics=None):
+        """Initialise the engine."""
+        super().__init__(config, sample_rate, metrics)
+        self.decoder = None
+
+    def load(self):
+        """Load the acoustic model, language model and dictionary."""
+        self.decoder = load_sphinx_decoder(self.config, self.sample_rate)
+
+    def recognize(self, data):
+        """Recognize a whole utterance."""
+        stream = self.stream()
+        stream.start()
+        self.decoder.process_raw(bytes(data), False, True)
+        return stream.finish()
+
+    def stream(self):
+        """Get a recognizer which decodes while the user is talking."""
+        return SphinxStreamingRecognizer(self.config, self.sample_rate,
+                                         self.decoder)
+
+
+class GoogleCloudEngine(Engine):
+    """Google Cloud Speech with a long lived API client."""
+
+    def __init__(self, config, sample_rate=SAMPLE_RATE, metrics=None):
+        """Initialise the engine."""
+        super().__init__(config, sample_rate, metrics)
+        self.service = None
+        self.bias = None
+
+    def load(self):
+        """Authenticate and build the API client."""
+        # pylint: disable=import-error
+        import google.auth
+        from googleapiclient.discovery import build
+        credentials, _ = google.auth.default(
+            scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        self.service = build("speech", "v1", credentials=credentials,
+                             cache_discovery=False)
+        self.bias = phrases.load(self.config.get("phrases"))
+
+    def warm_up(self, seconds=0.5):
+        """Skip warming up, it would send audio to Google."""
+
+    def recognize(self, data):
+        """Recognize a whole utterance."""
+        from speech_recognition import AudioData
+        flac_data = AudioData(data, self.sample_rate, 2).get_flac_data()
+        config = {"encoding": "FLAC", "sampleRateHertz": self.sample_rate,
+                  "languageCode": self.config.get("language", "en-GB")}
+        if self.bias is not None:
+            config["speechContexts"] = [{"phrases": self.bias.hints}]
+        response = self.service.speech().recognize(body={
+            "audio": {"content": base64.b64encode(flac_data).decode("utf8")},
+            "config": config,
+        }).execute()
+        text = " ".join(result["alternatives"][0]["transcript"].strip()
+                        for result in response.get("results", []))
+        if not text:
+            _LOGGER.warning("No speech found in audio.")
+        return text
+
+
+class FunctionEngine(Engine):
+    """Wrap one of the batch recognizer functions as an engine."""
+
+    def recognize(self, data):
+        """Recognize a whole utterance."""
+        return RECOGNIZERS[self.config["name"]](self.config, data,
+                                                self.sample_rate)
+
+
+class MultiEngine(Engine):
+    """Base class for engines which combine several others.
+
+    The engines are listed under `engines` in the config, each with an
+    optional `timeout` in seconds. An engine which times out keeps running
+    in the background, and is skipped until it has finished so it is never
+    used by two utterances at once. An empty transcript, an error or a
+    timeout all count as the engine failing to recognize the utterance.
+
+    The wins, timeouts, failures and recognition time of each engine are
+    recorded in the metrics with an `engine` label.
+    """
+
+    # pylint: disable=abstract-method
+    # Subclasses decide how the engines' transcripts are combined
+
+    def __init__(self, config, sample_rate=SAMPLE_RATE, metrics=None):
+        """Initialise the engine."""
+        super().__init__(config, sample_rate, metrics)
+        self.engines = []
+        self.timeouts = []
+        self.running = {}
+        self.executor = None
+
+    def load(self):
+        """Load every engine."""
+        for config in self.config["engines"]:
+            config = dict(config)
+            self.timeouts.append(config.pop("timeout", None))
+            self.engines.append(create_engine(config, self.sample_rate,
+                                              warm_up=False,
+                                              metrics=self.metrics))
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            len(self.engines))
+
+    def warm_up(self, seconds=0.5):
+        """Warm up every engine."""
+        for engine in self.engines:
+            engine.warm_up(seconds)
+
+    def engine_metrics(self, engine):
+        """Get the metrics registry labelled for one engine."""
+        return self.metrics.labelled(engine=engine.config["name"])
+
+    def submit(self, engine, data):
+        """Start recognizing with an engine, or return None if it's busy."""
+        future = self.running.get(engine)
+        if future is not None and not future.done():
+            _LOGGER.debug("%s recognizer is still busy, skipping it.",
+                          engine.config["name"])
+            return None
+        future = self.executor.submit(self.timed_recognize, engine, data)
+        self.running[engine] = future
+        return future
+
+    def timed_recognize(self, engine, data):
+        """Recognize with an engine and record how long it took."""
+        start_time = time.time()
+        try:
+            return engine.recognize(data)
+        finally:
+            self.engine_metrics(engine).histogram(
+                "recognizer_seconds",
+                "Time taken by each recognizer.").observe(
+                    time.time() - start_time)
+
+    def result(self, engine, future):
+        """Get the transcript from a finished engine, or "" if it failed."""
+        try:
+            text = future.result()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("%s recognizer failed.", engine.config["name"])
+            self.engine_metrics(engine).counter(
+                "recognizer_failures_total",
+                "Utterances a recognizer raised an error for.").inc()
+            return ""
+        if text:
+            self.engine_metrics(engine).counter(
+                "recognizer_wins_total",
+                "Utterances whose transcript came from a recognizer.").inc()
+            _LOGGER.debug("Transcript from %s recognizer.",
+                          engine.config["name"])
+        return text
+
+    def timed_out(self, engine):
+        """Record that an engine took too long."""
+        _LOGGER.warning("%s recognizer timed out.", engine.config["name"])
+        self.engine_metrics(engine).counter(
+            "recognizer_timeouts_total",
+            "Utterances a recognizer took too long to recognize.").inc()
+
+
+class FallbackEngine(MultiEngine):
+    """Try each engine in order until one recognizes the utterance."""
+
+    def recognize(self, data):
+        """Recognize a whole utterance."""
+        for engine, timeout in zip(self.engines, self.timeouts):
+            future = self.submit(engine, data)
+            if future is None:
+                continue
+            done, _ = concurrent.futures.wait([future], timeout)
+            if not done:
+                self.timed_out(engine)
+                continue
+            text = self.result(engine, future)
+            if text:
+                return text
+        return ""
+
+
+class RaceEngine(MultiEngine):
+    """Run every engine at once and take the first transcript.
+
+    Engines which finish with nothing are ignored while the others keep
+    going, so a fast local engine can answer when the network is slow and
+    a cloud engine can answer when the local one doesn't understand.
+    """
+
+    def recognize(self, data):
+        """Recognize a whole utterance."""
+        start_time = time.time()
+        pending = {}
+        for engine, timeout in zip(self.engines, self.timeouts):
+            future = self.submit(engine, data)
+            if future is not None:
+                pending[future] = (engine, timeout)
+        while pending:
+            deadlines = [start_time + timeout
+                         for _, timeout in pending.values()
+                         if timeout is not None]
+            wait = max(min(deadlines) - time.time(), 0) \
+                if deadlines else None
+            done, _ = concurrent.futures.wait(
+                pending, wait, concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                engine, _ = pending.pop(future)
+                text = self.result(engine, future)
+                if text:
+                    return text
+            for future, (engine, timeout) in list(pending.items()):
+                if timeout is not None and \
+                        time.time() >= start_time + timeout:
+                    del pending[future]
+                    self.timed_out(engine)
+        return ""
+
+
+ENGINES = {
+    "google_cloud": GoogleCloudEngine,
+    "sphinx": SphinxEngine,
+    "fallback": FallbackEngine,
+    "race": RaceEngine,
+}
+
+
+def create_engine(config, sample_rate=SAMPLE_RATE, warm_up=True,
+                  metrics=None):
+    """Create, load and optionally warm up an engine from config."""
+    engine = ENGINES.get(config["name"], FunctionEngine)(config, sample_rate,
+                                                         metrics)
+    engine.load()
+    if warm_up:
+        engine.warm_up()
+    return engine
+
+
+class EnginePool:
+    """A fixed set of loaded engines shared between workers.
+
+    :param factory: function which returns a new loaded engine.
+    :param int size: number of engines to create.
+    """
+
+    def __init__(self, factory, size=1):
+        """Create the engines."""
+        self.engines = Queue()
+        for _ in range(size):
+            self.engines.put(factory())
+
+    def acquire(self, block=True, timeout=None):
+        """Take an engine, returning None if none are free in time."""
+        try:
+            return self.engines.get(block, timeout)
+        except Empty:
+            return None
+
+    def release(self, engine):
+        """Return an engine to the pool."""
+        self.engines.put(engine)
+
+    def recognize(self, data):
+        """Recognize a whole utterance with the next free engine."""
+        engine = self.acquire()
+        try:
+            return engine.recognize(data)
+        finally:
+            self.release(engine)
+
+
+WORKER_ENGINE = None
+WORKER_CONFIG = None
+
+
+def init_worker(config, sample_rate=SAMPLE_RATE):
+    """Load a warm engine in a worker, unless it already has this one."""
+    global WORKER_ENGINE, WORKER_CONFIG
+    if WORKER_ENGINE is None or WORKER_CONFIG != (config, sample_rate):
+        WORKER_ENGINE = create_engine(config, sample_rate)
+        WORKER_CONFIG = (config, sample_rate)
+
+
+def recognize_in_worker(data, config=None, sample_rate=SAMPLE_RATE):
+    """Recognize an utterance with the engine loaded by `init_worker`.
+
+    :param config: optional recognizer config, used to load the engine if
+                   the worker wasn't initialised with it.
+    """
+    if config is not None:
+        init_worker(config, sample_rate)
+    return WORKER_ENGINE.recognize(data)
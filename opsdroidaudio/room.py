@@ -0,0 +1,216 @@
+"""A microphone and speaker in one room."""
+import functools
+import logging
+import threading
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+import opsdroidaudio.audio as audio
+from opsdroidaudio import (
+    generators, isolation, output, postprocess, recognizers, speech)
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Room:
+    """Listen for the hotword and speak responses in one room.
+
+    Every room has its own detector, output and speech worker, and its own
+    channel to opsdroid so responses are spoken in the room which asked.
+    Speech recognition, speech synthesis and the connection to opsdroid are
+    shared between rooms through the app.
+
+    Saying the hotword while the bot is talking stops it and starts a new
+    recording, unless `barge_in` is turned off. The optional `echo_gate`
+    section keeps the bot's own output out of recordings.
+
+    :param app: the OpsdroidAudio the room belongs to.
+    :param name: the name of the room, or None if it is the only one.
+    :param config: the config for the room, which is the top level config
+                   with the room's entry in `rooms` applied on top.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, app, name, config):
+        """Initialise the room."""
+        self.app = app
+        self.name = name
+        self.config = config
+        self.metrics = app.metrics if name is None else \
+            app.metrics.labelled(room=name)
+        self.utterances_sent = self.metrics.counter(
+            "utterances_sent_total", "Recognized utterances sent to opsdroid.")
+        self.responses = self.metrics.counter(
+            "responses_received_total", "Responses received from opsdroid.")
+        self.model = app.load_model(config.get("hotword"))
+        self.speak_queue = Queue()
+        self.channel = app.connection.channel(name, self.receive_text)
+        self.detector = None
+        self.postprocessor = None
+        self.hotword_bytes = 0
+        self.barge_in = config.get("barge_in", True)
+        self.echo_gate = config.get("echo_gate")
+        self.output = None
+        self.player = None
+        self.speech_worker = None
+        self.thread = None
+        self.recognizer = None
+        self.recognizer_engine = None
+
+    def __str__(self):
+        """Describe the room in log messages."""
+        return self.name or "default room"
+
+    @property
+    def sample_rate(self):
+        """Get the sample rate the room records at."""
+        return self.detector.detector.SampleRate()
+
+    def load(self):
+        """Load the hotword model, which can be done while connecting.
+
+        With `detector_process` the detector runs in its own process.
+        """
+        kwargs = {
+            "sensitivity": self.config.get("sensitivity", 0.4),
+            "endpointer_config": self.config.get("endpointer"),
+            "source_config": self.config.get("source"),
+            "gate_detection": (self.echo_gate or {}).get("detection", False),
+            "detection_config": self.config.get("detection"),
+            "recording_config": self.config.get("recording"),
+        }
+        echo_gate = self.hearing_output if self.echo_gate is not None \
+            else None
+        process = self.config.get("detector_process")
+        if process:
+            self.detector = isolation.IsolatedDetector(
+                decoder_model=self.model, echo_gate=echo_gate,
+                metrics=self.metrics,
+                **dict(process if isinstance(process, dict) else {},
+                       **kwargs))
+        else:
+            self.detector = audio.HotwordDetector(
+                self.model, metrics=self.metrics, echo_gate=echo_gate,
+                **kwargs)
+        self.postprocessor = postprocess.create(
+            self.config.get("postprocess"),
+            self.sample_rate,
+            int(self.detector.detector.BitsPerSample() / 8),
+            self.detector.detector.NumChannels(), metrics=self.metrics)
+
+    def start(self):
+        """Start listening and speaking, loading the model if needed."""
+        if self.detector is None:
+            self.load()
+        self.output = output.OutputEngine(
+            output.create_sink(self.config.get("output")),
+            cues=[audio.DETECT_DING, audio.DETECT_DONG])
+        self.player = generators.FilePlayer(self.output.cancelled)
+        self.output.fallback = self.player.play
+        self.output.start()
+        self.speech_worker = speech.SpeechWorker(
+            self.speak_queue, self.app.synthesize_speech,
+            self.output.play_file, cleanup=self.app.remove_speech,
+            split=generators.split_sentences, metrics=self.metrics)
+        self.speech_worker.start()
+        self.thread = threading.Thread(target=self.detector.start, kwargs={
+            "detected_callback": self.detected_callback,
+            "recording_callback": self.recording_callback,
+            "stream_callback": self.stream_callback})
+        self.thread.start()
+        _LOGGER.info("Listening in %s.", self)
+
+    def stop_listening(self):
+        """Stop the detector, waiting for the current chunk to finish."""
+        self.detector.stop()
+        self.thread.join()
+
+    def close(self):
+        """Stop speaking and release the audio devices."""
+        self.speech_worker.stop()
+        self.speech_worker.join()
+        self.output.stop()
+        self.player.close()
+        self.detector.terminate()
+
+    def hearing_output(self):
+        """Check whether the microphone may be hearing our own output."""
+        return self.output is not None and self.output.active(
+            self.echo_gate.get("tail_ms", 200) / 1000.0)
+
+    def interrupt_speech(self):
+        """Stop talking so the user can speak."""
+        if self.speech_worker.busy or self.output.active():
+            _LOGGER.info("Interrupting speech in %s.", self)
+        self.speech_worker.interrupt()
+        self.output.cancel()
+
+    def detected_callback(self, data, detector):
+        """Hotword has been detected."""
+        if self.barge_in:
+            self.interrupt_speech()
+        self.output.play_cue(audio.DETECT_DING)
+        self.hotword_bytes = len(data)
+        if self.app.streaming:
+            self.recognizer_engine = self.app.engines.acquire(block=False)
+            if self.recognizer_engine is not None:
+                self.recognizer = self.recognizer_engine.stream()
+            else:
+                _LOGGER.debug("No idle recognizer, buffering recording.")
+                self.recognizer = recognizers.BatchRecognizer(
+                    lambda config, data, sample_rate:
+                    self.app.engines.recognize(data),
+                    self.app.recognizer_config, self.sample_rate)
+            self.recognizer.start()
+
+    def stream_callback(self, data, detector):
+        """Pass recorded audio to the recognizer as it arrives."""
+        if self.app.streaming:
+            self.recognizer.feed(data)
+
+    def recording_callback(self, recording, detector):
+        """Hand a finished recording to the recognition pool.
+
+        The recording is closed once recognition has what it needs.
+        """
+        self.output.play_cue(audio.DETECT_DONG)
+
+        if self.app.streaming:
+            engine = self.recognizer_engine
+            self.app.recognition_pool.submit(
+                self.app.finish_recognition, self.recognizer, engine,
+                functools.partial(self.postprocess,
+                                  hotword_bytes=self.hotword_bytes),
+                on_drop=functools.partial(self.app.cancel_recognition,
+                                          self.recognizer, engine),
+                deliver=self.send_text)
+            self.recognizer, self.recognizer_engine = None, None
+        else:
+            data = self.postprocess(recording.buffer(), self.hotword_bytes)
+            self.app.recognition_pool.submit(
+                recognizers.recognize_in_worker, bytes(data),
+                self.app.recognizer_config, self.sample_rate,
+                deliver=self.send_text)
+        recording.close()
+
+    def postprocess(self, data, hotword_bytes):
+        """Clean up a recording before it is recognized, if configured."""
+        if self.postprocessor is None:
+            return data
+        return self.postprocessor.process(data, hotword_bytes)
+
+    def send_text(self, user_text):
+        """Send recognized text to opsdroid."""
+        self.channel.send(user_text)
+        self.utterances_sent.inc()
+        _LOGGER.info("User in %s said '%s'", self, user_text)
+
+    def receive_text(self, message):
+        """Speak a message from opsdroid."""
+        _LOGGER.info("Bot says '%s' in %s", message, self)
+        self.responses.inc()
+        self.speak_queue.put(message)
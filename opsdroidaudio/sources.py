@@ -0,0 +1,391 @@
+"""Sources of audio for the hotword detector."""
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import wave
+
+from opsdroidaudio import convert
+
+_LOGGER = logging.getLogger(__name__)
+
+# PortAudio isn't thread safe while it is initialised or opens a stream,
+# and rooms are loaded in parallel.
+PORTAUDIO_LOCK = threading.Lock()
+
+
+class AudioSource:
+    """Base class for somewhere to read audio from.
+
+    Sources produce raw PCM in the format given when they are created. They
+    can be read from directly with `read`, or `start` can be used to push
+    chunks to a callback from a background thread.
+
+    :param int rate: sample rate in Hz.
+    :param int channels: number of interleaved channels.
+    :param int width: bytes per sample.
+    :param bool realtime: if True `start` delivers audio no faster than it
+                          would be recorded. Live sources are paced by the
+                          audio arriving so don't need this.
+    """
+
+    def __init__(self, rate, channels=1, width=2, realtime=False):
+        """Initialise the source."""
+        self.rate = rate
+        self.channels = channels
+        self.width = width
+        self.realtime = realtime
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @property
+    def frame_size(self):
+        """Get the number of bytes in one frame."""
+        return self.channels * self.width
+
+    def seconds(self, data):
+        """Get the duration of some audio in seconds."""
+        return len(data) / float(self.rate * self.frame_size)
+
+    def read(self, frames):
+        """Read up to `frames` frames, returning b"" once the source ends."""
+        raise NotImplementedError
+
+    def start(self, callback, finished=None, chunk_frames=2048):
+        """Call `callback` with each chunk of audio from a worker thread.
+
+        :param callback: function called with each chunk of PCM.
+        :param finished: optional function called once the source ends.
+        :param int chunk_frames: number of frames to read at a time.
+        """
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.feed, args=(callback, finished, chunk_frames))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def feed(self, callback, finished, chunk_frames):
+        """Read the source until it ends or is stopped."""
+        start_time = time.time()
+        seconds = 0.0
+        try:
+            while not self.stopping.is_set():
+                data = self.read(chunk_frames)
+                if not data:
+                    break
+                callback(data)
+                seconds += self.seconds(data)
+                if self.realtime:
+                    self.stopping.wait(start_time + seconds - time.time())
+        except (IOError, OSError):
+            _LOGGER.exception("Unable to read audio")
+        if finished is not None:
+            finished()
+
+    def stop(self):
+        """Stop a worker thread started with `start`."""
+        self.stopping.set()
+        if self.thread is not None and \
+                self.thread is not threading.current_thread():
+            self.thread.join(5)
+        self.thread = None
+
+    def close(self):
+        """Stop the source and release any resources it holds."""
+        self.stop()
+
+
+class PyAudioSource(AudioSource):
+    """Record from a microphone through PyAudio.
+
+    :param int rate: sample rate, or None for the device's default rate.
+    :param int channels: number of channels, or None for all of the
+                         device's input channels.
+    :param int device: index of the input device, defaults to the system
+                       default.
+    """
+
+    def __init__(self, rate, channels=1, width=2, device=None):
+        """Initialise PyAudio."""
+        import pyaudio
+        self.pyaudio = pyaudio
+        with PORTAUDIO_LOCK:
+            self.audio = pyaudio.PyAudio()
+            if rate is None or channels is None:
+                info = self.audio.get_default_input_device_info() \
+                    if device is None else \
+                    self.audio.get_device_info_by_index(device)
+                rate = rate or int(info["defaultSampleRate"])
+                channels = channels or int(info["maxInputChannels"])
+        super().__init__(rate, channels, width)
+        self.device = device
+        self.stream = None
+
+    def read(self, frames):
+        """Read audio from a blocking input stream."""
+        if self.stream is None:
+            self.stream = self.open_stream(frames)
+        return self.stream.read(frames, exception_on_overflow=False)
+
+    def open_stream(self, frames, stream_callback=None):
+        """Open the input stream."""
+        with PORTAUDIO_LOCK:
+            return self.audio.open(
+                input=True, output=False,
+                format=self.audio.get_format_from_width(self.width),
+                channels=self.channels, rate=self.rate,
+                frames_per_buffer=frames,
+                input_device_index=self.device,
+                stream_callback=stream_callback)
+
+    def start(self, callback, finished=None, chunk_frames=2048):
+        """Deliver audio from the PortAudio callback thread."""
+        def audio_callback(in_data, frame_count, time_info, status):
+            """Pass data from pyaudio on."""
+            callback(in_data)
+            return None, self.pyaudio.paContinue
+
+        self.stream = self.open_stream(chunk_frames, audio_callback)
+
+    def stop(self):
+        """Stop and close the input stream."""
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def close(self):
+        """Close the input stream and PyAudio."""
+        self.stop()
+        with PORTAUDIO_LOCK:
+            self.audio.terminate()
+
+
+class WavFileSource(AudioSource):
+    """Read audio from a wav file.
+
+    :param path: the wav file, which must be in the detector's format.
+    :param bool realtime: deliver the audio at the speed it would be spoken
+                          rather than as fast as possible.
+    :param bool loop: start from the beginning again when the file ends.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, rate, channels=1, width=2, path=None, realtime=True,
+                 loop=False):
+        """Open the wav file and check its format."""
+        super().__init__(rate, channels, width, realtime)
+        self.path = path
+        self.loop = loop
+        self.wav = wave.open(path, 'rb')
+        wav_format = (self.wav.getframerate(), self.wav.getnchannels(),
+                      self.wav.getsampwidth())
+        if wav_format != (rate, channels, width):
+            self.wav.close()
+            raise ValueError("{} is {}, expected {}".format(
+                path, wav_format, (rate, channels, width)))
+
+    def read(self, frames):
+        """Read frames from the wav file."""
+        data = self.wav.readframes(frames)
+        if not data and self.loop:
+            self.wav.rewind()
+            data = self.wav.readframes(frames)
+        return data
+
+    def close(self):
+        """Close the wav file."""
+        super().close()
+        self.wav.close()
+
+
+class PcmSource(AudioSource):
+    """Read raw PCM from a file, a FIFO or stdin.
+
+    :param path: file or FIFO to read, or "-" for stdin.
+    :param bool realtime: deliver the audio at the speed it would be spoken.
+                          Leave this off for FIFOs and pipes, which are
+                          already paced by whatever is writing to them.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, rate, channels=1, width=2, path="-", realtime=False):
+        """Open the file."""
+        super().__init__(rate, channels, width, realtime)
+        self.path = path
+        if path == "-":
+            self.stream = getattr(sys.stdin, "buffer", sys.stdin)
+        else:
+            self.stream = open(path, 'rb')
+
+    def read(self, frames):
+        """Read whole frames, blocking until they arrive or the file ends."""
+        size = frames * self.frame_size
+        data = b""
+        while len(data) < size:
+            chunk = self.stream.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data[:len(data) - len(data) % self.frame_size]
+
+    def close(self):
+        """Close the file."""
+        super().close()
+        if self.path != "-":
+            self.stream.close()
+
+
+class UnixSocketSource(AudioSource):
+    """Listen on a Unix socket for raw PCM sent by another process.
+
+    One client is served at a time. When a client disconnects the source
+    waits for the next one, so audio can be fed over the network with
+    something like `socat`.
+
+    :param path: path of the socket to create.
+    :param float timeout: how often to check whether the source has been
+                          stopped while waiting for data.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, rate, channels=1, width=2, path=None, timeout=0.5):
+        """Create the listening socket."""
+        super().__init__(rate, channels, width)
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        # pylint: disable=no-member
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.settimeout(timeout)
+        self.server.bind(path)
+        self.server.listen(1)
+        self.client = None
+        self.partial = b""
+
+    def accept(self):
+        """Wait for a client to connect, or return None if stopped."""
+        while not self.stopping.is_set():
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            client.settimeout(self.server.gettimeout())
+            _LOGGER.info("Audio client connected to %s", self.path)
+            return client
+        return None
+
+    def read(self, frames):
+        """Read whole frames from the current client."""
+        size = frames * self.frame_size
+        while not self.stopping.is_set():
+            if self.client is None:
+                self.client = self.accept()
+                if self.client is None:
+                    break
+            try:
+                chunk = self.client.recv(size - len(self.partial))
+            except socket.timeout:
+                continue
+            if not chunk:
+                _LOGGER.info("Audio client disconnected from %s", self.path)
+                self.client.close()
+                self.client = None
+                self.partial = b""
+                continue
+            data = self.partial + chunk
+            whole = len(data) - len(data) % self.frame_size
+            self.partial = data[whole:]
+            if whole:
+                return data[:whole]
+        return b""
+
+    def close(self):
+        """Close the socket and remove it."""
+        super().close()
+        if self.client is not None:
+            self.client.close()
+        self.server.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ConvertedSource(AudioSource):
+    """Convert audio from another source into the detector's format.
+
+    Lets a microphone be captured at its native rate, channel count and
+    sample format instead of making PortAudio or ALSA convert it.
+
+    :param source: the AudioSource to capture from.
+    :param converter: the Converter which turns its audio into ours.
+    """
+
+    def __init__(self, rate, channels, width, source, converter):
+        """Initialise the source."""
+        # pylint: disable=too-many-arguments
+        super().__init__(rate, channels, width)
+        self.source = source
+        self.converter = converter
+
+    def captured_frames(self, frames):
+        """Get the number of captured frames which make `frames` frames."""
+        return max(1, int(frames * self.source.rate / float(self.rate)))
+
+    def read(self, frames):
+        """Read and convert audio from the source."""
+        data = self.source.read(self.captured_frames(frames))
+        return self.converter.convert(data) if data else b""
+
+    def start(self, callback, finished=None, chunk_frames=2048):
+        """Convert each chunk the source delivers."""
+        self.source.start(
+            lambda data: callback(self.converter.convert(data)), finished,
+            self.captured_frames(chunk_frames))
+
+    def stop(self):
+        """Stop the source."""
+        self.source.stop()
+
+    def close(self):
+        """Close the source."""
+        self.source.close()
+
+
+SOURCES = {
+    "pyaudio": PyAudioSource,
+    "wav": WavFileSource,
+    "pcm": PcmSource,
+    "unix_socket": UnixSocketSource,
+}
+
+
+def create(config, rate, channels=1, width=2):
+    """Create an audio source from the `source` config section.
+
+    If the section has a `capture` section the source is opened in that
+    format and converted. A pyaudio source which leaves out the captured
+    `rate` or `channels` uses the device's own.
+    """
+    config = dict(config or {})
+    name = config.pop("name", "pyaudio")
+    capture = config.pop("capture", None)
+    try:
+        source_class = SOURCES[name]
+    except KeyError:
+        raise ValueError("Unknown audio source {}".format(name))
+    if capture is None:
+        return source_class(rate, channels, width, **config)
+    capture = dict(capture)
+    defaults = (None, None) if name == "pyaudio" else (rate, channels)
+    source = source_class(capture.pop("rate", defaults[0]),
+                          capture.pop("channels", defaults[1]),
+                          capture.pop("width", width), **config)
+    converter = convert.create(
+        dict(capture, rate=source.rate, channels=source.channels,
+             width=source.width), rate, channels, width)
+    return ConvertedSource(rate, channels, width, source, converter)
@@ -0,0 +1,195 @@
+"""Speech output worker."""
+import logging
+import threading
+import time
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from opsdroidaudio.metrics import NULL as NO_METRICS
+
+_LOGGER = logging.getLogger(__name__)
+
+STOP = object()
+
+
+class SpeechWorker:
+    """Speak bot responses as they arrive on a queue.
+
+    Two threads form a pipeline. The synthesis thread blocks on `queue` and
+    turns each message into audio, while the playback thread plays audio
+    which has already been synthesized. This means the next response is
+    generated while the current one is still playing.
+
+    If a `split` function is given long messages are split into chunks,
+    such as sentences, which are synthesized and played in order so the
+    first sentence starts playing while later ones are being generated.
+    The time from taking a message off the queue until its first audio
+    starts playing is recorded as the time to first audio.
+
+    `interrupt` abandons the response being spoken, and any waiting, so the
+    user can talk over the bot.
+
+    :param queue: queue of text messages to speak.
+    :param synthesize: function taking text and returning something `play`
+                       accepts, or None if nothing could be synthesized.
+    :param play: function which plays synthesized audio and blocks until it
+                 has finished.
+    :param cleanup: optional function called with synthesized audio once it
+                    has been played or discarded.
+    :param int lookahead: number of synthesized chunks which can wait for
+                          playback.
+    :param split: optional function which splits a message into chunks.
+    :param metrics: optional Metrics to record speech statistics in.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, queue, synthesize, play, cleanup=None, lookahead=1,
+                 split=None, metrics=None):
+        """Initialise the worker."""
+        self.queue = queue
+        self.synthesize = synthesize
+        self.play = play
+        self.cleanup = cleanup
+        self.split = split
+        self.playback_queue = Queue(lookahead)
+        self.stopping = threading.Event()
+        self.threads = []
+        self.generation = 0
+        self.synthesizing = False
+        self.speaking = False
+        self.stats = {"responses": 0, "spoken": 0, "failed": 0,
+                      "interrupted": 0,
+                      "synthesis_time": 0.0, "playback_time": 0.0,
+                      "first_audio_time": 0.0, "last_first_audio_time": None}
+        metrics = metrics or NO_METRICS
+        self.synthesis_time = metrics.histogram(
+            "synthesis_seconds", "Time taken to synthesize each chunk.")
+        self.first_audio_time = metrics.histogram(
+            "first_audio_seconds",
+            "Time from receiving a response until it starts playing.")
+        self.synthesis_failures = metrics.counter(
+            "synthesis_failures_total", "Chunks which failed to synthesize.")
+        self.interruptions = metrics.counter(
+            "speech_interrupted_total", "Times speech was interrupted.")
+        metrics.gauge("speech_queue_depth", "Responses waiting to be spoken.",
+                      lambda: self.queue_depth)
+
+    @property
+    def queue_depth(self):
+        """Get the number of responses waiting to be spoken."""
+        return self.queue.qsize() + self.playback_queue.qsize()
+
+    def start(self):
+        """Start the synthesis and playback threads."""
+        self.threads = [threading.Thread(target=self.synthesis_loop),
+                        threading.Thread(target=self.playback_loop)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Stop speaking, discarding any queued responses."""
+        self.stopping.set()
+        self.queue.put(STOP)
+
+    @property
+    def busy(self):
+        """Check whether a response is being, or waiting to be, spoken."""
+        return self.synthesizing or self.speaking or self.queue_depth > 0
+
+    def interrupt(self):
+        """Abandon the current response and discard those waiting.
+
+        Audio which is already playing is not stopped, `play` has to
+        return early for that, but nothing more is played.
+        """
+        if self.busy:
+            self.stats["interrupted"] += 1
+            self.interruptions.inc()
+        self.generation += 1
+        while True:
+            try:
+                message = self.queue.get_nowait()
+            except Empty:
+                break
+            if message is STOP:
+                self.queue.put(STOP)
+                break
+
+    def join(self, timeout=None):
+        """Wait for the worker threads to finish."""
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def discard(self, audio):
+        """Clean up audio which will not be played."""
+        if audio is not None and self.cleanup is not None:
+            self.cleanup(audio)
+
+    def synthesis_loop(self):
+        """Synthesize queued messages ahead of playback."""
+        while True:
+            message = self.queue.get()
+            if message is STOP or self.stopping.is_set():
+                break
+            self.stats["responses"] += 1
+            self.synthesizing = True
+            received_time = time.time()
+            generation = self.generation
+            chunks = self.split(message) if self.split else [message]
+            for text in chunks:
+                if self.stopping.is_set() or generation != self.generation:
+                    break
+                start_time = time.time()
+                try:
+                    audio = self.synthesize(text)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Unable to synthesize '%s'", text)
+                    audio = None
+                synthesis_time = time.time() - start_time
+                self.stats["synthesis_time"] += synthesis_time
+                self.synthesis_time.observe(synthesis_time)
+                if audio is None:
+                    self.stats["failed"] += 1
+                    self.synthesis_failures.inc()
+                    continue
+                self.playback_queue.put((text, audio, synthesis_time,
+                                         received_time, generation))
+                received_time = None
+            self.synthesizing = False
+        self.playback_queue.put(STOP)
+
+    def playback_loop(self):
+        """Play synthesized messages in order."""
+        while True:
+            item = self.playback_queue.get()
+            if item is STOP:
+                break
+            text, audio, synthesis_time, received_time, generation = item
+            if self.stopping.is_set() or generation != self.generation:
+                self.discard(audio)
+                continue
+            start_time = time.time()
+            if received_time is not None:
+                first_audio_time = start_time - received_time
+                self.stats["first_audio_time"] += first_audio_time
+                self.stats["last_first_audio_time"] = first_audio_time
+                self.first_audio_time.observe(first_audio_time)
+                _LOGGER.debug("Time to first audio was %f seconds.",
+                              first_audio_time)
+            self.speaking = True
+            try:
+                self.play(audio)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Unable to play '%s'", text)
+            finally:
+                self.speaking = False
+                self.discard(audio)
+            playback_time = time.time() - start_time
+            self.stats["playback_time"] += playback_time
+            self.stats["spoken"] += 1
+            _LOGGER.debug("Spoke '%s', synthesis took %f seconds, playback "
+                          "took %f seconds, %d responses queued.", text,
+                          synthesis_time, playback_time, self.queue_depth)
@@ -0,0 +1,68 @@
+"""Time how long opsdroid audio takes to start."""
+import collections
+import logging
+import threading
+import time
+
+from opsdroidaudio.metrics import NULL as NO_METRICS
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Record how long each stage of starting up takes.
+
+    Stages which run at the same time, such as loading models while
+    connecting to opsdroid, are timed separately so their durations can add
+    up to more than the total. Milestones such as "listening" are recorded
+    as the time since the process started instead.
+
+    :param float start_time: when the process started, defaults to now.
+    :param metrics: optional Metrics to record each stage in.
+    """
+
+    def __init__(self, start_time=None, metrics=None):
+        """Initialise the timer."""
+        self.start_time = start_time or time.time()
+        self.metrics = metrics or NO_METRICS
+        self.stages = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def export(self, metrics):
+        """Record the stages so far, and every later one, in `metrics`."""
+        self.metrics = metrics
+        with self.lock:
+            stages = list(self.stages.items())
+        for stage, seconds in stages:
+            self.gauge(stage).set(seconds)
+
+    def gauge(self, stage):
+        """Get the gauge for a stage."""
+        return self.metrics.labelled(stage=stage).gauge(
+            "startup_seconds", "Seconds taken by each stage of starting up.")
+
+    def record(self, stage, seconds):
+        """Record the duration of a stage."""
+        with self.lock:
+            self.stages[stage] = seconds
+        self.gauge(stage).set(seconds)
+
+    def time(self, stage, function, *args, **kwargs):
+        """Call a function and record how long it took as `stage`."""
+        start_time = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.record(stage, time.time() - start_time)
+
+    def mark(self, milestone):
+        """Record the time since the process started as `milestone`."""
+        self.record(milestone, time.time() - self.start_time)
+
+    def report(self):
+        """Describe every stage recorded so far."""
+        with self.lock:
+            stages = list(self.stages.items())
+        return "Startup times: {}".format(", ".join(
+            "{} {:.2f}s".format(stage, seconds) for stage, seconds in stages))
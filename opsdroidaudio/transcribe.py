@@ -0,0 +1,283 @@
+"""Transcribe archives of recorded utterances offline.
+
+    python -m opsdroidaudio transcribe recordings/ --output results.jsonl
+
+Files are read from a directory, or from a manifest with one path or JSON
+object per line, and recognized across a pool of worker processes which
+each load one warm engine. Results are written as JSON lines as they
+finish, so an interrupted run can be continued with `--resume`.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import string
+import time
+import wave
+
+import yaml
+
+from opsdroidaudio import recognizers
+
+
+_LOGGER = logging.getLogger(__name__)
+
+EXTENSIONS = (".wav", ".pcm", ".raw")
+
+
+def read_manifest(path):
+    """Read the files listed in a manifest.
+
+    Each line is either a path or a JSON object with a `path` and an
+    optional reference transcript in `text`. Relative paths are relative to
+    the manifest.
+
+    :return: list of dicts with a `path` and a `reference`.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line) if line.startswith("{") else \
+                {"path": line}
+            items.append({
+                "path": os.path.join(directory, entry["path"]),
+                "reference": entry.get("text")})
+    return items
+
+
+def find_files(path):
+    """Find the audio files to transcribe in a directory or manifest.
+
+    A `.txt` file next to an audio file in a directory is used as its
+    reference transcript.
+
+    :return: list of dicts with a `path` and a `reference`.
+    """
+    if not os.path.isdir(path):
+        return read_manifest(path)
+    items = []
+    for directory, _, names in sorted(os.walk(path)):
+        for name in sorted(names):
+            if not name.lower().endswith(EXTENSIONS):
+                continue
+            reference = None
+            text_path = os.path.splitext(os.path.join(directory, name))[0] \
+                + ".txt"
+            if os.path.isfile(text_path):
+                with open(text_path) as text_file:
+                    reference = text_file.read().strip()
+            items.append({"path": os.path.join(directory, name),
+                          "reference": reference})
+    return items
+
+
+def read_audio(path, sample_rate):
+    """Read 16 bit mono PCM from a wav file or a raw PCM file.
+
+    Raw files are assumed to already be in the recognizer's format.
+    """
+    if not path.lower().endswith(".wav"):
+        with open(path, "rb") as raw:
+            return raw.read()
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1 or \
+                wav.getframerate() != sample_rate:
+            raise ValueError("{} is {}Hz {} channel {} bit audio, not {}Hz "
+                             "mono 16 bit".format(
+                                 path, wav.getframerate(),
+                                 wav.getnchannels(),
+                                 wav.getsampwidth() * 8, sample_rate))
+        return wav.readframes(wav.getnframes())
+
+
+def transcribe_file(item, config, sample_rate):
+    """Recognize one file with the worker's engine.
+
+    The engine is loaded by the worker's first file and then reused.
+
+    :return: the result to write, including the seconds of audio and the
+             seconds recognition took.
+    """
+    result = {"path": item["path"], "text": None, "error": None}
+    try:
+        recognizers.init_worker(config, sample_rate)
+        data = read_audio(item["path"], sample_rate)
+        result["audio_seconds"] = len(data) / float(2 * sample_rate)
+        start_time = time.time()
+        result["text"] = recognizers.recognize_in_worker(data)
+        result["latency"] = time.time() - start_time
+    except Exception as error:  # pylint: disable=broad-except
+        result["error"] = str(error)
+    if item.get("reference") is not None:
+        result["reference"] = item["reference"]
+    return result
+
+
+def normalize_words(text):
+    """Split a transcript into lower case words without punctuation."""
+    return (text or "").lower().translate(
+        str.maketrans("", "", string.punctuation)).split()
+
+
+def word_errors(reference, hypothesis):
+    """Count the word substitutions, insertions and deletions.
+
+    :return: the number of errors and the number of reference words.
+    """
+    reference = normalize_words(reference)
+    hypothesis = normalize_words(hypothesis)
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1], len(reference)
+
+
+def completed(output):
+    """Get the results of files which were transcribed by an earlier run."""
+    results = {}
+    if not os.path.exists(output):
+        return results
+    with open(output) as previous:
+        for line in previous:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # A line cut short when the run was stopped
+            if result.get("error") is None:
+                results[result["path"]] = result
+    return results
+
+
+def summarize(results, elapsed):
+    """Add up the throughput and word error rate of a run.
+
+    :param results: the results of every file, including earlier runs.
+    :param float elapsed: wall clock seconds this run took.
+    """
+    # pylint: disable=len-as-condition
+    done = [result for result in results if result.get("error") is None]
+    summary = {
+        "files": len(done),
+        "failed": len(results) - len(done),
+        "audio_seconds": sum(result["audio_seconds"] for result in done),
+        "elapsed": elapsed,
+    }
+    timed = [result for result in done if "latency" in result]
+    if elapsed > 0:
+        summary["throughput"] = sum(
+            result["audio_seconds"] for result in timed) / elapsed
+    if timed:
+        summary["mean_latency"] = sum(
+            result["latency"] for result in timed) / len(timed)
+    errors, words = 0, 0
+    for result in done:
+        if result.get("reference") is not None:
+            result_errors, result_words = word_errors(result["reference"],
+                                                      result["text"])
+            errors += result_errors
+            words += result_words
+    if words:
+        summary["word_error_rate"] = errors / float(words)
+    return summary
+
+
+def transcribe(items, output, config, workers=None, resume=False,
+               sample_rate=recognizers.SAMPLE_RATE,
+               executor_class=concurrent.futures.ProcessPoolExecutor):
+    """Transcribe files and write the results to a JSON lines file.
+
+    Only a few files per worker are queued at a time, so archives of any
+    size are streamed through the pool rather than submitted at once.
+
+    :param items: dicts with the `path` and optional `reference` of each
+                  file, from `find_files`.
+    :param output: path of the JSON lines file to write.
+    :param config: the speech recognizer config section.
+    :param workers: number of worker processes, defaults to the CPU count.
+    :param bool resume: skip files which already have a result in `output`.
+                        The output is rewritten without failures and lines
+                        cut short, which are then retried.
+    :return: the summary of the run from `summarize`.
+    """
+    # pylint: disable=too-many-arguments
+    previous = completed(output) if resume else {}
+    todo = [item for item in items if item["path"] not in previous]
+    _LOGGER.info("Transcribing %d files, %d already done.", len(todo),
+                 len(items) - len(todo))
+    workers = workers or os.cpu_count() or 1
+    results = list(previous.values())
+    start_time = time.time()
+    with open(output, "w") as results_file, \
+            executor_class(workers) as executor:
+        for result in results:
+            results_file.write(json.dumps(result) + "\n")
+        todo = iter(todo)
+        pending = set()
+        while True:
+            for item in todo:
+                pending.add(executor.submit(transcribe_file, item, config,
+                                            sample_rate))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+            finished, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                if result["error"] is not None:
+                    _LOGGER.warning("Failed to transcribe %s: %s",
+                                    result["path"], result["error"])
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+                results.append(result)
+    return summarize(results, time.time() - start_time)
+
+
+def main(args=None):
+    """Run the transcribe command and print a summary."""
+    parser = argparse.ArgumentParser(
+        prog="opsdroidaudio transcribe",
+        description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="directory of audio files or manifest")
+    parser.add_argument("--output", default="transcripts.jsonl",
+                        help="JSON lines file to write the results to")
+    parser.add_argument("--config", default="configuration.yaml",
+                        help="config file with a speech recognizer section")
+    parser.add_argument("--recognizer",
+                        help="use this recognizer instead of the config's")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes, defaults to the CPU count")
+    parser.add_argument("--sample-rate", type=int,
+                        default=recognizers.SAMPLE_RATE)
+    parser.add_argument("--resume", action="store_true",
+                        help="skip files already in the output")
+    args = parser.parse_args(args)
+
+    with open(args.config) as stream:
+        config = dict(yaml.safe_load(stream)["speech"]["recognizer"])
+    if args.recognizer:
+        config["name"] = args.recognizer
+
+    summary = transcribe(find_files(args.path), args.output, config,
+                         args.workers, args.resume, args.sample_rate)
+    print("Transcribed {} files ({} failed), {:.2f} hours of audio in "
+          "{:.1f} seconds.".format(summary["files"], summary["failed"],
+                                   summary["audio_seconds"] / 3600,
+                                   summary["elapsed"]))
+    if "throughput" in summary:
+        print("Throughput: {:.1f} audio hours per hour".format(
+            summary["throughput"]))
+    if "word_error_rate" in summary:
+        print("Word error rate: {:.1%}".format(
+            summary["word_error_rate"]))
+    return summary
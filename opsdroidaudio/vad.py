@@ -0,0 +1,118 @@
+"""Skip hotword detection on audio which is clearly silent."""
+import collections
+import logging
+
+import numpy as np
+
+
+_LOGGER = logging.getLogger(__name__)
+
+BLOCK_MS = 100
+THRESHOLD = 1000  # Peak amplitude which might be the start of a hotword
+RMS_THRESHOLD = 300
+
+
+class EnergyGate:
+    """Decide which blocks of audio are worth running the detector on.
+
+    The detector is given fixed size blocks of audio. The peak and RMS
+    energy of every `frame_ms` frame in a block is calculated with NumPy,
+    which is far cheaper than running the detector, and blocks where no
+    frame reaches either threshold are skipped.
+
+    A hotword can start quietly, so the last `preroll_ms` of skipped audio
+    is kept and analysed before the block which opened the gate. The gate
+    stays open for `hangover_ms` after the last loud block so the end of a
+    hotword is heard too. Audio is counted as skipped once it drops out of
+    the pre-roll.
+
+    The RMS of every frame in the last block is kept in `frame_rms`, so the
+    endpointer can follow the noise floor without measuring it again.
+
+    :param int sample_rate: sample rate of the audio in Hz.
+    :param int sample_width: bytes per sample, only 16 bit audio is supported.
+    :param int channels: number of interleaved channels.
+    :param int block_ms: length of the blocks the detector is given.
+    :param bool enabled: if False every block is analysed.
+    :param int threshold: peak amplitude of a frame which opens the gate.
+    :param int rms_threshold: RMS of a frame which opens the gate.
+    :param int frame_ms: length of an analysis frame.
+    :param int preroll_ms: skipped audio analysed when the gate opens.
+    :param int hangover_ms: time the gate stays open after loud audio.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, sample_rate, sample_width=2, channels=1,
+                 block_ms=BLOCK_MS, enabled=True, threshold=THRESHOLD,
+                 rms_threshold=RMS_THRESHOLD, frame_ms=10, preroll_ms=300,
+                 hangover_ms=500):
+        """Initialise the gate."""
+        if sample_width != 2:
+            raise ValueError("Only 16 bit audio is supported")
+        self.channels = channels
+        self.frame_size = sample_width * channels
+        self.block_frames = max(1, int(sample_rate * block_ms / 1000))
+        self.block_size = self.block_frames * self.frame_size
+        self.enabled = enabled
+        self.threshold = threshold
+        self.rms_threshold = rms_threshold
+        self.frame_length = max(1, int(sample_rate * frame_ms / 1000))
+        self.preroll = collections.deque(
+            maxlen=int(np.ceil(preroll_ms / float(block_ms))))
+        self.hangover_blocks = int(np.ceil(hangover_ms / float(block_ms)))
+        self.open_blocks = 0
+        self.frame_rms = np.zeros(0, dtype=np.float32)
+        self.analysed = 0
+        self.skipped = 0
+
+    def reset(self):
+        """Forget the pre-roll and close the gate."""
+        self.skipped += len(self.preroll) * self.block_frames
+        self.preroll.clear()
+        self.open_blocks = 0
+
+    def frame_energy(self, block):
+        """Get the peak and RMS of every frame in a block."""
+        samples = np.frombuffer(block, dtype=np.int16).astype(np.float32)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        count = max(1, len(samples) // self.frame_length)
+        frames = samples[:count * self.frame_length].reshape(count, -1)
+        peak = np.max(np.abs(frames), axis=1)
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        return peak, rms
+
+    def is_loud(self, block):
+        """Check whether any frame in a block reaches a threshold."""
+        peak, self.frame_rms = self.frame_energy(block)
+        return bool(np.any((peak >= self.threshold) |
+                           (self.frame_rms >= self.rms_threshold)))
+
+    def filter(self, block):
+        """Get the blocks to analyse now that `block` has arrived.
+
+        :return: an empty list if the block can be skipped, otherwise the
+                 block preceded by any pre-roll.
+        """
+        loud = self.is_loud(block)
+        if not self.enabled:
+            self.analysed += self.block_frames
+            return [block]
+        if loud:
+            self.open_blocks = self.hangover_blocks + 1
+        if not self.open_blocks:
+            if len(self.preroll) == self.preroll.maxlen:
+                self.skipped += self.block_frames
+            self.preroll.append(block)
+            return []
+        self.open_blocks -= 1
+        blocks = list(self.preroll) + [block]
+        self.preroll.clear()
+        self.analysed += len(blocks) * self.block_frames
+        return blocks
+
+
+def create(config, sample_rate, sample_width=2, channels=1):
+    """Create a gate from the `detection` config section."""
+    return EnergyGate(sample_rate, sample_width, channels, **(config or {}))
@@ -10,13 +10,13 @@ PACKAGES = find_packages(exclude=['tests', 'tests.*', 'modules',
                                   'modules.*', 'docs', 'docs.*'])
 
 REQUIRES = [
+    'aiohttp==3.6.2',
     'google-api-python-client==1.6.2',
+    'numpy==1.18.1',
     'playsound==1.2.1',
     'PyAudio==0.2.9',
     'PyYAML==3.11',
-    'requests==2.13.0',
     'SpeechRecognition==3.6.0',
-    'websocket-client==0.40.0',
 ]
 
 setup(
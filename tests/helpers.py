@@ -0,0 +1,36 @@
+"""Fixtures shared by the opsdroidaudio tests."""
+import wave
+
+from opsdroidaudio import sources
+
+
+RATE = 16000
+
+
+class FakeSource(sources.AudioSource):
+    """A source of prepared chunks which ends when they run out."""
+
+    def __init__(self, chunks, rate=RATE):
+        """Initialise the source with any iterable of chunks."""
+        super().__init__(rate)
+        self.chunks = iter(chunks)
+
+    def read(self, frames):
+        """Get the next chunk, or nothing once they have run out."""
+        return next(self.chunks, b"")
+
+
+def silence(seconds, rate=RATE, channels=1):
+    """Get 16 bit PCM of silence."""
+    return b"\x00\x00" * int(rate * seconds) * channels
+
+
+def make_wav(path, data, rate=RATE, channels=1):
+    """Write 16 bit PCM to a wav file and return its path."""
+    wav = wave.open(path, 'wb')
+    wav.setnchannels(channels)
+    wav.setsampwidth(2)
+    wav.setframerate(rate)
+    wav.writeframes(data)
+    wav.close()
+    return path
@@ -4,7 +4,8 @@ try:
 except ImportError:
     import mock
 
-from opsdroidaudio import audio
+from opsdroidaudio import audio, metrics
+from helpers import FakeSource
 
 
 class TestCore(unittest.TestCase):
@@ -12,5 +13,127 @@ class TestCore(unittest.TestCase):
 
     def test_ring_buffer(self):
         ring_buffer = audio.RingBuffer()
-        ring_buffer.extend([mock.Mock()])
-        self.assertEqual(ring_buffer.length, 1)
+        ring_buffer.extend(b"\x00\x01")
+        self.assertEqual(ring_buffer.length, 2)
+
+
+class TestHotwordDetector(unittest.TestCase):
+    """Test the opsdroidaudio hotword detector."""
+
+    def make_detector(self, chunks, **kwargs):
+        snowboy = mock.Mock()
+        snowboy.NumHotwords.return_value = 1
+        snowboy.NumChannels.return_value = 1
+        snowboy.BitsPerSample.return_value = 16
+        snowboy.SampleRate.return_value = 16000
+        snowboy.RunDetection.side_effect = \
+            lambda data: 1 if data == b"\x01\x00" * 160 else 0
+        kwargs.setdefault("detection_config",
+                          {"block_ms": 10, "enabled": False})
+        with mock.patch.object(audio.snowboydetect, "SnowboyDetect",
+                               return_value=snowboy):
+            return audio.HotwordDetector("model.pmdl",
+                                         source=FakeSource(chunks), **kwargs)
+
+    def assert_recorded(self, recorded, data, detector):
+        recorded.assert_called_once_with(mock.ANY, detector)
+        self.assertEqual(bytes(recorded.call_args[0][0].buffer()), data)
+
+    def test_replay(self):
+        silence = b"\x00\x00" * 160
+        detector = self.make_detector(
+            [silence, b"\x01\x00" * 160, silence, silence])
+        detected = mock.Mock()
+        recorded = mock.Mock()
+        stats = detector.replay(detected_callback=detected,
+                                recording_callback=recorded)
+        self.assertEqual(stats["detections"], 1)
+        self.assertAlmostEqual(stats["audio_seconds"], 0.04)
+        self.assertIn("realtime_factor", stats)
+        detected.assert_called_once_with(b"\x01\x00" * 160, detector)
+        self.assert_recorded(recorded, b"\x01\x00" * 160 + silence * 2,
+                             detector)
+
+    def test_start_returns_when_source_ends(self):
+        detector = self.make_detector([b"\x01\x00" * 160])
+        recorded = mock.Mock()
+        detector.start(detected_callback=None, recording_callback=recorded)
+        self.assert_recorded(recorded, b"\x01\x00" * 160, detector)
+
+    def test_metrics(self):
+        registry = metrics.Metrics()
+        detector = self.make_detector(
+            [b"\x00\x00" * 160, b"\x01\x00" * 160], metrics=registry)
+        detector.replay()
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["frames_processed_total"], 320)
+        self.assertEqual(snapshot["hotwords_detected_total"], 1)
+        self.assertEqual(snapshot["detection_seconds"]["count"], 2)
+        self.assertEqual(snapshot["ring_buffer_dropped_bytes_total"], 0)
+
+    def test_echo_gate_keeps_output_out_of_recordings(self):
+        silence = b"\x00\x00" * 160
+        echo = b"\x02\x00" * 160
+        playing = [True, False]
+        detector = self.make_detector(
+            [b"\x01\x00" * 160, echo, silence],
+            echo_gate=lambda: playing.pop(0))
+        recorded = mock.Mock()
+        detector.replay(recording_callback=recorded)
+        self.assert_recorded(recorded, b"\x01\x00" * 160 + silence,
+                             detector)
+
+    def test_recording_maximum_length(self):
+        registry = metrics.Metrics()
+        silence = b"\x00\x00" * 160
+        detector = self.make_detector(
+            [b"\x01\x00" * 160, silence, silence, silence],
+            metrics=registry, recording_config={"max_seconds": 0.02})
+        recorded = mock.Mock()
+        detector.replay(recording_callback=recorded)
+        self.assert_recorded(recorded, b"\x01\x00" * 160 + silence,
+                             detector)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["recordings_truncated_total"], 1)
+        self.assertEqual(snapshot["recording_peak_memory_bytes"], 640)
+
+    def test_gate_detection(self):
+        detector = self.make_detector([b"\x01\x00" * 160],
+                                      echo_gate=lambda: True,
+                                      gate_detection=True)
+        self.assertEqual(detector.replay()["detections"], 0)
+
+    def test_detects_in_fixed_size_blocks(self):
+        hotword = b"\x01\x00" * 160
+        silence = b"\x00\x00" * 100
+        detector = self.make_detector([silence, hotword + silence])
+        recorded = mock.Mock()
+        self.assertEqual(detector.replay(recording_callback=recorded)[
+            "detections"], 0)
+        detector = self.make_detector([silence, b"\x00\x00" * 60 +
+                                       hotword[:200], hotword[200:] + silence])
+        self.assertEqual(detector.replay(recording_callback=recorded)[
+            "detections"], 1)
+        self.assert_recorded(recorded, hotword + silence, detector)
+
+    def test_noise_floor_follows_gate_energy(self):
+        noise = b"\x90\x01" * 160
+        detector = self.make_detector([noise] * 50)
+        detector.gate.is_loud = mock.Mock(wraps=detector.gate.is_loud)
+        detector.replay()
+        self.assertEqual(detector.gate.is_loud.call_count, 50)
+        self.assertGreater(detector.endpointer.noise_floor, 50)
+
+    def test_energy_gate_skips_silence(self):
+        registry = metrics.Metrics()
+        loud = b"\x01\x00" * 160
+        detector = self.make_detector(
+            [b"\x00\x00" * 160] * 10 + [loud, b"\x00\x00" * 160],
+            metrics=registry,
+            detection_config={"block_ms": 10, "threshold": 1,
+                              "preroll_ms": 20, "hangover_ms": 0})
+        self.assertEqual(detector.replay()["detections"], 1)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["detection_frames_skipped_total"], 8 * 160)
+        self.assertEqual(snapshot["detection_frames_analysed_total"], 3 * 160)
+        self.assertEqual(detector.detector.RunDetection.call_count, 3)
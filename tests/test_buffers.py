@@ -0,0 +1,156 @@
+import sys
+import threading
+import unittest
+from array import array
+
+from opsdroidaudio import buffers
+
+
+class TestRingBuffer(unittest.TestCase):
+    """Test the opsdroidaudio ring buffer."""
+
+    def test_extend_and_get(self):
+        ring_buffer = buffers.RingBuffer(8)
+        ring_buffer.extend(b"\x01\x02\x03\x04")
+        self.assertEqual(ring_buffer.length, 4)
+        self.assertEqual(ring_buffer.get(), b"\x01\x02\x03\x04")
+        self.assertEqual(ring_buffer.length, 0)
+        self.assertEqual(ring_buffer.get(), b"")
+
+    def test_wraps_around(self):
+        ring_buffer = buffers.RingBuffer(8)
+        ring_buffer.extend(b"abcdef")
+        self.assertEqual(ring_buffer.get(), b"abcdef")
+        ring_buffer.extend(b"ghijkl")
+        self.assertEqual(bytes(ring_buffer.read()), b"ghijkl")
+        self.assertEqual(ring_buffer.overruns, 0)
+
+    def test_overrun_drops_oldest(self):
+        ring_buffer = buffers.RingBuffer(8)
+        ring_buffer.extend(b"abcdef")
+        ring_buffer.extend(b"ghij")
+        self.assertEqual(ring_buffer.get(), b"cdefghij")
+        self.assertEqual(ring_buffer.overruns, 1)
+        self.assertEqual(ring_buffer.bytes_dropped, 2)
+
+        ring_buffer.extend(b"0123456789")
+        self.assertEqual(ring_buffer.get(), b"23456789")
+        self.assertEqual(ring_buffer.bytes_dropped, 4)
+
+    def test_reads_are_frame_aligned(self):
+        ring_buffer = buffers.RingBuffer(16, frame_size=4)
+        ring_buffer.extend(b"abcdefg")
+        self.assertEqual(bytes(ring_buffer.read()), b"abcd")
+        ring_buffer.extend(b"h")
+        self.assertEqual(bytes(ring_buffer.read(6)), b"efgh")
+
+    def test_read_survives_extend(self):
+        ring_buffer = buffers.RingBuffer(8)
+        ring_buffer.extend(b"abcd")
+        view = ring_buffer.read()
+        ring_buffer.extend(b"01234567")
+        self.assertEqual(bytes(view), b"abcd")
+
+    def test_accepts_sample_arrays(self):
+        ring_buffer = buffers.RingBuffer(8)
+        ring_buffer.extend(array('h', [1, -1]))
+        self.assertEqual(ring_buffer.get(), array('h', [1, -1]).tobytes())
+
+    def test_growable(self):
+        ring_buffer = buffers.RingBuffer(None)
+        data = bytes(bytearray(range(256))) * 100
+        ring_buffer.extend(data[:10])
+        ring_buffer.extend(data[10:])
+        self.assertEqual(ring_buffer.get(), data)
+        self.assertEqual(ring_buffer.bytes_dropped, 0)
+
+    def test_wait_wakes_on_extend(self):
+        ring_buffer = buffers.RingBuffer(8)
+        timer = threading.Timer(0.05, ring_buffer.extend, [b"ab"])
+        timer.start()
+        self.assertTrue(ring_buffer.wait(5))
+        self.assertEqual(ring_buffer.get(), b"ab")
+        timer.join()
+
+    def test_wait_times_out(self):
+        ring_buffer = buffers.RingBuffer(8)
+        self.assertFalse(ring_buffer.wait(0.01))
+
+    def test_interrupt_unblocks_wait(self):
+        ring_buffer = buffers.RingBuffer(8)
+        timer = threading.Timer(0.05, ring_buffer.interrupt)
+        timer.start()
+        self.assertFalse(ring_buffer.wait())
+        timer.join()
+
+
+class TestRecording(unittest.TestCase):
+    """Test the opsdroidaudio utterance recording."""
+
+    def test_in_memory(self):
+        recording = buffers.Recording(memory_limit=8)
+        recording.extend(b"abcd")
+        recording.extend(b"efgh")
+        self.assertFalse(recording.spilled)
+        self.assertEqual(recording.buffer(), b"abcdefgh")
+        self.assertEqual(recording.open().read(), b"abcdefgh")
+        self.assertEqual(recording.peak_memory, 8)
+
+    def test_spills_to_disk(self):
+        recording = buffers.Recording(memory_limit=8)
+        recording.extend(b"abcdef")
+        recording.extend(b"ghij")
+        recording.extend(b"kl")
+        self.assertTrue(recording.spilled)
+        self.assertEqual(recording.length, 12)
+        self.assertEqual(recording.peak_memory, 6)
+        self.assertEqual(recording.buffer(), b"abcdefghijkl")
+        self.assertEqual(recording.open().read(), b"abcdefghijkl")
+
+    def test_close_deletes_temp_file(self):
+        recording = buffers.Recording(memory_limit=8)
+        recording.extend(b"abcdefghijkl")
+        data = recording.buffer()
+        spill = recording.file
+        recording.close()
+        self.assertTrue(spill.closed)
+        self.assertFalse(recording.spilled)
+        self.assertEqual(recording.length, 0)
+        self.assertEqual(data, b"abcdefghijkl")
+
+    def test_maximum_size(self):
+        recording = buffers.Recording(max_size=7, frame_size=2)
+        recording.extend(b"abcd")
+        self.assertFalse(recording.full)
+        recording.extend(b"efgh")
+        self.assertTrue(recording.full)
+        recording.extend(b"ij")
+        self.assertEqual(recording.buffer(), b"abcdef")
+        self.assertEqual(recording.bytes_dropped, 4)
+
+
+@unittest.skipIf(sys.version_info < (3, 8), "needs shared memory")
+class TestSharedRingBuffer(unittest.TestCase):
+    """Test the opsdroidaudio shared memory ring buffer."""
+
+    def setUp(self):
+        self.ring_buffer = buffers.SharedRingBuffer(8)
+        self.reader = buffers.SharedRingBuffer(name=self.ring_buffer.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.ring_buffer.close()
+
+    def test_write_and_read_across_attachments(self):
+        self.assertTrue(self.ring_buffer.write(b"abcdef"))
+        self.assertEqual(self.reader.length, 6)
+        self.assertEqual(self.reader.read(4), b"abcd")
+        self.assertTrue(self.ring_buffer.write(b"ghijkl"))
+        self.assertEqual(self.reader.read(8), b"efghijkl")
+        self.assertEqual(self.reader.length, 0)
+
+    def test_drops_chunks_which_do_not_fit(self):
+        self.assertTrue(self.ring_buffer.write(b"abcdef"))
+        self.assertFalse(self.ring_buffer.write(b"ghi"))
+        self.assertEqual(self.reader.bytes_dropped, 3)
+        self.assertEqual(self.reader.read(8), b"abcdef")
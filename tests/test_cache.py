@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from opsdroidaudio import cache
+
+
+class TestSpeechCache(unittest.TestCase):
+    """Test the opsdroidaudio speech cache."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.synthesized = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def synthesize(self, text, path):
+        """A fake local generator which writes the text as audio."""
+        self.synthesized.append(text)
+        with open(path, "w") as stream:
+            stream.write(text * 10)
+        return True
+
+    def speak(self, speech_cache, text):
+        key = speech_cache.key("fake", None, "en", text)
+        path = speech_cache.get_or_synthesize(
+            key, ".wav", lambda path: self.synthesize(text, path))
+        with open(path) as stream:
+            audio = stream.read()
+        speech_cache.release(path)
+        return audio
+
+    def test_hit_and_miss(self):
+        speech_cache = cache.SpeechCache(self.tmpdir)
+        self.assertEqual(self.speak(speech_cache, "OK"), "OK" * 10)
+        self.assertEqual(self.speak(speech_cache, "  OK "), "OK" * 10)
+        self.assertEqual(self.synthesized, ["OK"])
+        self.assertEqual(speech_cache.stats["hits"], 1)
+        self.assertEqual(speech_cache.stats["misses"], 1)
+
+    def test_key_includes_engine_voice_and_language(self):
+        keys = {cache.SpeechCache.key("google", None, "en", "OK"),
+                cache.SpeechCache.key("apple_say", None, "en", "OK"),
+                cache.SpeechCache.key("google", "Alex", "en", "OK"),
+                cache.SpeechCache.key("google", None, "fr", "OK")}
+        self.assertEqual(len(keys), 4)
+
+    def test_persists_between_instances(self):
+        self.speak(cache.SpeechCache(self.tmpdir), "Done")
+        speech_cache = cache.SpeechCache(self.tmpdir)
+        self.speak(speech_cache, "Done")
+        self.assertEqual(self.synthesized, ["Done"])
+        self.assertEqual(speech_cache.size, 40)
+
+    def test_lru_eviction(self):
+        speech_cache = cache.SpeechCache(self.tmpdir, max_bytes=50)
+        self.speak(speech_cache, "aa")
+        self.speak(speech_cache, "bb")
+        self.speak(speech_cache, "aa")
+        self.speak(speech_cache, "cc")
+        self.assertLessEqual(speech_cache.size, 50)
+        self.assertEqual(speech_cache.stats["evictions"], 1)
+        self.speak(speech_cache, "aa")
+        self.speak(speech_cache, "bb")
+        self.assertEqual(self.synthesized, ["aa", "bb", "cc", "bb"])
+
+    def test_files_in_use_are_not_evicted(self):
+        speech_cache = cache.SpeechCache(self.tmpdir, max_bytes=20)
+        key = speech_cache.key("fake", None, "en", "held")
+        held = speech_cache.get_or_synthesize(
+            key, ".wav", lambda path: self.synthesize("held", path))
+        self.speak(speech_cache, "other")
+        self.assertTrue(os.path.exists(held))
+        speech_cache.release(held)
+        self.speak(speech_cache, "more")
+        self.assertFalse(os.path.exists(held))
+
+    def test_failed_synthesis_is_not_cached(self):
+        speech_cache = cache.SpeechCache(self.tmpdir)
+        key = speech_cache.key("fake", None, "en", "broken")
+        self.assertIsNone(speech_cache.get_or_synthesize(
+            key, ".wav", lambda path: False))
+        self.assertEqual(speech_cache.index, {})
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_prewarm(self):
+        speech_cache = cache.SpeechCache(self.tmpdir)
+        speech_cache.prewarm(
+            ["OK", "Done"],
+            lambda text: speech_cache.key("fake", None, "en", text),
+            ".wav", self.synthesize)
+        self.speak(speech_cache, "OK")
+        self.assertEqual(self.synthesized, ["OK", "Done"])
+        self.assertEqual(speech_cache.in_use, {})
+
+    def test_contains(self):
+        speech_cache = cache.SpeechCache(self.tmpdir)
+        self.assertTrue(speech_cache.contains(
+            os.path.join(self.tmpdir, "abc.wav")))
+        self.assertFalse(speech_cache.contains("/tmp/elsewhere/abc.wav"))
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from aiohttp import web
+
+from opsdroidaudio import connection
+
+
+class FakeOpsdroid:
+    """An opsdroid websocket connector which echoes messages back."""
+
+    def __init__(self):
+        self.received = []
+        self.sockets = []
+        self.loop = asyncio.new_event_loop()
+        self.runner = None
+        self.port = None
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(started,))
+        self.thread.daemon = True
+        self.thread.start()
+        started.wait()
+
+    def run(self, started):
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_post("/connector/websocket", self.new_socket)
+        app.router.add_get("/connector/websocket/{socket}", self.websocket)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, "localhost", 0)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        started.set()
+        self.loop.run_forever()
+
+    async def new_socket(self, request):
+        return web.json_response({"socket": "abc"})
+
+    async def websocket(self, request):
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.sockets.append(websocket)
+        async for message in websocket:
+            self.received.append(message.data)
+            await websocket.send_str("echo " + message.data)
+        return websocket
+
+    def disconnect(self):
+        for websocket in self.sockets:
+            asyncio.run_coroutine_threadsafe(websocket.close(), self.loop)
+        self.sockets = []
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(),
+                                         self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestOpsdroidConnection(unittest.TestCase):
+    """Test the opsdroidaudio connection to opsdroid."""
+
+    def setUp(self):
+        self.server = FakeOpsdroid()
+        self.messages = []
+        self.connection = connection.OpsdroidConnection(
+            "localhost", self.server.port, on_message=self.messages.append,
+            min_backoff=0.05, max_backoff=0.1)
+
+    def tearDown(self):
+        self.connection.stop(timeout=1)
+        self.server.stop()
+
+    def test_flushes_messages_queued_before_connecting(self):
+        self.connection.send("one")
+        self.connection.send("two")
+        self.connection.start()
+        self.assertTrue(wait_for(lambda: len(self.messages) == 2))
+        self.assertTrue(self.connection.ready.is_set())
+        self.assertEqual(self.server.received, ["one", "two"])
+        self.assertEqual(self.messages, ["echo one", "echo two"])
+
+    def test_reconnects_and_sends_queued_messages(self):
+        self.connection.start()
+        self.assertTrue(wait_for(lambda: self.connection.connected))
+        self.server.disconnect()
+        self.assertTrue(wait_for(lambda: not self.connection.connected))
+        self.connection.send("while down")
+        self.assertTrue(wait_for(lambda: self.messages == ["echo while down"]))
+
+    def test_drops_oldest_when_full(self):
+        self.connection.max_queued = 2
+        for text in ["one", "two", "three"]:
+            self.connection.send(text)
+        self.assertEqual([text for text, _ in self.connection.outbound],
+                         ["two", "three"])
+
+    def test_backoff_grows_with_jitter(self):
+        self.connection.min_backoff = 1
+        self.connection.max_backoff = 4
+        delays = [self.connection.backoff() for _ in range(4)]
+        for delay, limit in zip(delays, [1, 2, 4, 4]):
+            self.assertTrue(limit / 2 <= delay <= limit)
+
+    def test_stop_while_unable_to_connect(self):
+        self.server.stop()
+        self.connection.start()
+        time.sleep(0.2)
+        start_time = time.time()
+        self.connection.stop(timeout=1)
+        self.assertLess(time.time() - start_time, 2)
+        self.assertFalse(self.connection.ready.is_set())
+        self.server = FakeOpsdroid()
+
+    def test_channels_share_the_connection(self):
+        kitchen, lounge = [], []
+        self.connection.channel("kitchen", kitchen.append).send("lights")
+        self.connection.channel("lounge", lounge.append).send("music")
+        self.connection.start()
+        self.assertTrue(wait_for(lambda: kitchen and lounge))
+        self.assertEqual(kitchen, ["echo lights"])
+        self.assertEqual(lounge, ["echo music"])
+        self.assertEqual(len(self.server.sockets), 3)
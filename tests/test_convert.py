@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+
+from opsdroidaudio import convert
+
+RATE = 16000
+
+
+def sine(frequency, rate, seconds=1, amplitude=10000):
+    times = np.arange(int(rate * seconds)) / float(rate)
+    return amplitude * np.sin(2 * np.pi * frequency * times)
+
+
+def pcm(samples):
+    return np.round(samples).astype(np.int16).tobytes()
+
+
+def samples(data):
+    return np.frombuffer(data, dtype=np.int16).astype(np.float64)
+
+
+def peak_frequency(data, rate=RATE):
+    spectrum = np.abs(np.fft.rfft(samples(data)))
+    return np.argmax(spectrum) * rate / float(len(samples(data)))
+
+
+class TestConverter(unittest.TestCase):
+    """Test the opsdroidaudio input conversion."""
+
+    def test_resamples_tone(self):
+        for rate in (8000, 44100, 48000):
+            converter = convert.Converter(rate, out_rate=RATE)
+            data = converter.convert(pcm(sine(1000, rate)))
+            self.assertEqual(len(data), 2 * RATE)
+            self.assertEqual(peak_frequency(data), 1000)
+            self.assertAlmostEqual(samples(data)[1000:].max(), 10000,
+                                   delta=300)
+
+    def test_removes_frequencies_above_nyquist(self):
+        converter = convert.Converter(48000, out_rate=RATE)
+        data = converter.convert(pcm(sine(10000, 48000)))
+        self.assertLess(np.abs(samples(data)[1000:]).max(), 20)
+
+    def test_chunks_join_seamlessly(self):
+        audio = pcm(sine(440, 44100) + sine(3000, 44100, amplitude=5000))
+        whole = convert.Converter(44100).convert(audio)
+        converter = convert.Converter(44100)
+        chunks = b"".join(converter.convert(audio[start:start + 1234])
+                          for start in range(0, len(audio), 1234))
+        self.assertEqual(chunks, whole)
+
+    def test_same_rate_passes_through(self):
+        audio = pcm(sine(440, RATE))
+        self.assertEqual(convert.Converter(RATE).convert(audio), audio)
+
+    def test_down_mix(self):
+        left = sine(440, RATE)
+        stereo = np.stack([left, -left], axis=1).ravel()
+        self.assertFalse(np.any(samples(
+            convert.Converter(RATE, 2).convert(pcm(stereo)))))
+        self.assertEqual(convert.Converter(RATE, 2, channel=1).convert(
+            pcm(stereo)), pcm(-left))
+        self.assertEqual(
+            convert.Converter(RATE, 2, weights=[0.5, 0]).convert(
+                pcm(stereo)), pcm(np.round(left) / 2))
+
+    def test_sample_formats(self):
+        audio = sine(440, RATE)
+        expected = pcm(audio)
+        packed = (np.round(audio).astype("<i4") * 256).view(
+            np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        self.assertEqual(convert.Converter(RATE, in_width=3).convert(packed),
+                         expected)
+        floats = (audio / 32768).astype(np.float32).tobytes()
+        self.assertEqual(convert.Converter(RATE, in_width=4).convert(floats),
+                         expected)
+
+    def test_create(self):
+        converter = convert.create({"rate": 48000, "channels": 2,
+                                    "channel": 0}, RATE)
+        self.assertEqual((converter.up, converter.down), (1, 3))
+        with self.assertRaises(ValueError):
+            convert.create({"rate": 48000}, RATE, channels=2)
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from opsdroidaudio import endpointer
+from helpers import RATE, make_wav
+
+
+def tones(segments, rate=RATE):
+    """Get 16 bit PCM from a list of (amplitude, milliseconds)."""
+    chunks = []
+    for amplitude, millis in segments:
+        times = np.arange(int(rate * millis / 1000)) / float(rate)
+        chunks.append(amplitude * np.sin(2 * np.pi * 440 * times))
+    return np.concatenate(chunks).astype(np.int16).tobytes()
+
+
+class TestEnergyEndpointer(unittest.TestCase):
+    """Test the opsdroidaudio energy endpointer."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def fixture(self, name, segments):
+        return make_wav(os.path.join(self.tmpdir, name), tones(segments))
+
+    def test_ends_after_silence(self):
+        path = self.fixture("speech.wav", [(10000, 1000), (0, 2000)])
+        end, reason = endpointer.endpoint_wav(path, {"silence_ms": 500})
+        self.assertEqual(reason, "silence")
+        self.assertAlmostEqual(end, 1500, delta=130)
+
+    def test_end_does_not_depend_on_chunk_size(self):
+        path = self.fixture("speech.wav", [(10000, 1000), (0, 2000)])
+        ends = [endpointer.endpoint_wav(path, {"silence_ms": 500},
+                                        chunk_frames=frames)[0]
+                for frames in (160, 2048, 4000)]
+        for end in ends:
+            self.assertAlmostEqual(end, 1500, delta=130)
+
+    def test_pause_does_not_clip_speech(self):
+        path = self.fixture("pause.wav", [(10000, 800), (0, 300),
+                                          (10000, 800), (0, 2000)])
+        end, _ = endpointer.endpoint_wav(path, {"silence_ms": 500})
+        self.assertGreater(end, 1900)
+
+    def test_max_utterance(self):
+        path = self.fixture("long.wav", [(10000, 3000)])
+        end, reason = endpointer.endpoint_wav(
+            path, {"max_utterance_ms": 1000})
+        self.assertEqual(reason, "max_length")
+        self.assertAlmostEqual(end, 1000, delta=130)
+
+    def test_file_ends_first(self):
+        path = self.fixture("short.wav", [(10000, 500)])
+        self.assertEqual(endpointer.endpoint_wav(path), (None, None))
+
+    def test_noise_floor_adapts(self):
+        loud_noise = [(6000, 1000), (6000, 3000)]
+        path = self.fixture("noise.wav", loud_noise)
+        end, reason = endpointer.endpoint_wav(
+            path, {"silence_ms": 500, "floor_rise": 0.05})
+        self.assertEqual(reason, "silence")
+        self.assertLess(end, 3000)
+
+    def test_unknown_endpointer(self):
+        with self.assertRaises(ValueError):
+            endpointer.create({"name": "magic"}, RATE)
+
+    def test_stereo(self):
+        ep = endpointer.create({"leading_ms": 0, "silence_ms": 100},
+                               RATE, channels=2)
+        ep.reset()
+        silence = np.zeros(RATE, dtype=np.int16).tobytes()
+        self.assertTrue(ep.process(silence))
@@ -1,8 +1,26 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
 import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
 
 from opsdroidaudio import generators
 
 
+def fake_playsound(path):
+    """Record the path and player process, sleeping if it asks to."""
+    with open(path, "a") as log:
+        log.write("{}\n".format(os.getpid()))
+    if "slow" in path:
+        time.sleep(10)
+
+
 class TestGenerators(unittest.TestCase):
     """Test the opsdroidaudio generators class."""
 
@@ -10,3 +28,81 @@ class TestGenerators(unittest.TestCase):
         """Test the prepare_url method"""
         response = generators.prepare_url('https://www.youtube.com')
         self.assertEqual('a link to youtube.com', response)
+
+    def test_prepare_url_many(self):
+        response = generators.prepare_url(
+            'See https://github.com/opsdroid/opsdroid and '
+            'http://www.example.org/docs?page=1 for details')
+        self.assertEqual('See a link to github.com and a link to '
+                         'example.org for details', response)
+
+    def test_prepare_url_without_dots(self):
+        response = generators.prepare_url(
+            'The dashboard is on http://localhost:8080/x now')
+        self.assertEqual('The dashboard is on a link to localhost now',
+                         response)
+
+    def test_prepare_url_in_brackets(self):
+        response = generators.prepare_url(
+            'Check the docs (https://docs.python.org/3/).')
+        self.assertEqual('Check the docs (a link to docs.python.org).',
+                         response)
+
+    def test_prepare_url_no_url(self):
+        self.assertEqual('Hello there', generators.prepare_url('Hello there'))
+
+    def test_split_sentences(self):
+        chunks = generators.split_sentences(
+            'OK. The deployment has finished!  Logs are at '
+            'https://www.example.com/logs.\n\nAnything else?')
+        self.assertEqual(['OK. The deployment has finished!',
+                          'Logs are at a link to example.com.',
+                          'Anything else?'], chunks)
+
+    def test_split_sentences_after_url(self):
+        chunks = generators.split_sentences(
+            'Read more at https://example.com. Then tell me what you think.')
+        self.assertEqual(['Read more at a link to example.com.',
+                          'Then tell me what you think.'], chunks)
+
+
+class TestFilePlayer(unittest.TestCase):
+    """Test playing files in a child process."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        playsound = types.ModuleType("playsound")
+        playsound.playsound = fake_playsound
+        patcher = mock.patch.dict(sys.modules, {"playsound": playsound})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def played_by(self, name):
+        with open(os.path.join(self.tmpdir, name)) as log:
+            return log.read().split()
+
+    def test_reuses_one_process(self):
+        player = generators.FilePlayer(lambda: False)
+        self.addCleanup(player.close)
+        player.play(os.path.join(self.tmpdir, "first.mp3"))
+        player.play(os.path.join(self.tmpdir, "second.mp3"))
+        self.assertEqual(self.played_by("first.mp3"),
+                         self.played_by("second.mp3"))
+        self.assertNotEqual(self.played_by("first.mp3"),
+                            [str(os.getpid())])
+
+    def test_cancel_restarts_process(self):
+        cancel_at = time.time() + 0.2
+        player = generators.FilePlayer(lambda: time.time() > cancel_at)
+        self.addCleanup(player.close)
+        player.play(os.path.join(self.tmpdir, "slow.mp3"))
+        self.assertLess(time.time() - cancel_at, 5)
+        self.assertIsNone(player.process)
+
+        cancel_at = time.time() + 60
+        player.play(os.path.join(self.tmpdir, "after.mp3"))
+        self.assertNotEqual(self.played_by("slow.mp3"),
+                            self.played_by("after.mp3"))
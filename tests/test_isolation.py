@@ -0,0 +1,150 @@
+import itertools
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from opsdroidaudio import audio, isolation, metrics
+from helpers import FakeSource, make_wav, silence
+
+
+MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), "opsdroidaudio", "models", "snowboy.pmdl")
+
+
+class SharedConnection:
+    """A pipe end which the parent can't close, as the thread shares it."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def close(self):
+        pass
+
+
+class ThreadContext:
+    """Run the detector "process" on a thread so mocks still apply."""
+
+    Event = threading.Event
+
+    @staticmethod
+    def Pipe():
+        parent, child = multiprocessing.Pipe()
+        return parent, SharedConnection(child)
+
+    @staticmethod
+    def Process(target, args, daemon):
+        return threading.Thread(target=target, args=args, daemon=daemon)
+
+
+@unittest.skipIf(sys.version_info < (3, 8), "needs shared memory")
+class TestIsolatedDetector(unittest.TestCase):
+    """Test driving a detector in another process."""
+
+    def make_detector(self, chunks, **kwargs):
+        snowboy = mock.Mock()
+        snowboy.NumHotwords.return_value = 1
+        snowboy.NumChannels.return_value = 1
+        snowboy.BitsPerSample.return_value = 16
+        snowboy.SampleRate.return_value = 16000
+        snowboy.RunDetection.side_effect = \
+            lambda data: 1 if data == b"\x01\x00" * 160 else 0
+        with mock.patch.object(audio.snowboydetect, "SnowboyDetect",
+                               return_value=snowboy):
+            return isolation.IsolatedDetector(
+                decoder_model="model.pmdl", source=FakeSource(chunks),
+                detection_config={"block_ms": 10, "enabled": False},
+                context=ThreadContext(), **kwargs)
+
+    def test_callbacks(self):
+        registry = metrics.Metrics()
+        silence = b"\x00\x00" * 160
+        hotword = b"\x01\x00" * 160
+        detector = self.make_detector([silence, hotword, silence, silence],
+                                      metrics=registry)
+        self.addCleanup(detector.terminate)
+        self.assertEqual(detector.detector.SampleRate(), 16000)
+        detected, recorded, streamed = mock.Mock(), mock.Mock(), mock.Mock()
+        detector.start(detected_callback=detected,
+                       recording_callback=recorded, stream_callback=streamed)
+        detected.assert_called_once_with(hotword, detector)
+        recorded.assert_called_once_with(mock.ANY, detector)
+        self.assertEqual(bytes(recorded.call_args[0][0].buffer()),
+                         hotword + silence * 2)
+        self.assertEqual(b"".join(call[0][0] for call in
+                                  streamed.call_args_list),
+                         hotword + silence * 2)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["hotwords_detected_total"], 1)
+        self.assertGreater(
+            snapshot["detector_process_delay_seconds"]["count"], 0)
+        self.assertEqual(snapshot["detector_process_dropped_bytes_total"], 0)
+
+    def test_stop(self):
+        detector = self.make_detector([b"\x00\x00" * 160] * 100000)
+        self.addCleanup(detector.terminate)
+        thread = threading.Thread(target=detector.start)
+        thread.start()
+        detector.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_start_after_stop(self):
+        detector = self.make_detector(itertools.repeat(b"\x00\x00" * 160))
+        self.addCleanup(detector.terminate)
+        thread = threading.Thread(target=detector.start)
+        thread.start()
+        detector.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+        thread = threading.Thread(target=detector.start)
+        thread.start()
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        detector.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_ring_must_hold_hotword_chunk(self):
+        with self.assertRaises(ValueError):
+            self.make_detector([], ring_kb=1)
+
+    def test_spawned_process(self):
+        if subprocess.call([sys.executable, "-c",
+                            "from snowboydetect import snowboydetect"],
+                           stderr=subprocess.DEVNULL):
+            self.skipTest("snowboydetect can't be imported by a new "
+                          "interpreter")
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = make_wav(os.path.join(tmpdir, "silence.wav"), silence(1))
+        registry = metrics.Metrics()
+        detector = isolation.IsolatedDetector(
+            ring_kb=64, metrics=registry, decoder_model=MODEL,
+            source_config={"name": "wav", "path": path, "realtime": False})
+        try:
+            self.assertEqual(detector.detector.SampleRate(), 16000)
+            self.assertEqual(detector.detector.NumHotwords(), 1)
+            detector.start(detected_callback=mock.Mock())
+        finally:
+            detector.terminate()
+        self.assertFalse(detector.process.is_alive())
+        self.assertEqual(registry.snapshot()[
+            "detector_process_dropped_bytes_total"], 0)
+
+    def test_needs_shared_memory(self):
+        with mock.patch.object(isolation.sys, "version_info", (3, 6, 9)):
+            with self.assertRaises(RuntimeError):
+                isolation.IsolatedDetector(decoder_model=MODEL)
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+from opsdroidaudio import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """Test the opsdroidaudio metrics."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_render(self):
+        registry = metrics.Metrics()
+        registry.counter("frames_total", "Frames.").inc(3)
+        registry.gauge("depth", "Depth.", lambda: 2)
+        histogram = registry.histogram("latency_seconds", "Latency.",
+                                       buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(registry.render().splitlines(), [
+            "# HELP opsdroidaudio_frames_total Frames.",
+            "# TYPE opsdroidaudio_frames_total counter",
+            "opsdroidaudio_frames_total 3",
+            "# HELP opsdroidaudio_depth Depth.",
+            "# TYPE opsdroidaudio_depth gauge",
+            "opsdroidaudio_depth 2",
+            "# HELP opsdroidaudio_latency_seconds Latency.",
+            "# TYPE opsdroidaudio_latency_seconds histogram",
+            'opsdroidaudio_latency_seconds_bucket{le="0.1"} 1',
+            'opsdroidaudio_latency_seconds_bucket{le="1"} 2',
+            'opsdroidaudio_latency_seconds_bucket{le="+Inf"} 3',
+            "opsdroidaudio_latency_seconds_sum 5.55",
+            "opsdroidaudio_latency_seconds_count 3",
+        ])
+
+    def test_same_name_shares_metric(self):
+        registry = metrics.Metrics()
+        self.assertIs(registry.counter("a", "A."), registry.counter("a", "A."))
+
+    def test_null_metrics(self):
+        counter = metrics.NULL.counter("frames_total", "Frames.")
+        counter.inc()
+        metrics.NULL.histogram("latency", "Latency.").observe(1)
+        self.assertEqual(counter.value, 0)
+        self.assertEqual(metrics.NULL.render(), "\n")
+
+    def test_json_dumper(self):
+        registry = metrics.Metrics()
+        registry.counter("frames_total", "Frames.").inc()
+        registry.histogram("latency", "Latency.").observe(2)
+        path = os.path.join(self.tmpdir, "metrics.json")
+        metrics.JsonDumper(registry, path).dump()
+        with open(path) as stream:
+            self.assertEqual(json.load(stream), {
+                "frames_total": 1,
+                "latency": {"count": 1, "sum": 2.0, "mean": 2.0}})
+
+    def test_server(self):
+        registry = metrics.Metrics()
+        registry.counter("frames_total", "Frames.").inc()
+        server = metrics.MetricsServer(registry, port=0)
+        server.start()
+        try:
+            body = urlopen("http://localhost:{}/metrics".format(
+                server.server.server_address[1])).read().decode("utf8")
+        finally:
+            server.stop()
+        self.assertIn("opsdroidaudio_frames_total 1", body)
+
+    def test_create_exporters(self):
+        exporters = metrics.create_exporters(
+            {"json_file": os.path.join(self.tmpdir, "metrics.json")},
+            metrics.Metrics())
+        self.assertEqual([type(exporter) for exporter in exporters],
+                         [metrics.JsonDumper])
+
+    def test_labelled(self):
+        registry = metrics.Metrics()
+        registry.labelled(room="kitchen").counter("frames_total",
+                                                  "Frames.").inc(1)
+        registry.labelled(room="lounge").counter("frames_total",
+                                                 "Frames.").inc(2)
+        registry.labelled(room="lounge").histogram(
+            "latency", "Latency.", buckets=(1,)).observe(0.5)
+        self.assertEqual(registry.render().splitlines(), [
+            "# HELP opsdroidaudio_frames_total Frames.",
+            "# TYPE opsdroidaudio_frames_total counter",
+            'opsdroidaudio_frames_total{room="kitchen"} 1',
+            'opsdroidaudio_frames_total{room="lounge"} 2',
+            "# HELP opsdroidaudio_latency Latency.",
+            "# TYPE opsdroidaudio_latency histogram",
+            'opsdroidaudio_latency_bucket{room="lounge",le="1"} 1',
+            'opsdroidaudio_latency_bucket{room="lounge",le="+Inf"} 1',
+            'opsdroidaudio_latency_sum{room="lounge"} 0.5',
+            'opsdroidaudio_latency_count{room="lounge"} 1',
+        ])
+        self.assertIs(metrics.NULL.labelled(room="kitchen"), metrics.NULL)
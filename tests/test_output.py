@@ -0,0 +1,126 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import wave
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+import numpy as np
+
+from opsdroidaudio import output
+
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DING = os.path.join(TOP_DIR, "opsdroidaudio", "resources", "ding.wav")
+DONG = os.path.join(TOP_DIR, "opsdroidaudio", "resources", "dong.wav")
+
+
+def tone(seconds, amplitude=1000, rate=16000):
+    samples = np.full(int(rate * seconds), amplitude, dtype=np.int16)
+    return output.Sound(samples.tobytes(), rate, 1, 2)
+
+
+class TestOutputEngine(unittest.TestCase):
+    """Test the opsdroidaudio output engine."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_preloads_cues(self):
+        engine = output.OutputEngine(output.NullSink(), cues=[DING, DONG])
+        self.assertEqual(engine.cues[DING], output.load_wav(DING))
+        self.assertEqual(engine.cues[DONG].rate, 16000)
+
+    def test_play_cue_does_not_block(self):
+        sink = output.NullSink(realtime=True)
+        engine = output.OutputEngine(sink, cues=[DING])
+        engine.start()
+        start_time = time.time()
+        engine.play_cue(DING)
+        self.assertLess(time.time() - start_time, 0.1)
+        engine.play(tone(0.01), block=True)
+        engine.stop()
+        self.assertAlmostEqual(sink.seconds_written,
+                               7869 / 16000.0 + 0.01, places=3)
+
+    def test_file_sink(self):
+        path = os.path.join(self.tmpdir, "out.wav")
+        engine = output.OutputEngine(output.create_sink(
+            {"sink": "file", "path": path}), cues=[DING])
+        engine.start()
+        engine.play_cue(DING)
+        engine.play(tone(0.5), block=True)
+        engine.stop()
+        wav = wave.open(path, 'rb')
+        self.assertEqual(wav.getnframes(), 7869 + 8000)
+        wav.close()
+
+    def test_pyaudio_sink_keeps_one_stream(self):
+        pyaudio = mock.MagicMock()
+        with mock.patch.dict(sys.modules, {"pyaudio": pyaudio}):
+            sink = output.PyAudioSink(rate=16000)
+        stream = pyaudio.PyAudio.return_value.open.return_value
+        sink.write(tone(0.1).data, 16000, 1, 2)
+        sink.write(tone(0.1, rate=8000).data, 8000, 1, 2)
+        sink.write(tone(0.1).data * 2, 16000, 2, 2)
+        sink.close()
+        pyaudio.PyAudio.return_value.open.assert_called_once()
+        self.assertEqual([len(call[0][0]) for call in
+                          stream.write.call_args_list], [3200] * 3)
+
+    def test_mixes_cue_into_playing_sound(self):
+        engine = output.OutputEngine(output.NullSink())
+        cue = tone(0.1, amplitude=500)
+        mixed, remaining = engine.mix(tone(0.05).data, [(cue, 0)])
+        self.assertEqual(np.frombuffer(mixed, dtype=np.int16)[0], 1500)
+        self.assertEqual(remaining, [(cue, 1600)])
+
+    def test_mix_clips(self):
+        engine = output.OutputEngine(output.NullSink())
+        mixed, remaining = engine.mix(tone(0.01, 30000).data,
+                                      [(tone(0.01, 30000), 0)])
+        self.assertEqual(np.frombuffer(mixed, dtype=np.int16).max(), 32767)
+        self.assertEqual(remaining, [])
+
+    def test_fallback_player(self):
+        played = []
+        engine = output.OutputEngine(output.NullSink(),
+                                     fallback=played.append)
+        engine.start()
+        engine.play_file("speech.mp3")
+        engine.stop()
+        self.assertEqual(played, ["speech.mp3"])
+
+    def test_cancel_stops_playback(self):
+        path = os.path.join(self.tmpdir, "out.wav")
+        engine = output.OutputEngine(output.FileSink(path, realtime=True),
+                                     cues=[DING])
+        engine.start()
+        done = engine.play(tone(2))
+        engine.play(tone(2))
+        time.sleep(0.2)
+        start_time = time.time()
+        engine.cancel()
+        engine.play_cue(DING)
+        self.assertTrue(done.wait(1))
+        self.assertLess(time.time() - start_time, 0.1)
+        engine.play(tone(0.1), block=True)
+        engine.stop()
+        wav = wave.open(path, 'rb')
+        seconds = wav.getnframes() / 16000.0
+        wav.close()
+        self.assertLess(seconds, 0.4 + 7869 / 16000.0 + 0.1)
+        self.assertFalse(engine.active())
+        self.assertTrue(engine.active(tail=1))
+
+    def test_unknown_sink(self):
+        with self.assertRaises(ValueError):
+            output.create_sink({"sink": "gramophone"})
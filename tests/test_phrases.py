@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from opsdroidaudio import phrases
+
+
+class TestPhrases(unittest.TestCase):
+    """Test the opsdroidaudio phrase sets."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        phrases.LOADED.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, contents):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as phrase_file:
+            phrase_file.write(contents)
+        return path
+
+    def test_phrase_set(self):
+        phrase_set = phrases.PhraseSet(
+            ["Turn the lights on!", "what's the time", "turn  the lights ON",
+             " "])
+        self.assertEqual(phrase_set.phrases,
+                         ["turn the lights on", "what's the time"])
+        self.assertEqual(phrase_set.grammar(),
+                         "#JSGF V1.0;\ngrammar phrases;\n"
+                         "public <phrase> = turn the lights on |\n"
+                         "    what's the time;\n")
+        self.assertEqual(phrase_set.keywords(1e-10),
+                         "turn the lights on /1e-10/\n"
+                         "what's the time /1e-10/\n")
+        self.assertEqual(
+            phrase_set.restrict({"turn", "the", "lights", "on"}).phrases,
+            ["turn the lights on"])
+
+    def test_load_from_config_and_file(self):
+        path = self.write("phrases.txt", "# Lights\nlights off\n\n")
+        config = {"list": ["Lights on"], "file": path, "cache": self.tmpdir,
+                  "threshold": 1e-60}
+        bias = phrases.load(config)
+        self.assertEqual(bias.hints, ["lights off", "lights on"])
+        self.assertEqual(bias.keyword_entries(),
+                         [("lights off", 0.5), ("lights on", 0.5)])
+        self.assertIs(phrases.load(dict(config)), bias)
+        self.assertIsNone(phrases.load(None))
+        self.assertIsNone(phrases.load({"list": ["?"]}))
+
+    def test_compiled_file_changes_with_phrases(self):
+        dictionary = self.write("words.dict",
+                                "lights L AY T S\non AA N\non(2) AO N\n")
+        first = phrases.CompiledPhrases(
+            phrases.PhraseSet(["lights on", "lights dim"]), self.tmpdir,
+            dictionary)
+        path = first.sphinx_file()
+        with open(path) as grammar:
+            self.assertIn("= lights on;", grammar.read())
+        self.assertEqual(first.sphinx_file(), path)
+        second = phrases.CompiledPhrases(
+            phrases.PhraseSet(["lights on", "on"]), self.tmpdir, dictionary)
+        self.assertNotEqual(second.sphinx_file(), path)
+        keywords = phrases.CompiledPhrases(
+            phrases.PhraseSet(["lights on"]), self.tmpdir, mode="keywords")
+        self.assertTrue(keywords.sphinx_file().endswith(".kws"))
+        unknown = phrases.CompiledPhrases(
+            phrases.PhraseSet(["lights dim"]), self.tmpdir, dictionary)
+        self.assertIsNone(unknown.sphinx_file())
+
+    def test_fetch_falls_back_to_last_copy(self):
+        response = mock.MagicMock()
+        response.__enter__.return_value.read.return_value = \
+            b'["lights on", "lights off"]'
+        with mock.patch("urllib.request.urlopen", return_value=response):
+            self.assertEqual(phrases.fetch("http://opsdroid/phrases",
+                                           self.tmpdir),
+                             ["lights on", "lights off"])
+        with mock.patch("urllib.request.urlopen", side_effect=OSError):
+            self.assertEqual(phrases.fetch("http://opsdroid/phrases",
+                                           self.tmpdir),
+                             ["lights on", "lights off"])
+            self.assertEqual(phrases.fetch("http://other/phrases",
+                                           self.tmpdir), [])
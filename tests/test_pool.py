@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from opsdroidaudio import pool
+
+
+def slow_echo(value, delay):
+    time.sleep(delay)
+    return value
+
+
+class TestRecognitionPool(unittest.TestCase):
+    """Test the opsdroidaudio recognition pool."""
+
+    def setUp(self):
+        self.delivered = []
+
+    def test_delivers_in_submission_order(self):
+        recognition_pool = pool.RecognitionPool(self.delivered.append,
+                                                workers=3)
+        for value, delay in (("one", 0.1), ("two", 0.0), ("three", 0.05)):
+            recognition_pool.submit(slow_echo, value, delay)
+        recognition_pool.stop()
+        self.assertEqual(self.delivered, ["one", "two", "three"])
+
+    def test_submit_does_not_block(self):
+        recognition_pool = pool.RecognitionPool(self.delivered.append)
+        start = time.time()
+        recognition_pool.submit(slow_echo, "one", 0.2)
+        self.assertLess(time.time() - start, 0.1)
+        recognition_pool.stop()
+        self.assertEqual(self.delivered, ["one"])
+
+    def test_drop_newest(self):
+        recognition_pool = pool.RecognitionPool(
+            self.delivered.append, workers=1, max_pending=1,
+            overflow="drop_newest")
+        self.assertTrue(recognition_pool.submit(slow_echo, "one", 0.1))
+        self.assertFalse(recognition_pool.submit(slow_echo, "two", 0))
+        recognition_pool.stop()
+        self.assertEqual(self.delivered, ["one"])
+        self.assertEqual(recognition_pool.dropped, 1)
+
+    def test_drop_oldest(self):
+        recognition_pool = pool.RecognitionPool(
+            self.delivered.append, workers=1, max_pending=2,
+            overflow="drop_oldest")
+        recognition_pool.submit(slow_echo, "one", 0.1)
+        time.sleep(0.02)
+        recognition_pool.submit(slow_echo, "two", 0)
+        recognition_pool.submit(slow_echo, "three", 0)
+        recognition_pool.stop()
+        self.assertEqual(self.delivered, ["one", "three"])
+        self.assertEqual(recognition_pool.dropped, 1)
+
+    def test_block(self):
+        recognition_pool = pool.RecognitionPool(
+            self.delivered.append, workers=1, max_pending=1,
+            overflow="block")
+        recognition_pool.submit(slow_echo, "one", 0.1)
+        start = time.time()
+        recognition_pool.submit(slow_echo, "two", 0)
+        self.assertGreater(time.time() - start, 0.05)
+        recognition_pool.stop()
+        self.assertEqual(self.delivered, ["one", "two"])
+
+    def test_failed_job_is_skipped(self):
+        def fail():
+            raise RuntimeError("recognizer broke")
+        recognition_pool = pool.RecognitionPool(self.delivered.append)
+        recognition_pool.submit(fail)
+        recognition_pool.submit(slow_echo, "two", 0)
+        recognition_pool.stop()
+        self.assertEqual(self.delivered, ["two"])
+
+    def test_process_executor(self):
+        recognition_pool = pool.RecognitionPool(
+            self.delivered.append, executor="process")
+        recognition_pool.submit(slow_echo, "one", 0)
+        recognition_pool.stop()
+        self.assertEqual(self.delivered, ["one"])
+
+    def test_initializer_without_executor_support(self):
+        started = []
+        with mock.patch.object(pool, "INITIALIZER_SUPPORTED", False):
+            recognition_pool = pool.RecognitionPool(
+                self.delivered.append, workers=2,
+                initializer=started.append, initargs=("warm",))
+        recognition_pool.submit(slow_echo, "one", 0)
+        recognition_pool.stop()
+        self.assertEqual(started, ["warm", "warm"])
+        self.assertEqual(self.delivered, ["one"])
+
+    def test_bad_config(self):
+        with self.assertRaises(ValueError):
+            pool.RecognitionPool(self.delivered.append, overflow="explode")
+        with self.assertRaises(ValueError):
+            pool.RecognitionPool(self.delivered.append, executor="quantum")
+
+    def test_deliver_called_from_one_thread(self):
+        threads = set()
+        recognition_pool = pool.RecognitionPool(
+            lambda result: threads.add(threading.current_thread()),
+            workers=4)
+        for _ in range(8):
+            recognition_pool.submit(slow_echo, None, 0.01)
+        recognition_pool.stop()
+        self.assertEqual(len(threads), 1)
+
+    def test_on_drop(self):
+        dropped = []
+        recognition_pool = pool.RecognitionPool(
+            self.delivered.append, workers=1, max_pending=2)
+        recognition_pool.submit(slow_echo, "one", 0.1)
+        time.sleep(0.02)
+        recognition_pool.submit(slow_echo, "two", 0,
+                                on_drop=lambda: dropped.append("two"))
+        recognition_pool.submit(slow_echo, "three", 0)
+        recognition_pool.stop()
+        self.assertEqual(dropped, ["two"])
+
+    def test_deliver_per_job(self):
+        kitchen = []
+        recognition_pool = pool.RecognitionPool(self.delivered.append)
+        recognition_pool.submit(slow_echo, "one", 0.05,
+                                deliver=kitchen.append)
+        recognition_pool.submit(slow_echo, "two", 0)
+        recognition_pool.stop()
+        self.assertEqual(kitchen, ["one"])
+        self.assertEqual(self.delivered, ["two"])
@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+from opsdroidaudio import metrics, postprocess
+
+RATE = 16000
+
+
+def tone(seconds, amplitude):
+    samples = np.arange(int(RATE * seconds))
+    return (amplitude * np.sin(samples * 0.3)).astype(np.int16).tobytes()
+
+
+def silence(seconds):
+    return b"\x00\x00" * int(RATE * seconds)
+
+
+class TestPostprocessor(unittest.TestCase):
+    """Test the opsdroidaudio utterance postprocessor."""
+
+    def test_trims_silence(self):
+        processor = postprocess.Postprocessor(RATE, padding_ms=100,
+                                              normalize=False)
+        speech = tone(1, 8000)
+        data = processor.process(silence(1) + speech + silence(2))
+        self.assertEqual(len(data), len(speech) + 2 * len(silence(0.1)))
+        self.assertEqual(data[len(silence(0.1)):-len(silence(0.1))], speech)
+
+    def test_keeps_recordings_without_speech(self):
+        processor = postprocess.Postprocessor(RATE, normalize=False)
+        data = tone(0.5, 100)
+        self.assertEqual(processor.process(data), data)
+
+    def test_strips_hotword(self):
+        processor = postprocess.Postprocessor(
+            RATE, strip_hotword=True, padding_ms=0, normalize=False)
+        hotword = tone(0.5, 10000)
+        data = processor.process(hotword + silence(0.5) + tone(1, 8000),
+                                 hotword_bytes=len(hotword))
+        self.assertEqual(data, tone(1, 8000))
+
+    def test_normalizes_volume(self):
+        processor = postprocess.Postprocessor(RATE, trim=False, peak=0.5)
+        quiet = processor.process(tone(1, 5000))
+        self.assertEqual(np.abs(np.frombuffer(quiet, np.int16)).max(), 16383)
+        processor.max_gain = 2
+        louder = processor.process(tone(1, 1000))
+        self.assertEqual(np.frombuffer(louder, np.int16).max(),
+                         2 * np.frombuffer(tone(1, 1000), np.int16).max())
+
+    def test_stereo(self):
+        processor = postprocess.Postprocessor(RATE, channels=2, padding_ms=0,
+                                              normalize=False)
+        speech = np.repeat(np.frombuffer(tone(1, 8000), np.int16),
+                           2).tobytes()
+        quiet = silence(1) * 2
+        self.assertEqual(processor.process(quiet + speech + quiet), speech)
+
+    def test_records_audio_saved(self):
+        registry = metrics.Metrics()
+        processor = postprocess.create({"normalize": False}, RATE,
+                                       metrics=registry)
+        processor.process(silence(2) + tone(1, 8000) + silence(2))
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["postprocess_saved_bytes_total"],
+                         len(silence(3.6)))
+        self.assertEqual(snapshot["postprocess_saved_seconds"]["count"], 1)
+
+    def test_options_are_keyword_only(self):
+        with self.assertRaises(TypeError):
+            postprocess.Postprocessor(RATE, 2, 1, False)
+
+    def test_create_disabled(self):
+        self.assertIsNone(postprocess.create(None, RATE))
@@ -0,0 +1,267 @@
+import time
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from opsdroidaudio import metrics, recognizers
+
+
+class TestStreamingRecognizers(unittest.TestCase):
+    """Test the opsdroidaudio streaming recognizers."""
+
+    def test_batch_recognizer(self):
+        function = mock.Mock(return_value="hello")
+        recognizer = recognizers.BatchRecognizer(function, {}, 16000)
+        recognizer.start()
+        recognizer.feed(b"\x00\x01")
+        recognizer.feed(b"\x02\x03")
+        self.assertEqual(recognizer.partial(), "")
+        self.assertEqual(recognizer.finish(), "hello")
+        function.assert_called_once_with({}, b"\x00\x01\x02\x03", 16000)
+
+    def test_batch_recognizer_restarts(self):
+        function = mock.Mock(return_value="")
+        recognizer = recognizers.BatchRecognizer(function, {}, 16000)
+        recognizer.start()
+        recognizer.feed(b"\x00\x01")
+        recognizer.start()
+        recognizer.feed(b"\x02\x03")
+        recognizer.finish()
+        function.assert_called_once_with({}, b"\x02\x03", 16000)
+
+    def test_batch_recognizer_cancel(self):
+        function = mock.Mock(return_value="")
+        recognizer = recognizers.BatchRecognizer(function, {}, 16000)
+        recognizer.start()
+        recognizer.feed(b"\x00\x01")
+        recognizer.cancel()
+        recognizer.finish()
+        function.assert_called_once_with({}, b"", 16000)
+
+    def test_batch_recognizer_postprocess(self):
+        function = mock.Mock(return_value="hello")
+        recognizer = recognizers.BatchRecognizer(
+            function, {}, 16000, postprocess=lambda data: data[2:])
+        recognizer.start()
+        recognizer.feed(b"\x00\x01\x02\x03")
+        recognizer.finish()
+        function.assert_called_once_with({}, b"\x02\x03", 16000)
+
+    def test_sphinx_streaming_recognizer(self):
+        recognizer = recognizers.SphinxStreamingRecognizer({}, 16000)
+        decoder = mock.Mock()
+        decoder.hyp.return_value.hypstr = "turn on the lights"
+        recognizer.load_decoder = mock.Mock(return_value=decoder)
+        recognizer.start()
+        recognizer.start()
+        recognizer.load_decoder.assert_called_once_with()
+        recognizer.feed(b"\x00\x01")
+        decoder.process_raw.assert_called_once_with(b"\x00\x01", False,
+                                                    False)
+        self.assertEqual(recognizer.partial(), "turn on the lights")
+        self.assertEqual(recognizer.finish(), "turn on the lights")
+        decoder.end_utt.assert_called_once_with()
+
+    def test_sphinx_streaming_cancel(self):
+        recognizer = recognizers.SphinxStreamingRecognizer(
+            {}, 16000, decoder=mock.Mock())
+        recognizer.start()
+        recognizer.feed(b"\x00\x01")
+        recognizer.cancel()
+        recognizer.decoder.end_utt.assert_called_once_with()
+        recognizer.decoder.hyp.assert_not_called()
+
+    def test_sphinx_streaming_no_speech(self):
+        recognizer = recognizers.SphinxStreamingRecognizer({}, 16000)
+        recognizer.decoder = mock.Mock()
+        recognizer.decoder.hyp.return_value = None
+        self.assertEqual(recognizer.finish(), "")
+
+    def test_engine_streams_through_batch_recognizer(self):
+        with mock.patch.object(recognizers, "RECOGNIZERS",
+                               {"fake": mock.Mock(return_value="hello")}):
+            engine = recognizers.create_engine({"name": "fake"},
+                                               warm_up=False)
+            recognizer = engine.stream()
+            recognizer.start()
+            recognizer.feed(b"\x00\x01")
+            self.assertEqual(recognizer.finish(), "hello")
+        self.assertIsInstance(recognizer, recognizers.BatchRecognizer)
+
+    def test_sphinx_engine_streams_with_its_decoder(self):
+        engine = recognizers.SphinxEngine({"name": "sphinx"})
+        engine.decoder = mock.Mock()
+        recognizer = engine.stream()
+        self.assertIsInstance(recognizer,
+                              recognizers.SphinxStreamingRecognizer)
+        recognizer.start()
+        engine.decoder.start_utt.assert_called_once_with()
+
+
+class FakeEngine(recognizers.Engine):
+    """An engine which counts how often it is loaded and used."""
+
+    loads = 0
+
+    def load(self):
+        FakeEngine.loads += 1
+
+    def recognize(self, data):
+        return "heard {} bytes".format(len(data))
+
+
+class TestEngines(unittest.TestCase):
+    """Test the opsdroidaudio recognizer engines."""
+
+    def setUp(self):
+        FakeEngine.loads = 0
+        recognizers.ENGINES["fake"] = FakeEngine
+
+    def tearDown(self):
+        del recognizers.ENGINES["fake"]
+
+    def test_create_engine_loads_once(self):
+        engine = recognizers.create_engine({"name": "fake"})
+        self.assertEqual(FakeEngine.loads, 1)
+        self.assertEqual(engine.recognize(b"\x00" * 4), "heard 4 bytes")
+        self.assertEqual(engine.recognize(b"\x00" * 6), "heard 6 bytes")
+        self.assertEqual(FakeEngine.loads, 1)
+
+    def test_warm_up(self):
+        engine = FakeEngine({"name": "fake"})
+        engine.recognize = mock.Mock()
+        engine.warm_up(seconds=1)
+        engine.recognize.assert_called_once_with(b"\x00\x00" * 16000)
+
+    def test_default_stream_buffers(self):
+        engine = recognizers.create_engine({"name": "fake"})
+        stream = engine.stream()
+        stream.start()
+        stream.feed(b"\x00\x00")
+        stream.feed(b"\x00\x00")
+        self.assertEqual(stream.finish(), "heard 4 bytes")
+
+    def test_function_engine(self):
+        with mock.patch.dict(recognizers.RECOGNIZERS,
+                             {"custom": mock.Mock(return_value="hi")}):
+            engine = recognizers.create_engine({"name": "custom"})
+            self.assertIsInstance(engine, recognizers.FunctionEngine)
+            self.assertEqual(engine.recognize(b""), "hi")
+
+    def test_sphinx_engine_reuses_decoder(self):
+        engine = recognizers.SphinxEngine({"name": "sphinx"})
+        engine.decoder = mock.Mock()
+        engine.decoder.hyp.return_value.hypstr = "hello"
+        self.assertEqual(engine.recognize(b"\x00\x00"), "hello")
+        engine.decoder.process_raw.assert_called_once_with(b"\x00\x00",
+                                                           False, True)
+        self.assertIs(engine.stream().decoder, engine.decoder)
+
+    def test_engine_pool(self):
+        engines = recognizers.EnginePool(
+            lambda: recognizers.create_engine({"name": "fake"}), size=2)
+        self.assertEqual(FakeEngine.loads, 2)
+        first = engines.acquire()
+        second = engines.acquire()
+        self.assertIsNot(first, second)
+        self.assertIsNone(engines.acquire(block=False))
+        engines.release(first)
+        self.assertIs(engines.acquire(block=False), first)
+        engines.release(first)
+        self.assertEqual(engines.recognize(b"\x00\x00"), "heard 2 bytes")
+        self.assertIs(engines.acquire(block=False), first)
+
+    def test_worker_engine(self):
+        recognizers.init_worker({"name": "fake"})
+        self.assertEqual(recognizers.recognize_in_worker(b"\x00\x00"),
+                         "heard 2 bytes")
+
+    def test_worker_engine_loads_lazily(self):
+        recognizers.WORKER_ENGINE = None
+        for _ in range(2):
+            self.assertEqual(recognizers.recognize_in_worker(
+                b"\x00\x00", {"name": "fake"}), "heard 2 bytes")
+        self.assertEqual(FakeEngine.loads, 1)
+
+
+class DelayedEngine(recognizers.Engine):
+    """An engine which takes `delay` seconds to return `text`."""
+
+    def recognize(self, data):
+        time.sleep(self.config.get("delay", 0))
+        if self.config.get("error"):
+            raise RuntimeError("Unable to recognize")
+        return self.config.get("text", "")
+
+
+class TestMultiEngines(unittest.TestCase):
+    """Test the opsdroidaudio fallback and race recognizer engines."""
+
+    def setUp(self):
+        recognizers.ENGINES["local"] = DelayedEngine
+        recognizers.ENGINES["cloud"] = DelayedEngine
+        self.metrics = metrics.Metrics()
+
+    def tearDown(self):
+        del recognizers.ENGINES["local"]
+        del recognizers.ENGINES["cloud"]
+
+    def create(self, name, *engines):
+        return recognizers.create_engine(
+            {"name": name, "engines": list(engines)}, warm_up=False,
+            metrics=self.metrics)
+
+    def stat(self, name, engine):
+        return self.metrics.snapshot().get(
+            '{}{{engine="{}"}}'.format(name, engine), 0)
+
+    def test_fallback_on_empty_and_error(self):
+        engine = self.create("fallback",
+                             {"name": "local", "text": ""},
+                             {"name": "cloud", "error": True},
+                             {"name": "local", "text": "hello"})
+        self.assertEqual(engine.recognize(b""), "hello")
+        self.assertEqual(self.stat("recognizer_failures_total", "cloud"), 1)
+        self.assertEqual(self.stat("recognizer_wins_total", "local"), 1)
+
+    def test_fallback_on_timeout(self):
+        engine = self.create(
+            "fallback",
+            {"name": "cloud", "text": "slow", "delay": 0.5, "timeout": 0.05},
+            {"name": "local", "text": "fast"})
+        start_time = time.time()
+        self.assertEqual(engine.recognize(b""), "fast")
+        self.assertLess(time.time() - start_time, 0.4)
+        self.assertEqual(self.stat("recognizer_timeouts_total", "cloud"), 1)
+        # The slow engine is skipped while it is still busy.
+        self.assertEqual(engine.recognize(b""), "fast")
+        self.assertEqual(self.stat("recognizer_timeouts_total", "cloud"), 1)
+
+    def test_race_takes_first_transcript(self):
+        engine = self.create("race",
+                             {"name": "cloud", "text": "cloud", "delay": 0.3},
+                             {"name": "local", "text": "local", "delay": 0.05})
+        start_time = time.time()
+        self.assertEqual(engine.recognize(b""), "local")
+        self.assertLess(time.time() - start_time, 0.25)
+        self.assertEqual(self.stat("recognizer_wins_total", "local"), 1)
+
+    def test_race_ignores_empty_transcripts(self):
+        engine = self.create("race",
+                             {"name": "cloud", "text": "cloud", "delay": 0.1},
+                             {"name": "local", "text": ""})
+        self.assertEqual(engine.recognize(b""), "cloud")
+        self.assertEqual(self.stat("recognizer_wins_total", "cloud"), 1)
+
+    def test_race_timeouts(self):
+        engine = self.create(
+            "race",
+            {"name": "cloud", "text": "cloud", "delay": 0.3, "timeout": 0.05},
+            {"name": "local", "text": "", "delay": 0.1, "timeout": 0.2})
+        start_time = time.time()
+        self.assertEqual(engine.recognize(b""), "")
+        self.assertLess(time.time() - start_time, 0.25)
+        self.assertEqual(self.stat("recognizer_timeouts_total", "cloud"), 1)
+        self.assertEqual(self.stat("recognizer_timeouts_total", "local"), 0)
@@ -0,0 +1,75 @@
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from opsdroidaudio import recognizers
+from opsdroidaudio.__main__ import OpsdroidAudio
+
+
+CONFIG = {
+    "hotword": "opsdroid",
+    "sensitivity": 0.5,
+    "recognition": {"executor": "process"},
+    "speech": {"recognizer": {"name": "sphinx"}},
+    "rooms": {
+        "kitchen": {"hotword": "alexa", "barge_in": False},
+        "lounge": None,
+    },
+}
+
+
+class TestRooms(unittest.TestCase):
+    """Test the opsdroidaudio rooms sharing one app."""
+
+    def setUp(self):
+        with mock.patch.object(OpsdroidAudio, "load_config_file",
+                               return_value=CONFIG):
+            self.app = OpsdroidAudio()
+        self.kitchen, self.lounge = self.app.rooms
+
+    def test_load_rooms_merges_overrides(self):
+        self.assertEqual(self.kitchen.name, "kitchen")
+        self.assertTrue(self.kitchen.model.endswith("alexa.pmdl"))
+        self.assertFalse(self.kitchen.barge_in)
+        self.assertEqual(self.kitchen.config["sensitivity"], 0.5)
+        self.assertNotIn("rooms", self.kitchen.config)
+
+        self.assertEqual(self.lounge.name, "lounge")
+        self.assertTrue(self.lounge.model.endswith("opsdroid.pmdl"))
+        self.assertTrue(self.lounge.barge_in)
+        self.assertEqual(self.lounge.config["sensitivity"], 0.5)
+
+    def test_receive_text_reaches_only_that_room(self):
+        self.kitchen.channel.on_message("The timer is set")
+        self.assertEqual(self.kitchen.speak_queue.get_nowait(),
+                         "The timer is set")
+        self.assertTrue(self.lounge.speak_queue.empty())
+
+    def test_rooms_share_connection_and_recognition(self):
+        self.assertEqual(self.app.connection.channels,
+                         [self.kitchen.channel, self.lounge.channel])
+        self.app.recognition_pool = mock.Mock()
+        for room in self.app.rooms:
+            room.output = mock.Mock()
+            room.detector = mock.Mock()
+            room.detector.detector.SampleRate.return_value = 16000
+            recording = mock.Mock()
+            recording.buffer.return_value = b"\x00\x01"
+            room.recording_callback(recording, room.detector)
+            recording.close.assert_called_once_with()
+        self.assertEqual(self.app.recognition_pool.submit.call_count, 2)
+        for submitted, room in zip(
+                self.app.recognition_pool.submit.call_args_list,
+                self.app.rooms):
+            self.assertEqual(submitted[1]["deliver"], room.send_text)
+
+    def test_finish_recognition_postprocesses(self):
+        function = mock.Mock(return_value="hello")
+        recognizer = recognizers.BatchRecognizer(function, {}, 16000)
+        recognizer.start()
+        recognizer.feed(b"\x00\x01\x02\x03")
+        self.assertEqual(self.app.finish_recognition(
+            recognizer, postprocess=lambda data: data[2:]), "hello")
+        function.assert_called_once_with({}, b"\x02\x03", 16000)
@@ -0,0 +1,129 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from opsdroidaudio import sources
+from helpers import RATE, make_wav
+
+
+def counting(frames, channels=1):
+    """Get 16 bit PCM of counting samples."""
+    return b"".join(
+        (i % 256).to_bytes(2, "little") for i in range(frames * channels))
+
+
+class TestSources(unittest.TestCase):
+    """Test the opsdroidaudio audio sources."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_pyaudio_source_initialises_under_lock(self):
+        def initialise():
+            self.assertTrue(sources.PORTAUDIO_LOCK.locked())
+            return mock.MagicMock()
+
+        pyaudio = mock.MagicMock()
+        pyaudio.PyAudio.side_effect = initialise
+        with mock.patch.dict(sys.modules, {"pyaudio": pyaudio}):
+            source = sources.PyAudioSource(RATE)
+        self.assertFalse(sources.PORTAUDIO_LOCK.locked())
+        source.close()
+        pyaudio.PyAudio.assert_called_once_with()
+
+    def read_all(self, source, frames=100):
+        chunks = []
+        data = source.read(frames)
+        while data:
+            chunks.append(data)
+            data = source.read(frames)
+        return chunks
+
+    def test_wav_source(self):
+        path = make_wav(os.path.join(self.tmpdir, "a.wav"), counting(250))
+        source = sources.WavFileSource(RATE, path=path)
+        chunks = self.read_all(source)
+        self.assertEqual([len(chunk) for chunk in chunks], [200, 200, 100])
+        self.assertEqual(source.seconds(b"".join(chunks)), 250.0 / RATE)
+        source.close()
+
+    def test_wav_source_loops(self):
+        path = make_wav(os.path.join(self.tmpdir, "a.wav"), counting(100))
+        source = sources.WavFileSource(RATE, path=path, loop=True)
+        self.assertEqual(source.read(100), source.read(100))
+        source.close()
+
+    def test_wav_source_wrong_format(self):
+        path = make_wav(os.path.join(self.tmpdir, "a.wav"), counting(100),
+                        rate=8000)
+        with self.assertRaises(ValueError):
+            sources.WavFileSource(RATE, path=path)
+
+    def test_pcm_source_reads_whole_frames(self):
+        path = os.path.join(self.tmpdir, "a.pcm")
+        with open(path, 'wb') as stream:
+            stream.write(b"\x00" * 301)
+        source = sources.PcmSource(RATE, path=path)
+        chunks = self.read_all(source)
+        self.assertEqual([len(chunk) for chunk in chunks], [200, 100])
+        source.close()
+
+    def test_start_delivers_chunks_then_finishes(self):
+        path = make_wav(os.path.join(self.tmpdir, "a.wav"), counting(1000))
+        source = sources.WavFileSource(RATE, path=path, realtime=False)
+        chunks = []
+        finished = threading.Event()
+        source.start(chunks.append, finished.set, chunk_frames=400)
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(len(b"".join(chunks)), 2000)
+        source.close()
+
+    def test_unix_socket_source(self):
+        path = os.path.join(self.tmpdir, "audio.sock")
+        source = sources.UnixSocketSource(RATE, path=path, timeout=0.05)
+
+        def send():
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            client.sendall(b"\x01" * 201)
+            client.close()
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        data = b""
+        while len(data) < 200:
+            data += source.read(100)
+        thread.join()
+        self.assertEqual(data, b"\x01" * 200)
+        source.stopping.set()
+        self.assertEqual(source.read(100), b"")
+        source.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_create_unknown_source(self):
+        with self.assertRaises(ValueError):
+            sources.create({"name": "telepathy"}, RATE)
+
+    def test_capture_is_converted(self):
+        path = make_wav(os.path.join(self.tmpdir, "a.wav"),
+                        counting(4800, 2), 48000, 2)
+        source = sources.create({"name": "wav", "path": path,
+                                 "realtime": False,
+                                 "capture": {"rate": 48000, "channels": 2}},
+                                RATE)
+        self.assertEqual((source.source.rate, source.source.channels),
+                         (48000, 2))
+        self.assertEqual(sum(len(chunk) for chunk in
+                             self.read_all(source, 160)), 1600 * 2)
+        source.close()
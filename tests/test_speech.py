@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from opsdroidaudio import speech
+
+
+class TestSpeechWorker(unittest.TestCase):
+    """Test the opsdroidaudio speech worker."""
+
+    def setUp(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def log(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def synthesize(self, text):
+        self.log(("synthesize", text))
+        time.sleep(0.02)
+        return None if text == "bad" else text.upper()
+
+    def play(self, audio):
+        self.log(("play start", audio))
+        time.sleep(0.05)
+        self.log(("play end", audio))
+
+    def run_worker(self, messages, chunks=None, **kwargs):
+        queue = Queue()
+        worker = speech.SpeechWorker(queue, self.synthesize, self.play,
+                                     **kwargs)
+        worker.start()
+        for message in messages:
+            queue.put(message)
+        while worker.stats["spoken"] + worker.stats["failed"] < \
+                (chunks or len(messages)):
+            time.sleep(0.01)
+        worker.stop()
+        worker.join(5)
+        return worker
+
+    def test_speaks_in_order(self):
+        cleaned = []
+        worker = self.run_worker(["one", "two", "three"],
+                                 cleanup=cleaned.append)
+        played = [audio for event, audio in self.events
+                  if event == "play start"]
+        self.assertEqual(played, ["ONE", "TWO", "THREE"])
+        self.assertEqual(cleaned, ["ONE", "TWO", "THREE"])
+        self.assertEqual(worker.stats["spoken"], 3)
+        self.assertGreater(worker.stats["playback_time"], 0.1)
+
+    def test_synthesizes_while_playing(self):
+        self.run_worker(["one", "two"])
+        self.assertLess(self.events.index(("synthesize", "two")),
+                        self.events.index(("play end", "ONE")))
+
+    def test_skips_failed_synthesis(self):
+        worker = self.run_worker(["bad", "good"])
+        self.assertEqual(worker.stats["failed"], 1)
+        self.assertEqual(worker.stats["spoken"], 1)
+
+    def test_stop_unblocks_idle_worker(self):
+        worker = speech.SpeechWorker(Queue(), self.synthesize, self.play)
+        worker.start()
+        worker.stop()
+        worker.join(1)
+        for thread in worker.threads:
+            self.assertFalse(thread.is_alive())
+
+    def test_chunks_are_played_as_they_are_synthesized(self):
+        worker = self.run_worker(["One. Two. Three."], chunks=3,
+                                 split=lambda text: text.split(" "))
+        played = [audio for event, audio in self.events
+                  if event == "play start"]
+        self.assertEqual(played, ["ONE.", "TWO.", "THREE."])
+        self.assertLess(self.events.index(("play start", "ONE.")),
+                        self.events.index(("synthesize", "Three.")))
+        self.assertEqual(worker.stats["responses"], 1)
+        self.assertLess(worker.stats["last_first_audio_time"], 0.05)
+
+    def test_interrupt_abandons_response(self):
+        queue = Queue()
+        worker = speech.SpeechWorker(queue, self.synthesize, self.play,
+                                     split=lambda text: text.split(" "))
+        worker.start()
+        queue.put("One. Two. Three. Four.")
+        while not self.events or self.events[-1] != ("play start", "ONE."):
+            time.sleep(0.005)
+        queue.put("Later.")
+        worker.interrupt()
+        time.sleep(0.2)
+        worker.stop()
+        worker.join(5)
+        played = [audio for event, audio in self.events
+                  if event == "play start"]
+        self.assertEqual(played, ["ONE."])
+        self.assertEqual(worker.stats["interrupted"], 1)
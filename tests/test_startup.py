@@ -0,0 +1,44 @@
+import subprocess
+import sys
+import time
+import unittest
+
+from opsdroidaudio import metrics, startup
+
+
+class TestStartupTimer(unittest.TestCase):
+    """Test the opsdroidaudio startup timer."""
+
+    def test_time(self):
+        timer = startup.StartupTimer()
+        self.assertEqual(timer.time("load", lambda value: value * 2, 21), 42)
+        self.assertIn("load", timer.stages)
+        with self.assertRaises(ValueError):
+            timer.time("fail", int, "not a number")
+        self.assertIn("fail", timer.stages)
+
+    def test_mark_and_report(self):
+        timer = startup.StartupTimer(time.time() - 2)
+        timer.record("config", 0.5)
+        timer.mark("listening")
+        self.assertGreaterEqual(timer.stages["listening"], 2)
+        self.assertTrue(timer.report().startswith(
+            "Startup times: config 0.50s, listening 2."))
+
+    def test_export(self):
+        registry = metrics.Metrics()
+        timer = startup.StartupTimer()
+        timer.record("import", 1.5)
+        timer.export(registry)
+        timer.record("connect", 0.25)
+        self.assertEqual(registry.snapshot(), {
+            'startup_seconds{stage="import"}': 1.5,
+            'startup_seconds{stage="connect"}': 0.25})
+
+    def test_plugins_are_imported_lazily(self):
+        modules = subprocess.check_output([
+            sys.executable, "-c",
+            "import sys, opsdroidaudio.recognizers, opsdroidaudio.generators;"
+            "print(' '.join(sys.modules))"]).decode().split()
+        for module in ["speech_recognition", "gtts", "playsound"]:
+            self.assertNotIn(module, modules)
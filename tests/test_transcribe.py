@@ -0,0 +1,98 @@
+import concurrent.futures
+import json
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from opsdroidaudio import transcribe
+from helpers import make_wav, silence
+
+
+class TestTranscribe(unittest.TestCase):
+    """Test the opsdroidaudio batch transcription command."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, "results.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_transcribe(self, items, **kwargs):
+        engine = mock.Mock()
+        engine.recognize.return_value = "turn the lights on"
+        transcribe.recognizers.WORKER_ENGINE = None
+        with mock.patch.object(transcribe.recognizers, "create_engine",
+                               return_value=engine):
+            summary = transcribe.transcribe(
+                items, self.output, {"name": "sphinx"}, workers=2,
+                executor_class=concurrent.futures.ThreadPoolExecutor,
+                **kwargs)
+        return summary, engine
+
+    def read_results(self):
+        with open(self.output) as results:
+            return [json.loads(line) for line in results]
+
+    def test_word_errors(self):
+        self.assertEqual(transcribe.word_errors("Turn the lights on.",
+                                                "turn the light on"), (1, 4))
+        self.assertEqual(transcribe.word_errors("lights on", ""), (2, 2))
+        self.assertEqual(transcribe.word_errors("on", "lights on"), (1, 1))
+
+    def test_find_files_in_directory(self):
+        make_wav(os.path.join(self.tmpdir, "b.wav"), silence(0.1))
+        make_wav(os.path.join(self.tmpdir, "a.wav"), silence(0.1))
+        with open(os.path.join(self.tmpdir, "a.txt"), "w") as text:
+            text.write("turn the lights on\n")
+        items = transcribe.find_files(self.tmpdir)
+        self.assertEqual([os.path.basename(item["path"]) for item in items],
+                         ["a.wav", "b.wav"])
+        self.assertEqual(items[0]["reference"], "turn the lights on")
+        self.assertIsNone(items[1]["reference"])
+
+    def test_find_files_in_manifest(self):
+        manifest = os.path.join(self.tmpdir, "manifest.jsonl")
+        with open(manifest, "w") as lines:
+            lines.write('a.wav\n\n{"path": "b.pcm", "text": "hello"}\n')
+        items = transcribe.find_files(manifest)
+        self.assertEqual(items, [
+            {"path": os.path.join(self.tmpdir, "a.wav"), "reference": None},
+            {"path": os.path.join(self.tmpdir, "b.pcm"),
+             "reference": "hello"}])
+
+    def test_transcribe(self):
+        items = [{"path": make_wav(os.path.join(self.tmpdir, "a.wav"),
+                                   silence(0.5)),
+                  "reference": "turn the light on"},
+                 {"path": make_wav(os.path.join(self.tmpdir, "b.wav"),
+                                   silence(0.5, 8000), rate=8000),
+                  "reference": None}]
+        summary, _ = self.run_transcribe(items)
+        self.assertEqual(summary["files"], 1)
+        self.assertEqual(summary["failed"], 1)
+        self.assertAlmostEqual(summary["audio_seconds"], 0.5)
+        self.assertEqual(summary["word_error_rate"], 0.25)
+        self.assertGreater(summary["throughput"], 0)
+        results = {os.path.basename(result["path"]): result
+                   for result in self.read_results()}
+        self.assertEqual(results["a.wav"]["text"], "turn the lights on")
+        self.assertIn("latency", results["a.wav"])
+        self.assertIn("8000Hz 1 channel", results["b.wav"]["error"])
+
+    def test_resume(self):
+        items = [{"path": make_wav(os.path.join(self.tmpdir, name),
+                                   silence(0.5)),
+                  "reference": None} for name in ("a.wav", "b.wav")]
+        self.run_transcribe(items[:1])
+        with open(self.output, "a") as results:
+            results.write('{"path": "cut sh')
+        summary, engine = self.run_transcribe(items, resume=True)
+        engine.recognize.assert_called_once()
+        self.assertEqual(summary["files"], 2)
+        self.assertEqual(len(self.read_results()), 2)